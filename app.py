@@ -1,46 +1,25 @@
 # -*- coding: utf-8 -*-
-import builtins
 import os
-import urllib.parse as urlparse
 
-import psycopg2
-from flask import Flask, render_template, redirect, request
-from flask_session import Session
+from flask import Flask, Response, abort, render_template, redirect, request
 
-from pep8speaks import handlers, utils
+from pep8speaks import appauth, deliveries, handlers, jobs, metrics, models, scheduler, utils
 
 
 def create_app():
-    # For running locally without connecting to the database
-    if os.environ.get("OVER_HEROKU", False) is not False:
-        urlparse.uses_netloc.append("postgres")
-        url = urlparse.urlparse(os.environ["DATABASE_URL"])
-
-        conn = psycopg2.connect(
-            database=url.path[1:],
-            user=url.username,
-            password=url.password,
-            host=url.hostname,
-            port=url.port
-        )
-
-        cursor = conn.cursor()
-
-        # Make the objects available across all the modules
-        builtins.conn = conn
-        builtins.cursor = cursor
-
+    # The database, if any, is connected to on first use in pep8speaks.database
     app = Flask(__name__)
-    sess = Session()
 
     @app.route("/", methods=['GET', 'POST'])
     def main():
         if request.method == "GET":
             return redirect("https://pep8speaks.com")
         elif request.method == "POST":
+            # The body is read once, for the signature and the handlers
+            webhook = models.WebhookRequest.from_flask(request)
             # GitHub sends the secret key in the payload header
-            if utils.match_webhook_secret(request):
-                event = request.headers["X-GitHub-Event"]
+            if utils.match_webhook_secret(webhook):
+                event = webhook.headers["X-GitHub-Event"]
                 event_to_action = {
                     "pull_request": handlers.handle_pull_request,
                     "integration_installation": handlers.handle_integration_installation,
@@ -51,16 +30,104 @@ def create_app():
                     "installation": handlers.handle_installation,
                 }
                 try:
-                    return event_to_action[event](request)
+                    action = event_to_action[event]
                 except KeyError:
-                    handlers.handle_unsupported_requests(request)
+                    return handlers.handle_unsupported_requests(webhook)
+
+                delivery_id = webhook.headers.get("X-GitHub-Delivery")
+
+                def run():
+                    """
+                    Return the response to the webhook, and the future of
+                    the work queued in a lane if any
+                    """
+                    # With a job queue, the workers handle the slow events
+                    queue = jobs.get_queue()
+                    if queue is not None and event in jobs.EVENTS:
+                        return jobs.accept(queue, event, webhook, delivery_id), None
+
+                    payload = webhook.get_json(silent=True)
+                    installation_id = appauth.installation_of(payload)
+
+                    def handle():
+                        with metrics.timer(metrics.EVENT_DURATION, event=event), \
+                                appauth.installation(installation_id):
+                            return action(webhook)
+
+                    lane = scheduler.EVENT_LANES.get(event)
+                    # Comments which are not commands are answered without a slot
+                    if lane is None or (event == "issue_comment" and
+                                        handlers.comment_command(webhook) is None):
+                        return handle(), None
+                    # The threads of the lane do the work, this one is free again
+                    tenant, repo = scheduler.tenant_of(payload)
+                    future = lane.submit(handle, tenant=tenant, repo=repo)
+                    return utils.Response({
+                        "message": "Queued in the {} lane".format(lane.name)
+                    }, status=202), future
+
+                # GitHub redelivers webhooks which timed out, answer those
+                # with the outcome of the first delivery
+                if delivery_id is None:
+                    try:
+                        return run()[0]
+                    except scheduler.LaneFull as exc:
+                        return utils.Response({"message": str(exc)}, status=503)
+
+                def finish(future):
+                    """Store the outcome of the work of a lane, or forget the delivery if it failed"""
+                    try:
+                        response = future.result()
+                    except Exception:
+                        deliveries.store.forget(delivery_id)
+                        return
+                    deliveries.store.complete(delivery_id, response.status_code,
+                                              response.get_data(as_text=True),
+                                              response.mimetype)
+
+                delivery = deliveries.store.begin(delivery_id)
+                if delivery is None:
+                    try:
+                        response, future = run()
+                    except scheduler.LaneFull as exc:
+                        deliveries.store.forget(delivery_id)
+                        return utils.Response({"message": str(exc)}, status=503)
+                    except Exception:
+                        deliveries.store.forget(delivery_id)
+                        raise
+                    if future is not None:
+                        # In progress until the lane is done with it
+                        future.add_done_callback(finish)
+                    else:
+                        deliveries.store.complete(delivery_id, response.status_code,
+                                                  response.get_data(as_text=True),
+                                                  response.mimetype)
+                    return response
+                elif delivery.state == deliveries.IN_PROGRESS:
+                    return utils.Response({
+                        "message": "Delivery {} is being processed".format(delivery_id)
+                    }, status=202)
+                return Response(delivery.body, status=delivery.status,
+                                mimetype=delivery.mimetype)
         else:
             return render_template('index.html')
 
+    @app.route("/metrics", methods=['GET'])
+    def prometheus_metrics():
+        if not metrics.ENABLED:
+            abort(404)
+        return Response(metrics.render(),
+                        mimetype='text/plain; version=0.0.4; charset=utf-8')
+
     app.secret_key = os.environ.setdefault("APP_SECRET_KEY", "")
-    app.config['SESSION_TYPE'] = 'filesystem'
 
-    sess.init_app(app)
+    # Webhooks never use the session, so it can be left out
+    if os.environ.get("DISABLE_SESSIONS", False) is False:
+        from flask_session import Session
+
+        app.config['SESSION_TYPE'] = 'filesystem'
+        Session().init_app(app)
+
     app.debug = False
     return app
 
@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+"""
+A local stand-in for the GitHub API and raw.githubusercontent.com
+
+It serves just enough of both for the webhook pipeline to run end to end,
+and can inject latency, errors and rate-limit headers into every response.
+"""
+import collections
+import http.server
+import json
+import os
+import random
+import re
+import socketserver
+import string
+import threading
+import time
+import urllib.parse as urlparse
+
+BOT_USER = {"id": 24736507, "login": "pep8speaks"}
+
+PAYLOADS_DIR = os.path.join(os.path.dirname(__file__), 'payloads')
+
+# Route templates, used to count the calls made per endpoint
+ROUTES = [
+    ("GET", r"^/repos/[^/]+/[^/]+/pulls/\d+$", "/repos/{repo}/pulls/{number}"),
+    ("GET", r"^/repos/[^/]+/[^/]+/pulls/\d+/commits$", "/repos/{repo}/pulls/{number}/commits"),
+    ("GET", r"^/repos/[^/]+/[^/]+/pulls/\d+/files$", "/repos/{repo}/pulls/{number}/files"),
+    ("GET", r"^/repos/[^/]+/[^/]+/issues/\d+/comments$", "/repos/{repo}/issues/{number}/comments"),
+    ("POST", r"^/repos/[^/]+/[^/]+/issues/\d+/comments$", "/repos/{repo}/issues/{number}/comments"),
+    ("PATCH", r"^/repos/[^/]+/[^/]+/issues/comments/\d+$", "/repos/{repo}/issues/comments/{id}"),
+    ("POST", r"^/gists$", "/gists"),
+    ("PUT", r"^/user/following/[^/]+$", "/user/following/{user}"),
+    ("GET", r"^/[^/]+/[^/]+/pull/\d+\.diff$", "/{repo}/pull/{number}.diff"),
+    ("GET", r"^/raw/.+$", "/raw/{repo}/{ref}/{path}"),
+    ("POST", r"^/app/installations/\d+/access_tokens$", "/app/installations/{id}/access_tokens"),
+    ("POST", r"^/graphql$", "/graphql"),
+]
+
+
+def synthetic_files(count=5, lines=40):
+    """
+    Return a dictionary of Python files which have a few PEP8 issues each
+    """
+    files = collections.OrderedDict()
+    for index in range(count):
+        body = ["import os, sys", ""]
+        for line in range(lines):
+            if line % 7 == 0:
+                body.append("def function_{}_{}( x ):".format(index, line))
+                body.append("    return x+1")
+            else:
+                body.append("value_{} = {}".format(line, line))
+        files["pkg/module_{}.py".format(index)] = "\n".join(body) + "\n"
+    return files
+
+
+def make_patch(content):
+    """Return the patch of a file added from scratch, as in /pulls/{number}/files"""
+    lines = content.splitlines()
+    return "\n".join(["@@ -0,0 +1,{} @@".format(len(lines))] + ["+" + line for line in lines])
+
+
+def make_diff(files):
+    """Return a unified diff adding all the files from scratch"""
+    diff = []
+    for path, content in files.items():
+        diff.append("diff --git a/{0} b/{0}".format(path))
+        diff.append("new file mode 100644")
+        diff.append("--- /dev/null")
+        diff.append("+++ b/{}".format(path))
+        diff.append(make_patch(content))
+    return "\n".join(diff) + "\n"
+
+
+def load_payload(name, **values):
+    """
+    Load a recorded payload from benchmarks/payloads and fill the
+    $api, $github, $raw, $repo and $number placeholders.
+    """
+    with open(os.path.join(PAYLOADS_DIR, name + '.json')) as payload_file:
+        template = string.Template(payload_file.read())
+    return json.loads(template.substitute(**values))
+
+
+class FakeGitHub(object):
+    """
+    A threaded HTTP server pretending to be api.github.com, github.com and
+    raw.githubusercontent.com at once. Raw files are served under /raw.
+
+    :param files: Dictionary of path to content of the files in every PR
+    :param config: Content of .pep8speaks.yml, or None to answer 404
+    :param latency: Seconds to sleep before answering each request
+    :param error_rate: Fraction of requests answered with a 502
+    :param rate_limit: Number of API calls allowed before answering 403
+    :param rate_limit_window: Seconds until the rate limit is reset
+    :param max_diff_files: Answer 406 instead of diffs with more files
+    :param graphql: Answer the pull request context query of
+        pep8speaks.context, otherwise 404
+    """
+    def __init__(self, files=None, config=None, latency=0.0, error_rate=0.0,
+                 rate_limit=5000, rate_limit_window=3600, seed=None,
+                 max_diff_files=None, graphql=True):
+        self.files = files if files is not None else synthetic_files()
+        self.diff = make_diff(self.files)
+        self.max_diff_files = max_diff_files
+        self.graphql = graphql
+        self.config = config
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit = rate_limit
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+        # Calls by the Authorization header they were made with
+        self.authorizations = collections.Counter()
+        self.next_token = 1
+        self.comments = collections.defaultdict(list)
+        self.next_comment_id = 1
+        self.remaining = rate_limit
+        self.rate_limit_window = rate_limit_window
+        self.reset_at = int(time.time()) + rate_limit_window
+
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return "http://{}:{}".format(host, port)
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def payload_values(self, repo="octocat/hello-world", number=1):
+        """Values to fill the placeholders of recorded payloads with"""
+        return {
+            "api": self.url,
+            "github": self.url,
+            "raw": self.url + "/raw",
+            "repo": repo,
+            "number": number,
+        }
+
+    def start(self):
+        handler = type("Handler", (_Handler,), {"github": self})
+        self._server = _ThreadedServer(("127.0.0.1", 0), handler)
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def pull_request(self, repo, number):
+        payload = load_payload("pull_request_synchronize",
+                               **self.payload_values(repo, number))
+        payload["pull_request"].update({
+            "changed_files": len(self.files),
+            "additions": sum(len(content.splitlines()) for content in self.files.values()),
+            "deletions": 0,
+        })
+        return payload["pull_request"]
+
+    def dispatch(self, method, path, headers, body, query=None):
+        """
+        Return the (status, headers, body) of the response to a request
+        """
+        route = None
+        for route_method, pattern, template in ROUTES:
+            if route_method == method and re.match(pattern, path):
+                route = template
+                break
+
+        with self.lock:
+            self.calls[(method, route or path)] += 1
+            self.authorizations[headers.get("Authorization", "").split(" ")[0]] += 1
+            if time.time() >= self.reset_at:
+                self.remaining = self.rate_limit
+                self.reset_at = int(time.time()) + self.rate_limit_window
+            exhausted = False
+            if not path.startswith("/raw/"):
+                exhausted = self.remaining == 0
+                self.remaining = max(self.remaining - 1, 0)
+            rate_headers = {
+                "X-RateLimit-Limit": str(self.rate_limit),
+                "X-RateLimit-Remaining": str(self.remaining),
+                "X-RateLimit-Reset": str(self.reset_at),
+            }
+            fail = self.error_rate and self.random.random() < self.error_rate
+
+        if self.latency:
+            time.sleep(self.latency)
+        if fail:
+            return 502, rate_headers, {"message": "Server Error"}
+        if exhausted:
+            return 403, rate_headers, {"message": "API rate limit exceeded"}
+        if route is None:
+            return 404, rate_headers, {"message": "Not Found"}
+
+        response = self._respond(method, path, headers, body, query or {})
+        status, data = response[:2]
+        if len(response) == 3:
+            rate_headers.update(response[2])
+        return status, rate_headers, data
+
+    def _diff(self):
+        if self.max_diff_files is not None and len(self.files) > self.max_diff_files:
+            return 406, {"message": "Sorry, the diff exceeded the maximum number of files"}
+        return 200, self.diff
+
+    def _list_files(self, path, query):
+        per_page = int(query.get("per_page", 30))
+        page = int(query.get("page", 1))
+        paths = list(self.files)
+        listed = [{"filename": filepath, "status": "added",
+                   "patch": make_patch(self.files[filepath])}
+                  for filepath in paths[(page - 1) * per_page:page * per_page]]
+        last = max(-(-len(paths) // per_page), 1)
+        link = '<{}{}?per_page={}&page={}>; rel="last"'.format(self.url, path, per_page, last)
+        return 200, listed, {"Link": link}
+
+    def _graphql(self, body):
+        """
+        Answer the query of pep8speaks.context from its variables. Of the
+        query itself, only the comments asked for are read.
+        """
+        if not self.graphql:
+            return 404, {"message": "Not Found"}
+        variables = body.get("variables", {})
+        path = "/repos/{owner}/{name}/issues/{number}/comments".format(**variables)
+        end, count = re.search(r"comments\((first|last): (\d+)\)", body["query"]).groups()
+        with self.lock:
+            comments = self.comments.get(path, [])
+            comments = comments[:int(count)] if end == "first" else comments[-int(count):]
+            comments = [{
+                "databaseId": comment["id"],
+                "body": comment["body"],
+                "author": {"__typename": "User", "login": comment["user"]["login"],
+                           "databaseId": comment["user"]["id"]},
+            } for comment in comments]
+        config = None if self.config is None else {"text": self.config}
+        data = {"repository": {
+            "pullRequest": {
+                "comments": {"nodes": comments},
+                "commits": {"nodes": [{"commit": {"message": "Update the module"}}]},
+            },
+            "config": config,
+        }}
+        return 200, {"data": data}, {"X-RateLimit-Resource": "graphql"}
+
+    def _respond(self, method, path, headers, body, query):
+        parts = path.strip("/").split("/")
+
+        if path == "/graphql":
+            return self._graphql(body)
+
+        if path.startswith("/raw/"):
+            filepath = "/".join(parts[4:]).lstrip("/")
+            if filepath == ".pep8speaks.yml":
+                if self.config is None:
+                    return 404, "404: Not Found"
+                return 200, self.config
+            if filepath in self.files:
+                return 200, self.files[filepath]
+            return 404, "404: Not Found"
+
+        if path.endswith(".diff"):
+            return self._diff()
+
+        if parts[0] == "repos" and parts[3] == "pulls":
+            repo, number = "/".join(parts[1:3]), int(parts[4])
+            if len(parts) == 6 and parts[5] == "files":
+                return self._list_files(path, query)
+            if len(parts) == 6:
+                return 200, [{"commit": {"message": "Update the module"}}]
+            if "diff" in headers.get("Accept", ""):
+                return self._diff()
+            return 200, self.pull_request(repo, number)
+
+        if parts[0] == "repos" and parts[3] == "issues":
+            with self.lock:
+                if method == "GET":
+                    return 200, list(self.comments[path])
+                if method == "POST":
+                    comment = {
+                        "id": self.next_comment_id,
+                        "user": BOT_USER,
+                        "body": body.get("body", ""),
+                    }
+                    self.next_comment_id += 1
+                    self.comments[path].append(comment)
+                    return 201, comment
+                # PATCH
+                comment_id = int(parts[-1])
+                for comments in self.comments.values():
+                    for comment in comments:
+                        if comment["id"] == comment_id:
+                            comment["body"] = body.get("body", "")
+                            return 200, comment
+                return 404, {"message": "Not Found"}
+
+        if parts[0] == "app":
+            scheme, _, jwt = headers.get("Authorization", "").partition(" ")
+            if scheme != "Bearer" or not jwt:
+                return 401, {"message": "A JSON web token is required"}
+            with self.lock:
+                token = "ghs_{}_{}".format(parts[2], self.next_token)
+                self.next_token += 1
+            expires_at = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(time.time() + 3600))
+            return 201, {"token": token, "expires_at": expires_at}
+
+        if parts[0] == "gists":
+            return 201, {"html_url": self.url + "/gist/1"}
+
+        if parts[0] == "user":
+            return 204, ""
+
+        return 404, {"message": "Not Found"}
+
+
+class _ThreadedServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    github = None  # Set by FakeGitHub.start
+    protocol_version = "HTTP/1.1"
+
+    def _handle(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw_body.decode()) if raw_body else {}
+        except ValueError:
+            body = {}
+
+        path, _, query = self.path.partition("?")
+        query = dict(urlparse.parse_qsl(query))
+        status, headers, data = self.github.dispatch(self.command, path,
+                                                     self.headers, body, query)
+        if isinstance(data, str):
+            content = data.encode("utf-8")
+            content_type = "text/plain; charset=utf-8"
+        else:
+            content = json.dumps(data).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _handle
+
+    def log_message(self, format, *args):
+        pass
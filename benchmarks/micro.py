@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmarks of the hot paths in pep8speaks.helpers and pep8speaks.utils
+
+Every benchmark runs over synthetic corpora of growing size (files, patterns
+or errors), with GitHub replaced by canned responses.
+
+    $ python -m benchmarks.micro --save micro.json
+    $ python -m benchmarks.micro --baseline micro.json
+
+A run fails when a timing is more than --max-regression slower than the
+baseline, or when the time grows faster than --max-exponent with the size
+(1 is linear, 2 is quadratic). Timings only compare on the same machine, so
+no baseline is kept in the repository: save one before a change and compare
+after it. CI runs without a baseline and only checks the growth.
+"""
+import argparse
+import collections
+import json
+import math
+import sys
+import timeit
+from unittest import mock
+
+from benchmarks.fake_github import make_diff
+
+DEFAULT_SIZES = [1, 10, 100, 1000, 10000]
+
+# Timings below this many seconds are too noisy to compare
+NOISE_FLOOR = 0.001
+
+BENCHMARKS = collections.OrderedDict()
+
+
+def benchmark(name):
+    """Register a function which takes a size and returns a callable to time"""
+    def decorator(func):
+        BENCHMARKS[name] = func
+        return func
+    return decorator
+
+
+class FakeResponse(object):
+    def __init__(self, text, status_code=200, encoding='utf-8'):
+        self.text = text
+        self.content = text.encode(encoding)
+        self.status_code = status_code
+        self.encoding = encoding
+
+
+class FakeGHRequest(object):
+    """Just the attributes of models.GHRequest used by the helpers"""
+    def __init__(self, files, errors_per_file):
+        self.author = "octocat"
+        self.action = "synchronize"
+        self.results = {}
+        self.extra_results = {}
+        self.skipped_files = {}
+        self.truncated = False
+        self.partial = False
+        self.links = {}
+        for index in range(files):
+            filename = "pkg/module_{}.py".format(index)
+            self.results[filename] = [
+                "{}:{}:1: E225 missing whitespace around operator".format(filename, line)
+                for line in range(1, errors_per_file + 1)
+            ]
+            self.extra_results[filename] = []
+            self.links[filename + "_link"] = "https://github.com/o/r/blob/sha/" + filename
+
+
+def _default_config():
+    from pep8speaks import helpers
+
+    with mock.patch('pep8speaks.utils.query_request',
+                    return_value=FakeResponse("", status_code=404)):
+        return helpers.get_config("o/r", "master")
+
+
+@benchmark("get_files_involved_in_pr")
+def bench_diff_parsing(size):
+    from pep8speaks import helpers
+
+    files = collections.OrderedDict(
+        ("pkg/module_{}.py".format(index), "x = 1\ny = 2\nz = 3\n")
+        for index in range(size))
+    response = FakeResponse(make_diff(files))
+
+    def run():
+        with mock.patch('pep8speaks.utils.query_request', return_value=response):
+            helpers.get_files_involved_in_pr("o/r", 1)
+    return run
+
+
+@benchmark("filename_match")
+def bench_filename_match(size):
+    from pep8speaks import utils
+
+    # `size` exclude patterns, a third each of globs, directories and names
+    patterns = []
+    for index in range(size):
+        kind = index % 3
+        if kind == 0:
+            patterns.append("vendor_{}/*.py".format(index))
+        elif kind == 1:
+            patterns.append("build_{}/".format(index))
+        else:
+            patterns.append("generated_{}".format(index))
+    filenames = ["/pkg/sub_{}/module_{}.py".format(index % 10, index)
+                 for index in range(100)]
+
+    def run():
+        for filename in filenames:
+            utils.filename_match(filename, patterns)
+    return run
+
+
+@benchmark("filter_pycodestyle_output")
+def bench_filter_output(size):
+    from pep8speaks import helpers
+
+    output = []
+    for line in range(1, size + 1):
+        output.append("file_to_check.py:{}:1: E225 missing whitespace "
+                      "around operator".format(line))
+        if line % 10 == 0:
+            output.append("{}       E225 missing whitespace".format(line))
+    added_lines = list(range(1, size + 1, 2))
+
+    def run():
+        helpers.filter_pycodestyle_output("pkg/module.py", output,
+                                          added_lines, True)
+    return run
+
+
+@benchmark("prepare_comment")
+def bench_prepare_comment(size):
+    from pep8speaks import helpers
+
+    config = _default_config()
+    files = max(size // 10, 1)
+    ghrequest = FakeGHRequest(files, max(size // files, 1))
+
+    def run():
+        helpers.prepare_comment(ghrequest, config)
+    return run
+
+
+@benchmark("get_config")
+def bench_get_config(size):
+    from pep8speaks import helpers
+
+    lines = ["pycodestyle:", "    max-line-length: 100", "    exclude:"]
+    lines.extend("        - vendor_{}/".format(index) for index in range(size))
+    lines.extend(["    ignore:", "        - E501", "scanner:", "    diff_only: True"])
+    response = FakeResponse("\n".join(lines) + "\n")
+
+    def run():
+        with mock.patch('pep8speaks.utils.query_request', return_value=response):
+            helpers.get_config("o/r", "master")
+    return run
+
+
+@benchmark("Response")
+def bench_response(size):
+    from pep8speaks import utils
+
+    files = max(size // 10, 1)
+    ghrequest = FakeGHRequest(files, max(size // files, 1))
+
+    def run():
+        utils.Response(ghrequest)
+    return run
+
+
+def measure(func, repeat=3, min_time=0.05):
+    """Return the best time of one call of func in seconds"""
+    timer = timeit.Timer(func)
+    number, elapsed = 1, timer.timeit(1)
+    if elapsed < min_time:
+        number = int(min_time / max(elapsed, 1e-7)) + 1
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run(names=None, sizes=None):
+    """Return {benchmark: {size: seconds}}"""
+    results = collections.OrderedDict()
+    for name, setup in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        results[name] = collections.OrderedDict()
+        for size in sizes or DEFAULT_SIZES:
+            results[name][str(size)] = measure(setup(size))
+    return results
+
+
+def scaling_exponent(timings):
+    """
+    Estimate k in time ~ size**k from the two largest sizes above the noise floor
+    """
+    points = sorted((int(size), elapsed) for size, elapsed in timings.items()
+                    if elapsed >= NOISE_FLOOR)
+    if len(points) < 2:
+        return None
+    (size1, time1), (size2, time2) = points[-2:]
+    return math.log(time2 / time1) / math.log(size2 / size1)
+
+
+def check(results, baseline=None, max_regression=0.5, max_exponent=1.5):
+    """Return a list of problems found in results"""
+    problems = []
+    for name, timings in results.items():
+        exponent = scaling_exponent(timings)
+        if exponent is not None and exponent > max_exponent:
+            problems.append("{} scales as size**{:.2f}".format(name, exponent))
+
+        for size, elapsed in timings.items():
+            old = (baseline or {}).get(name, {}).get(size)
+            if old is None or max(old, elapsed) < NOISE_FLOOR:
+                continue
+            if elapsed > old * (1 + max_regression):
+                problems.append("{} with size {} is {:.0%} slower ({:.6f}s -> {:.6f}s)".format(
+                    name, size, elapsed / old - 1, old, elapsed))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--benchmark", action="append", dest="names",
+                        choices=list(BENCHMARKS), help="Run only this benchmark (repeatable)")
+    parser.add_argument("--sizes", type=lambda s: [int(size) for size in s.split(",")],
+                        default=DEFAULT_SIZES, help="Comma separated corpus sizes")
+    parser.add_argument("--save", help="Save the results as a JSON baseline")
+    parser.add_argument("--baseline", help="Compare against a JSON baseline")
+    parser.add_argument("--max-regression", type=float, default=0.5,
+                        help="Allowed slowdown against the baseline (0.5 is 50%%)")
+    parser.add_argument("--max-exponent", type=float, default=1.5,
+                        help="Allowed growth of the time with the size")
+    args = parser.parse_args(argv)
+
+    results = run(args.names, args.sizes)
+    for name, timings in results.items():
+        print("{:<28}".format(name) + "  ".join(
+            "{:>6}: {:.6f}s".format(size, elapsed) for size, elapsed in timings.items()))
+
+    if args.save:
+        with open(args.save, 'w') as baseline_file:
+            json.dump(results, baseline_file, indent=4)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    problems = check(results, baseline, args.max_regression, args.max_exponent)
+    for problem in problems:
+        print("REGRESSION: " + problem, file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Check that lint engines give the same comments as the command line tools,
+and measure how much faster they are.
+
+Every Python file of a corpus directory is checked with the default config,
+and with every .yml file of the corpus used as the .pep8speaks.yml. For each
+config, run_pycodestyle runs against the fake GitHub once per engine. The
+results, extra_results and prepare_comment output must then be the same as
+with the reference engine. Every file is also fixed by every engine, and the
+fixed files must be the same. The lint and the fix of each file are timed on
+their own, to report the speedup of each engine over the reference.
+
+    $ python -m benchmarks.parity path/to/corpus
+    $ python -m benchmarks.parity path/to/corpus --backend inprocess --output parity.json
+
+A run fails when any engine differs from the reference. To compare engines
+on live events, see LINT_SHADOW_BACKEND in pep8speaks.backends.
+"""
+import argparse
+import collections
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_github import FakeGitHub
+from benchmarks.replay import point_at
+
+DEFAULT_CONFIG = "default"
+
+
+class FakeGHRequest(object):
+    """Just the attributes of models.GHRequest used by run_pycodestyle and prepare_comment"""
+    def __init__(self, pull_request):
+        self.pull_request = pull_request
+        self.repository = pull_request["base"]["repo"]["full_name"]
+        self.pr_number = pull_request["number"]
+        self.after_commit_hash = pull_request["head"]["sha"]
+        self.author = pull_request["user"]["login"]
+        self.action = "synchronize"
+        self.results = {}
+        self.extra_results = {}
+        self.skipped_files = {}
+        self.links = {}
+        self.truncated = False
+        self.partial = False
+
+
+def load_corpus(directory):
+    """
+    Return the Python files of a directory by path relative to it, and the
+    configs by name, starting with the default one
+    """
+    files = collections.OrderedDict()
+    configs = collections.OrderedDict([(DEFAULT_CONFIG, None)])
+    for root, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            path = os.path.join(root, filename)
+            relative = os.path.relpath(path, directory).replace(os.sep, "/")
+            if filename.endswith(".py"):
+                with open(path, encoding="utf-8", errors="surrogateescape") as py_file:
+                    files[relative] = py_file.read()
+            elif filename.endswith(".yml"):
+                with open(path) as config_file:
+                    configs[relative] = config_file.read()
+    return files, configs
+
+
+def best_time(func, repeat):
+    """Return the fastest of repeat runs of func, and its last result"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def _check(github, config, lint):
+    from pep8speaks import helpers
+
+    ghrequest = FakeGHRequest(github.pull_request("octocat/hello-world", 1))
+    helpers.run_pycodestyle(ghrequest, config, lint=lint)
+    return {
+        "results": ghrequest.results,
+        "extra_results": ghrequest.extra_results,
+        "comment": list(helpers.prepare_comment(ghrequest, config)),
+    }
+
+
+def _time_files(files, config, engines, kind, repeat, timings, outputs):
+    """Run the engines on every file on its own, adding up the time by file"""
+    name = "file_to_check.py" if kind == "lint" else "file_to_fix.py"
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        path = os.path.join(scratch_dir, name)
+        for filename, content in files.items():
+            with open(path, "w", encoding="utf-8", errors="surrogateescape") as py_file:
+                py_file.write(content)
+            for backend, engine in engines.items():
+                elapsed, output = best_time(lambda: engine(path, config, "utf-8"), repeat)
+                timings[filename][kind][backend] += elapsed
+                outputs[filename][backend] = output
+
+
+def _speedup(reference, candidate):
+    return round(reference / candidate, 2) if candidate else None
+
+
+def parity(files, configs, backends=("inprocess",), reference="subprocess", repeat=1):
+    """
+    Return a report of the differences of backends with the reference
+    engine, and of their speed
+    """
+    from pep8speaks import backends as engines
+    from pep8speaks import helpers
+
+    names = [reference] + [name for name in backends if name != reference]
+    mismatches = []
+    timings = collections.OrderedDict(
+        (filename, {"lint": collections.Counter(), "fix": collections.Counter()})
+        for filename in files)
+
+    for config_name, config_text in configs.items():
+        config = helpers.parse_config(config_text)
+
+        # What the comment would be with each engine
+        with FakeGitHub(files=files, config=config_text) as github:
+            restore = point_at(github)
+            try:
+                checks = {name: _check(github, config, engines.LINTERS[name]) for name in names}
+            finally:
+                restore()
+        for name in names[1:]:
+            for field, expected in checks[reference].items():
+                if checks[name][field] != expected:
+                    mismatches.append({
+                        "config": config_name, "file": None, "backend": name,
+                        "field": field, "reference": expected, "candidate": checks[name][field],
+                    })
+
+        lint_outputs = collections.defaultdict(dict)
+        fix_outputs = collections.defaultdict(dict)
+        _time_files(files, config, {name: engines.LINTERS[name] for name in names},
+                    "lint", repeat, timings, lint_outputs)
+        _time_files(files, config, {name: engines.FIXERS[name] for name in names},
+                    "fix", repeat, timings, fix_outputs)
+        for field, outputs in (("lint", lint_outputs), ("fix", fix_outputs)):
+            for filename, by_backend in outputs.items():
+                for name in names[1:]:
+                    if by_backend[name] != by_backend[reference]:
+                        mismatches.append({
+                            "config": config_name, "file": filename, "backend": name,
+                            "field": field, "reference": by_backend[reference],
+                            "candidate": by_backend[name],
+                        })
+
+    report_files = collections.OrderedDict()
+    speedups = {}
+    for name in names[1:]:
+        speedups[name] = {}
+        for kind in ("lint", "fix"):
+            total = {backend: sum(timing[kind][backend] for timing in timings.values())
+                     for backend in (reference, name)}
+            by_file = [_speedup(timing[kind][reference], timing[kind][name])
+                       for timing in timings.values() if timing[kind][name]]
+            speedups[name][kind] = {
+                "total": _speedup(total[reference], total[name]),
+                "median": round(statistics.median(by_file), 2) if by_file else None,
+            }
+    for filename, timing in timings.items():
+        report_files[filename] = {
+            kind: {name: round(timing[kind][name], 6) for name in names}
+            for kind in ("lint", "fix")}
+        report_files[filename]["speedup"] = {
+            name: {kind: _speedup(timing[kind][reference], timing[kind][name])
+                   for kind in ("lint", "fix")}
+            for name in names[1:]}
+
+    return {
+        "reference": reference,
+        "backends": names[1:],
+        "configs": list(configs),
+        "mismatches": mismatches,
+        "speedups": speedups,
+        "files": report_files,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("corpus", help="Directory of Python files and .yml configs")
+    parser.add_argument("--backend", action="append", dest="backends",
+                        help="Engine to compare with the reference (repeatable, "
+                             "default inprocess)")
+    parser.add_argument("--reference", default="subprocess")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Runs of each engine on each file, the fastest is kept")
+    parser.add_argument("--output", help="Save the report as JSON")
+    args = parser.parse_args(argv)
+
+    files, configs = load_corpus(args.corpus)
+    report = parity(files, configs, args.backends or ["inprocess"], args.reference,
+                    args.repeat)
+
+    for name, kinds in report["speedups"].items():
+        for kind, speedup in kinds.items():
+            print("{:<12} {:<5} {}x in total, {}x per file (median)".format(
+                name, kind, speedup["total"], speedup["median"]))
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=4)
+
+    for mismatch in report["mismatches"]:
+        print("MISMATCH: {} {} of {} with the {} config".format(
+            mismatch["backend"], mismatch["field"], mismatch["file"] or "the pull request",
+            mismatch["config"]), file=sys.stderr)
+    return 1 if report["mismatches"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+"""
+Replay recorded webhook payloads against app.create_app()
+
+The app talks to a local FakeGitHub server instead of GitHub, so the numbers
+only depend on our own code and on the latency injected into the server.
+
+    $ python -m benchmarks.replay --events 200 --concurrency 8 --latency 0.01
+
+Pass --output to save the report as JSON, and --baseline with a previously
+saved report to fail when events/sec drops by more than --max-regression.
+The latencies are those of the webhook responses, the duration also waits
+for the lanes to finish the work they queued.
+"""
+import argparse
+import collections
+import concurrent.futures
+import itertools
+import json
+import math
+import os
+import sys
+import time
+import uuid
+
+from benchmarks.fake_github import FakeGitHub, load_payload, synthetic_files
+
+DEFAULT_PAYLOADS = [
+    "pull_request_synchronize",
+    "pull_request_opened",
+    "issue_comment_suggest_diff",
+    "issue_comment_discussion",
+]
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = max(int(math.ceil(fraction * len(values))) - 1, 0)
+    return values[min(index, len(values) - 1)]
+
+
+def event_of(payload_name):
+    """Payloads are named after their event, e.g. issue_comment_discussion"""
+    for event in ("pull_request", "issue_comment"):
+        if payload_name.startswith(event):
+            return event
+    return payload_name
+
+
+def point_at(github):
+    """
+    Make pep8speaks talk to the fake server. Return a function which undoes it.
+    """
+    from pep8speaks import constants, utils
+
+    old_base_url, old_raw_url = utils.BASE_URL, constants.RAW_URL
+    utils.BASE_URL = github.url
+    constants.RAW_URL = github.url + "/raw"
+
+    def restore():
+        utils.BASE_URL = old_base_url
+        constants.RAW_URL = old_raw_url
+    return restore
+
+
+def replay(events=100, concurrency=4, payloads=None, prs=10, files=5,
+           latency=0.0, error_rate=0.0, rate_limit=5000, rate_limit_window=3600,
+           config=None, seed=0):
+    """
+    Replay `events` webhooks and return a report dictionary.
+
+    The payloads are sent round-robin, spread over `prs` pull requests.
+    """
+    # Webhooks never use the session, do not write a file for each one
+    os.environ.setdefault("DISABLE_SESSIONS", "1")
+    from app import create_app
+    from pep8speaks import scheduler
+
+    payloads = payloads or DEFAULT_PAYLOADS
+    github = FakeGitHub(files=synthetic_files(files), config=config,
+                        latency=latency, error_rate=error_rate,
+                        rate_limit=rate_limit,
+                        rate_limit_window=rate_limit_window, seed=seed)
+
+    with github:
+        restore = point_at(github)
+        try:
+            app = create_app()
+            work = []
+            names = itertools.cycle(payloads)
+            for index in range(events):
+                name = next(names)
+                values = github.payload_values(number=index % prs + 1)
+                work.append((event_of(name), load_payload(name, **values)))
+
+            def send(item):
+                event, payload = item
+                client = app.test_client()
+                headers = {
+                    "X-GitHub-Event": event,
+                    "X-GitHub-Delivery": str(uuid.uuid4()),
+                }
+                start = time.perf_counter()
+                try:
+                    response = client.post("/", json=payload, headers=headers)
+                    status = response.status_code
+                except Exception as exc:  # Count crashes instead of stopping
+                    status = type(exc).__name__
+                return time.perf_counter() - start, status
+
+            start = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(concurrency) as pool:
+                outcomes = list(pool.map(send, work))
+            for lane in set(scheduler.EVENT_LANES.values()):
+                lane.join()
+            duration = time.perf_counter() - start
+        finally:
+            restore()
+
+    latencies = [elapsed * 1000 for elapsed, _ in outcomes]
+    statuses = collections.Counter(str(status) for _, status in outcomes)
+    calls = collections.Counter()
+    for (method, route), count in github.calls.items():
+        calls["{} {}".format(method, route)] += count
+
+    return {
+        "events": events,
+        "concurrency": concurrency,
+        "duration_s": round(duration, 4),
+        "events_per_sec": round(events / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 0.50), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "p99": round(percentile(latencies, 0.99), 2),
+            "max": round(max(latencies), 2) if latencies else 0.0,
+        },
+        "github_calls": github.total_calls,
+        "github_calls_per_event": round(github.total_calls / events, 2) if events else 0.0,
+        "github_calls_by_route": dict(calls),
+        "status_codes": dict(statuses),
+    }
+
+
+def compare(report, baseline, max_regression):
+    """
+    Return a list of regressions of report against baseline
+    """
+    regressions = []
+    if baseline["events_per_sec"]:
+        drop = 1 - report["events_per_sec"] / baseline["events_per_sec"]
+        if drop > max_regression:
+            regressions.append("events/sec dropped by {:.0%} ({} -> {})".format(
+                drop, baseline["events_per_sec"], report["events_per_sec"]))
+    if report["github_calls_per_event"] > baseline["github_calls_per_event"]:
+        regressions.append("GitHub calls per event went up ({} -> {})".format(
+            baseline["github_calls_per_event"], report["github_calls_per_event"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--events", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--payload", action="append", dest="payloads",
+                        help="Name of a payload in benchmarks/payloads (repeatable)")
+    parser.add_argument("--prs", type=int, default=10,
+                        help="Number of distinct pull requests to spread events over")
+    parser.add_argument("--files", type=int, default=5,
+                        help="Number of Python files in every pull request")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds of latency added to every GitHub call")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of GitHub calls answered with a 502")
+    parser.add_argument("--rate-limit", type=int, default=5000,
+                        help="API calls allowed before GitHub answers 403")
+    parser.add_argument("--rate-limit-window", type=int, default=3600,
+                        help="Seconds until the rate limit is reset")
+    parser.add_argument("--config", help="Path to a .pep8speaks.yml to serve")
+    parser.add_argument("--output", help="Save the report as JSON")
+    parser.add_argument("--baseline", help="Compare against a saved report")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="Allowed drop of events/sec against the baseline")
+    args = parser.parse_args(argv)
+
+    config = None
+    if args.config:
+        with open(args.config) as config_file:
+            config = config_file.read()
+
+    report = replay(events=args.events, concurrency=args.concurrency,
+                    payloads=args.payloads, prs=args.prs, files=args.files,
+                    latency=args.latency, error_rate=args.error_rate,
+                    rate_limit=args.rate_limit,
+                    rate_limit_window=args.rate_limit_window, config=config)
+    print(json.dumps(report, indent=4, sort_keys=True))
+
+    if args.output:
+        with open(args.output, 'w') as output_file:
+            json.dump(report, output_file, indent=4, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report, json.load(baseline_file),
+                                  args.max_regression)
+        for regression in regressions:
+            print("REGRESSION: " + regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,10 @@
+import os
 import pytest
-from app import create_app
+
+# Webhooks never use the session, do not write a file for each one
+os.environ.setdefault("DISABLE_SESSIONS", "1")
+
+from app import create_app  # noqa: E402
 
 
 @pytest.fixture
@@ -7,3 +12,25 @@ def app():
     # app = Flask(__name__)
     app = create_app()
     return app
+
+
+@pytest.fixture
+def github(request):
+    """
+    A FakeGitHub which pep8speaks talks to. Tests give it the keyword
+    arguments of FakeGitHub by parametrizing it indirectly:
+
+        @pytest.mark.parametrize('github', [{"files": FILES}], indirect=True)
+    """
+    from benchmarks.fake_github import FakeGitHub
+    from benchmarks.replay import point_at
+    from pep8speaks import lintcache
+
+    with FakeGitHub(**getattr(request, "param", {})) as fake:
+        restore = point_at(fake)
+        lintcache.store.clear()
+        try:
+            yield fake
+        finally:
+            lintcache.store.clear()
+            restore()
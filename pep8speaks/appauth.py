@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""
+Authenticate as a GitHub App, with an access token per installation.
+
+With GITHUB_APP_ID and GITHUB_APP_PRIVATE_KEY set, the calls made while
+handling an event use an access token of the installation the event came
+from. Every installation has its own rate limit, so the API budget grows
+with the number of installations. The tokens are minted with a JWT signed
+by the private key of the App, which needs PyJWT with its crypto extra
+(pip install "PyJWT[crypto]"). They are kept in memory and refreshed a few
+minutes before they expire.
+
+Calls made outside of an event, or which act as the @pep8speaks user
+(following users, gists, forks), use constants.AUTH as before.
+"""
+import calendar
+import contextlib
+import logging
+import os
+import threading
+import time
+
+from pep8speaks import constants
+
+APP_ID = os.environ.get("GITHUB_APP_ID")
+PRIVATE_KEY = os.environ.get("GITHUB_APP_PRIVATE_KEY")
+# Login of the App on GitHub, its comments are made by <slug>[bot]
+APP_SLUG = os.environ.get("GITHUB_APP_SLUG", "pep8speaks")
+# Seconds before expiry from which a token is refreshed
+REFRESH_BEFORE = 300
+
+_local = threading.local()
+
+
+class AuthenticationError(Exception):
+    """Raised when an installation token could not be minted"""
+
+
+class TokenAuth(object):
+    """Auth for requests sending a token in the Authorization header"""
+    __slots__ = ('token', 'scheme')
+
+    def __init__(self, token, scheme="token"):
+        self.token = token
+        self.scheme = scheme
+
+    def __call__(self, request):
+        request.headers["Authorization"] = "{} {}".format(self.scheme, self.token)
+        return request
+
+
+def _encode_jwt(payload, private_key):
+    import jwt
+
+    return jwt.encode(payload, private_key, algorithm="RS256")
+
+
+class TokenManager(object):
+    """
+    Installation tokens cached until REFRESH_BEFORE seconds before they
+    expire. Only the thread refreshing the token of an installation waits
+    for it: the others keep using the current token while it is valid, and
+    the other installations are not held up.
+    """
+    def __init__(self, app_id, private_key, refresh_before=REFRESH_BEFORE,
+                 clock=time.time, encode=_encode_jwt):
+        self.app_id = app_id
+        self.private_key = private_key
+        self.refresh_before = refresh_before
+        self.clock = clock
+        self.encode = encode
+        self._tokens = {}  # installation id: (token, expires at)
+        self._refreshing = {}  # installation id: lock held while minting
+        self._lock = threading.Lock()
+
+    def token(self, installation_id):
+        """Return a valid access token of the installation"""
+        with self._lock:
+            token, expires_at = self._tokens.get(installation_id, (None, 0))
+            now = self.clock()
+            if now < expires_at - self.refresh_before:
+                return token
+            refresh_lock = self._refreshing.setdefault(installation_id, threading.Lock())
+            if now < expires_at and refresh_lock.locked():
+                return token  # Being refreshed by another thread
+
+        with refresh_lock:
+            with self._lock:
+                token, expires_at = self._tokens.get(installation_id, (None, 0))
+                if self.clock() < expires_at - self.refresh_before:
+                    return token  # Refreshed while waiting for the lock
+            token, expires_at = self._mint(installation_id)
+            with self._lock:
+                self._tokens[installation_id] = (token, expires_at)
+            return token
+
+    def _mint(self, installation_id):
+        from pep8speaks import utils
+
+        now = int(self.clock())
+        # Backdated a minute against clock drift, GitHub allows 10 minutes at most
+        jwt = self.encode({"iat": now - 60, "exp": now + 540, "iss": self.app_id},
+                          self.private_key)
+        query = "/app/installations/{}/access_tokens".format(installation_id)
+        r = utils.query_request(query, method='POST', auth=TokenAuth(jwt, "Bearer"),
+                                headers={"Accept": "application/vnd.github+json"})
+        if r.status_code != 201:
+            raise AuthenticationError("Could not get a token for installation {}: {}".format(
+                installation_id, r.status_code))
+        data = r.json()
+        expires_at = calendar.timegm(time.strptime(data["expires_at"], "%Y-%m-%dT%H:%M:%SZ"))
+        return data["token"], expires_at
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def enabled():
+    return bool(APP_ID and PRIVATE_KEY)
+
+
+def manager():
+    """Return the token manager of the App, or None without the App settings"""
+    global _manager
+    if not enabled():
+        return None
+    with _manager_lock:
+        if _manager is None:
+            _manager = TokenManager(APP_ID, PRIVATE_KEY.replace("\\n", "\n"))
+    return _manager
+
+
+@contextlib.contextmanager
+def installation(installation_id):
+    """Make the calls of a with block in this thread for an installation"""
+    previous = getattr(_local, "installation_id", None)
+    _local.installation_id = installation_id
+    try:
+        yield
+    finally:
+        _local.installation_id = previous
+
+
+def as_user():
+    """Make the calls of a with block as the @pep8speaks user"""
+    return installation(None)
+
+
+def installation_of(payload):
+    """Return the installation id of a webhook payload, if any"""
+    if not isinstance(payload, dict):
+        return None
+    return (payload.get("installation") or {}).get("id")
+
+
+def current_installation():
+    return getattr(_local, "installation_id", None)
+
+
+def credentials():
+    """
+    Return the auth of the calls made in this thread, and the installation
+    whose rate limit they count against, None for the one of constants.AUTH
+    """
+    installation_id = current_installation()
+    tokens = manager()
+    if installation_id is None or tokens is None:
+        return constants.AUTH, None
+    try:
+        return TokenAuth(tokens.token(installation_id)), installation_id
+    except Exception:
+        logging.exception("Falling back to the user credentials for installation %s",
+                          installation_id)
+        return constants.AUTH, None
+
+
+def is_bot(user):
+    """Return True if a GitHub user is @pep8speaks or the App"""
+    return user["id"] == 24736507 or user.get("login") == APP_SLUG + "[bot]"
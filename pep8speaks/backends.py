@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""
+Engines running pycodestyle and autopep8 on a downloaded file.
+
+"subprocess" runs their command line tools in a shell, as pep8speaks always
+did. "inprocess" calls them as libraries, which saves starting a shell and
+a Python interpreter for every file. benchmarks/parity.py checks that an
+engine gives the same comments and fixes as "subprocess", and how much
+faster it is.
+
+Set LINT_SHADOW_BACKEND to also run another engine on a LINT_SHADOW_SAMPLE
+fraction of the files checked in production. Its output is only compared
+with the one reported, pep8speaks_lint_shadow_total counts the files where
+they match or differ and the differences are logged. This module imports
+autopep8, and pep8speaks.helpers only imports it when LINT_SHADOW_BACKEND
+is set.
+
+"inprocess" relies on private parts of pycodestyle. With a pycodestyle
+which lacks them, it raises RuntimeError instead of linting.
+"""
+import logging
+import os
+import random
+import re
+import shlex
+
+import autopep8
+import pycodestyle
+
+from pep8speaks import constants, helpers, metrics
+
+SHADOW_SAMPLE = float(os.environ.get("LINT_SHADOW_SAMPLE", 0.01))
+
+
+def lint_subprocess(path, config, encoding=None, max_lines=None, timeout=None, keep=None):
+    return helpers.lint_file(path, config, encoding, max_lines, timeout, keep)
+
+
+def fix_subprocess(path, config, encoding=None):
+    return helpers.fix_file(path, helpers.autopep8_arguments(config), encoding)
+
+
+def _pycodestyle_checks():
+    """
+    Return the registry of checks of pycodestyle alone. autopep8 replaces
+    some of them with its own when imported, which report differently.
+    """
+    checks = {}
+    for kind, registered in pycodestyle._checks.items():
+        checks[kind] = {}
+        for check, attrs in registered.items():
+            if check.__module__ == pycodestyle.__name__:
+                checks[kind][check] = attrs
+                continue
+            # Put back the check of pycodestyle of the same name, if any
+            original = getattr(pycodestyle, check.__name__, None)
+            if original is not None:
+                codes = pycodestyle.ERRORCODE_REGEX.findall(original.__doc__ or '')
+                checks[kind][original] = (codes, pycodestyle._get_parameters(original))
+    return checks
+
+
+# None with a pycodestyle the in-process engine does not know
+_CHECKS = _pycodestyle_checks() if all(
+    hasattr(pycodestyle, name) for name in ("_checks", "_get_parameters", "ERRORCODE_REGEX")
+) else None
+
+
+class _StyleGuide(pycodestyle.StyleGuide):
+    def get_checks(self, argument_name):
+        checks = []
+        for check, attrs in _CHECKS[argument_name].items():
+            (codes, args) = attrs
+            if any(not (code and self.ignore_code(code)) for code in codes):
+                checks.append((check.__name__, check, args))
+        return sorted(checks)
+
+
+class _CollectReport(pycodestyle.StandardReport):
+    """Keep the lines StandardReport prints to stdout"""
+    def __init__(self, options):
+        super().__init__(options)
+        self.output = []
+
+    def _print(self, text):
+        self.output.extend(line.rstrip('\r') for line in text.split('\n'))
+
+    def get_file_results(self):
+        self._deferred_print.sort()
+        for line_number, offset, code, text, doc in self._deferred_print:
+            self._print(self._fmt % {
+                'path': self.filename,
+                'row': self.line_offset + line_number, 'col': offset + 1,
+                'code': code, 'text': text,
+            })
+            if self._show_source:
+                if line_number > len(self.lines):
+                    line = ''
+                else:
+                    line = self.lines[line_number - 1]
+                self._print(line.rstrip())
+                self._print(re.sub(r'\S', ' ', line[:offset]) + '^')
+            if self._show_pep8 and doc:
+                self._print('    ' + doc.strip())
+        return self.file_errors
+
+
+def lint_inprocess(path, config, encoding=None, max_lines=None, timeout=None, keep=None):
+    """
+    Same as helpers.lint_file, with pycodestyle called in this thread. The
+    timeout can not be enforced, the encoding comes from the file itself.
+    """
+    if _CHECKS is None:
+        raise RuntimeError("The inprocess lint engine does not support pycodestyle {}".format(
+            pycodestyle.__version__))
+    if max_lines is None:
+        max_lines = constants.MAX_RESULTS
+
+    # The arguments of the command line, read the same way
+    arguments = shlex.split(config["pycodestyle_cmd_config"]) + [path]
+    style = _StyleGuide(paths=arguments, reporter=_CollectReport)
+    report = style.options.report
+    if not style.excluded(path):
+        style.input_file(os.path.basename(path), lines=pycodestyle.readlines(path))
+    output = report.output
+    if keep is not None:
+        output = [line for line in output if keep(line)]
+    if style.options.statistics:
+        output.extend(report.get_statistics())
+    return output[:max_lines], len(output) <= max_lines
+
+
+def fix_inprocess(path, config, encoding=None):
+    """Same as helpers.fix_file without --diff, with autopep8 called in this thread"""
+    arguments = shlex.split(helpers.autopep8_arguments(config)) + [path]
+    options = autopep8.parse_args(arguments, apply_config=True)
+    return autopep8.fix_file(path, options)
+
+
+LINTERS = {
+    "subprocess": lint_subprocess,
+    "inprocess": lint_inprocess,
+}
+
+FIXERS = {
+    "subprocess": fix_subprocess,
+    "inprocess": fix_inprocess,
+}
+
+
+def shadow_lint(filename, path, config, encoding, max_lines, output, complete,
+                backend=None, sample=None, keep=None):
+    """
+    On a sample of the files, lint path again with the shadow engine and
+    compare with the output and completeness reported for filename
+    """
+    backend = constants.LINT_SHADOW_BACKEND if backend is None else backend
+    sample = SHADOW_SAMPLE if sample is None else sample
+    if not backend or random.random() >= sample:
+        return None
+
+    try:
+        with metrics.timer(metrics.LINT_SHADOW_DURATION, backend=backend):
+            shadow = LINTERS[backend](path, config, encoding, max_lines, keep=keep)
+    except Exception:
+        logging.exception("The %s lint engine failed on %s", backend, filename)
+        metrics.increment(metrics.LINT_SHADOW, backend=backend, result="error")
+        return False
+
+    same = shadow == (output, complete)
+    metrics.increment(metrics.LINT_SHADOW, backend=backend,
+                      result="match" if same else "mismatch")
+    if not same:
+        logging.warning("The %s lint engine differs on %s with%s:\n%r\ninstead of\n%r",
+                        backend, filename, config["pycodestyle_cmd_config"],
+                        shadow, (output, complete))
+    return same
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Run the pull request pipeline over many pull requests or local checkouts.
+
+    $ python -m pep8speaks.bulk --dry-run octocat/hello-world#12 octocat/spoon-knife#3
+    $ python -m pep8speaks.bulk --targets prs.txt --processes 8 > results.jsonl
+    $ python -m pep8speaks.bulk --local ~/src/project
+
+Pull requests are given as owner/repo#number, one per line in --targets.
+The work is spread over --processes worker processes and one JSON line is
+printed per pull request, or per file of a local checkout, as soon as it
+is done. Comments are posted or updated like the webhook would, unless
+--dry-run is given.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from pep8speaks import handlers, helpers, models, utils
+
+
+def parse_target(target):
+    """Split owner/repo#number into the repository and the PR number"""
+    repository, _, number = target.strip().partition("#")
+    if not number.isdigit() or repository.count("/") != 1:
+        raise ValueError("Expected owner/repo#number, got {!r}".format(target))
+    return repository, int(number)
+
+
+def check_pull_request(target, dry_run=True):
+    """Run the pipeline on one pull request and return a result dictionary"""
+    try:
+        repository, number = parse_target(target)
+        query = "/repos/{}/pulls/{}".format(repository, number)
+        pull_request = utils.query_request(query).json()
+        payload = {
+            "action": "synchronize",
+            "pull_request": pull_request,
+            "repository": pull_request["base"]["repo"],
+        }
+        ghrequest = models.GHRequest(
+            models.WebhookRequest({"X-GitHub-Event": "pull_request"}, json=payload),
+            "pull_request")
+        handlers.check_pull_request(ghrequest, dry_run=dry_run)
+    except Exception as exc:  # One broken PR must not stop the batch
+        return {"target": target, "error": "{}: {}".format(type(exc).__name__, exc)}
+
+    result = ghrequest.summary()
+    result.update({
+        "target": target,
+        "results": ghrequest.results,
+        "extra_results": ghrequest.extra_results,
+        "comment": ghrequest.pep8_comment,
+        "dry_run": dry_run,
+    })
+    return result
+
+
+def local_files(checkout):
+    """
+    Return the config of a local checkout and the Python files in it which
+    are not excluded by the config, relative to the checkout
+    """
+    config_path = os.path.join(checkout, ".pep8speaks.yml")
+    config_text = None
+    if os.path.exists(config_path):
+        with open(config_path) as config_file:
+            config_text = config_file.read()
+    config = helpers.parse_config(config_text)
+
+    excluded = utils.compile_patterns(config["pycodestyle"]["exclude"])
+    files = []
+    for root, dirs, filenames in os.walk(checkout):
+        dirs[:] = [d for d in dirs if not d.startswith(".")]
+        for filename in filenames:
+            path = os.path.relpath(os.path.join(root, filename), checkout)
+            path = path.replace(os.sep, "/")
+            if filename.endswith(".py") and not excluded(path):
+                files.append(path)
+    return config, sorted(files)
+
+
+def check_local_file(checkout, filename, config):
+    """Run pycodestyle on one file of a local checkout"""
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        path = os.path.join(scratch_dir, "file_to_check.py")
+        shutil.copyfile(os.path.join(checkout, filename), path)
+        output, complete = helpers.lint_file(path, config)
+    results, extra_results = helpers.filter_pycodestyle_output(filename, output, [], False)
+    return {
+        "target": checkout,
+        "file": filename,
+        "results": results,
+        "extra_results": extra_results,
+        "truncated": not complete,
+    }
+
+
+def _run(job):
+    kind, args = job
+    if kind == "pull_request":
+        return check_pull_request(*args)
+    return check_local_file(*args)
+
+
+def jobs(targets, checkouts, dry_run):
+    for target in targets:
+        yield "pull_request", (target, dry_run)
+    for checkout in checkouts:
+        config, files = local_files(checkout)
+        for filename in files:
+            yield "local", (checkout, filename, config)
+
+
+def run(targets=(), checkouts=(), dry_run=True, processes=None):
+    """
+    Yield the result of every pull request and local file as it is done
+    """
+    if processes == 1:
+        for job in jobs(targets, checkouts, dry_run):
+            yield _run(job)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        for result in pool.imap_unordered(_run, jobs(targets, checkouts, dry_run)):
+            yield result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split("\n\n", 1)[1])
+    parser.add_argument("prs", nargs="*", metavar="owner/repo#number")
+    parser.add_argument("--targets", type=argparse.FileType("r"),
+                        help="File with one owner/repo#number per line")
+    parser.add_argument("--local", action="append", default=[], metavar="DIR",
+                        help="Local checkout to lint instead of a pull request (repeatable)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Worker processes (default: number of CPUs)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Prepare the comments without posting them")
+    args = parser.parse_args(argv)
+
+    targets = list(args.prs)
+    if args.targets:
+        targets.extend(line.strip() for line in args.targets
+                       if line.strip() and not line.startswith("#"))
+    if not targets and not args.local:
+        parser.error("Give at least one pull request or --local checkout")
+
+    failed = False
+    for result in run(targets, args.local, args.dry_run, args.processes):
+        failed = failed or result.get("error") is not None
+        print(json.dumps(result, sort_keys=True), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
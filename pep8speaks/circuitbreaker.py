@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Fail fast on calls to a host which keeps failing.
+
+After FAILURES failures in a row (timeouts, connection errors or 5xx
+responses), the circuit of the host opens and calls to it raise
+CircuitOpen at once for RESET_AFTER seconds. A single trial call is then let
+through: the circuit closes if it succeeds and opens again if it fails.
+"""
+import os
+import threading
+import time
+
+from pep8speaks import metrics
+
+FAILURES = int(os.environ.get("CIRCUIT_FAILURES", 5))
+RESET_AFTER = float(os.environ.get("CIRCUIT_RESET_AFTER", 30))
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a host which is failing"""
+
+
+class _Circuit(object):
+    __slots__ = ('failures', 'opened_at', 'trial')
+
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+
+class CircuitBreaker(object):
+    def __init__(self, failures=FAILURES, reset_after=RESET_AFTER, clock=time.monotonic):
+        self.failures = failures
+        self.reset_after = reset_after
+        self.clock = clock
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def before(self, host):
+        """Raise CircuitOpen if a call to host should not be made"""
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is None or circuit.opened_at is None:
+                return
+            if not circuit.trial and self.clock() - circuit.opened_at >= self.reset_after:
+                circuit.trial = True
+                return
+        metrics.increment(metrics.CIRCUIT_REJECTED, host=host)
+        raise CircuitOpen("Calls to {} are failing, not trying for now".format(host))
+
+    def success(self, host):
+        with self._lock:
+            self._circuits.pop(host, None)
+
+    def failure(self, host):
+        with self._lock:
+            circuit = self._circuits.setdefault(host, _Circuit())
+            circuit.failures += 1
+            if circuit.trial or (circuit.opened_at is None and circuit.failures >= self.failures):
+                circuit.opened_at = self.clock()
+                circuit.trial = False
+                metrics.increment(metrics.CIRCUIT_OPENED, host=host)
+
+    def cancel(self, host):
+        """Forget a call let through which ended without telling if host works"""
+        with self._lock:
+            circuit = self._circuits.get(host)
+            if circuit is not None:
+                circuit.trial = False
+
+    def is_open(self, host):
+        with self._lock:
+            circuit = self._circuits.get(host)
+            return circuit is not None and circuit.opened_at is not None
+
+
+breaker = CircuitBreaker()
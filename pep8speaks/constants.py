@@ -3,4 +3,22 @@ import os
 # HEADERS is deprecated, use AUTH only
 HEADERS = {"Authorization": "token " + os.environ.setdefault("GITHUB_TOKEN", "")}
 AUTH = (os.environ.setdefault("BOT_USERNAME", ""), os.environ.setdefault("BOT_PASSWORD", ""))
-BASE_URL = 'https://api.github.com'
+BASE_URL = os.environ.get("GITHUB_API_URL", 'https://api.github.com')
+RAW_URL = os.environ.get("GITHUB_RAW_URL", 'https://raw.githubusercontent.com')
+
+# Files larger than this many bytes are not checked
+MAX_FILE_SIZE = int(os.environ.get("MAX_FILE_SIZE", 1024 * 1024))
+# Lines of pycodestyle results kept for a single event
+MAX_RESULTS = int(os.environ.get("MAX_RESULTS", 2000))
+
+# GitHub answers 406 instead of the diff of a pull request over these sizes
+DIFF_MAX_FILES = 300
+DIFF_MAX_LINES = 20000
+# Files listed per page of /pulls/{number}/files, and pages listed at most
+FILES_PER_PAGE = 100
+FILES_MAX_PAGES = 30
+# Pages of /pulls/{number}/files fetched at the same time
+FILES_PAGE_WORKERS = int(os.environ.get("FILES_PAGE_WORKERS", 4))
+
+# Lint engine also run on a sample of the files checked, see pep8speaks.backends
+LINT_SHADOW_BACKEND = os.environ.get("LINT_SHADOW_BACKEND")
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+Load what a pull_request event needs to know about the pull request in a
+single GraphQL query: the last 100 comments (for the latest @pep8speaks
+quiet/resume request, and the comment of the bot to update), the commit
+messages ([skip pep8]) and the .pep8speaks.yml of the base branch. When the
+comment of the bot is older than those, it is looked up over REST.
+
+The REST calls made otherwise are one for the config, two for the comments
+and one for the commits. When the query fails, load returns None and the
+helpers make those REST calls as before. Set DISABLE_GRAPHQL to always use
+REST. The files of the pull request are still listed over REST, GraphQL
+does not give their patches.
+"""
+import os
+
+from pep8speaks import utils
+
+ENABLED = not os.environ.get("DISABLE_GRAPHQL", False)
+
+QUERY = """
+query($owner: String!, $name: String!, $number: Int!, $config: String!) {
+  repository(owner: $owner, name: $name) {
+    pullRequest(number: $number) {
+      comments(last: 100) {
+        nodes {
+          databaseId
+          body
+          author { __typename login ... on User { databaseId } ... on Bot { databaseId } }
+        }
+      }
+      commits(last: 100) { nodes { commit { message } } }
+    }
+    config: object(expression: $config) { ... on Blob { text } }
+  }
+}
+"""
+
+
+class PRContext(object):
+    """
+    Comments are the last ones, oldest first, in the shape of the REST API,
+    {"id", "user": {"id", "login"}, "body"}. config_text is None when the repository has no
+    .pep8speaks.yml.
+    """
+    def __init__(self, comments, commit_messages, config_text):
+        self.comments = comments
+        self.commit_messages = commit_messages
+        self.config_text = config_text
+
+
+def _rest_user(author):
+    if author is None:  # Deleted users
+        return {"id": None, "login": "ghost"}
+    login = author["login"]
+    if author.get("__typename") == "Bot":
+        login += "[bot]"  # As the REST API names the Apps
+    return {"id": author.get("databaseId"), "login": login}
+
+
+def parse(data):
+    """Return the PRContext of the data of a response to QUERY, or None"""
+    repository = (data or {}).get("repository") or {}
+    pull_request = repository.get("pullRequest")
+    if pull_request is None:
+        return None
+
+    comments = [{
+        "id": node["databaseId"],
+        "user": _rest_user(node.get("author")),
+        "body": node["body"],
+    } for node in pull_request["comments"]["nodes"]]
+    commit_messages = [node["commit"]["message"] for node in pull_request["commits"]["nodes"]]
+    config_text = (repository.get("config") or {}).get("text")
+    return PRContext(comments, commit_messages, config_text)
+
+
+def graphql_url():
+    # GitHub Enterprise serves GraphQL at /api/graphql next to /api/v3
+    if utils.BASE_URL.endswith("/api/v3"):
+        return utils.BASE_URL[:-len("/v3")] + "/graphql"
+    return utils.BASE_URL + "/graphql"
+
+
+def load(ghrequest):
+    """Return the PRContext of the pull request of ghrequest, or None to use REST"""
+    if not ENABLED:
+        return None
+
+    owner, name = ghrequest.repository.split("/")
+    variables = {
+        "owner": owner,
+        "name": name,
+        "number": int(ghrequest.pr_number),
+        "config": "{}:.pep8speaks.yml".format(ghrequest.base_branch),
+    }
+    try:
+        r = utils.query_request(graphql_url(), method='POST',
+                                json={"query": QUERY, "variables": variables})
+        if r.status_code != 200:
+            return None
+        response = r.json()
+        if response.get("errors"):
+            return None
+        return parse(response.get("data"))
+    except utils.unavailable_errors():
+        return None
+    except (ValueError, KeyError, TypeError):  # Not the expected answer
+        return None
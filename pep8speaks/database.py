@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+Connection to the Postgres database of the app, opened on first use so that
+a sleeping dyno can answer its first webhook quickly.
+"""
+import os
+import threading
+import urllib.parse as urlparse
+
+_lock = threading.Lock()
+_conn = None
+_cursor = None
+
+
+def enabled():
+    """The database is only used when running over Heroku"""
+    return os.environ.get("OVER_HEROKU", False) is not False
+
+
+def connect():
+    """Open a new connection to the database"""
+    import psycopg2
+
+    urlparse.uses_netloc.append("postgres")
+    url = urlparse.urlparse(os.environ["DATABASE_URL"])
+
+    return psycopg2.connect(
+        database=url.path[1:],
+        user=url.username,
+        password=url.password,
+        host=url.hostname,
+        port=url.port
+    )
+
+
+def connection():
+    """Return the connection to the database shared across the modules, connecting if needed"""
+    global _conn, _cursor
+    with _lock:
+        if _conn is None or _conn.closed:
+            _conn = connect()
+            _cursor = None
+    return _conn
+
+
+def cursor():
+    """Return the cursor shared across the modules"""
+    global _cursor
+    conn = connection()
+    with _lock:
+        if _cursor is None or _cursor.closed:
+            _cursor = conn.cursor()
+    return _cursor
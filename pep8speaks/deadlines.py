@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+Time budget of the event being handled.
+
+Every event gets a deadline when its handling starts. The calls to GitHub
+are given a timeout which never goes past it, and checking the files of a
+pull request stops early enough to keep COMMENT_RESERVE seconds to post
+the comment with the results found so far.
+"""
+import contextlib
+import os
+import threading
+import time
+
+# Seconds an event may take, below the 30 seconds after which gunicorn
+# kills a worker by default
+EVENT_DEADLINE = float(os.environ.get("EVENT_DEADLINE", 25))
+# Longest timeout in seconds of a single call to GitHub
+CALL_TIMEOUT = float(os.environ.get("CALL_TIMEOUT", 10))
+# Seconds of the deadline kept to post the comment
+COMMENT_RESERVE = float(os.environ.get("COMMENT_RESERVE", 5))
+
+_local = threading.local()
+
+
+class DeadlineExceeded(Exception):
+    """Raised instead of starting work the deadline of the event leaves no time for"""
+
+
+class Deadline(object):
+    def __init__(self, seconds, clock=time.monotonic):
+        self.clock = clock
+        self.expires_at = clock() + seconds
+
+    def remaining(self):
+        return self.expires_at - self.clock()
+
+
+@contextlib.contextmanager
+def deadline(seconds=EVENT_DEADLINE, clock=time.monotonic):
+    """Set the deadline of the event handled in this thread for a with block"""
+    previous = getattr(_local, "deadline", None)
+    _local.deadline = Deadline(seconds, clock)
+    try:
+        yield _local.deadline
+    finally:
+        _local.deadline = previous
+
+
+def remaining():
+    """Seconds left before the deadline, or None without a deadline"""
+    current = getattr(_local, "deadline", None)
+    if current is None:
+        return None
+    return current.remaining()
+
+
+def timeout(reserve=0.0, cap=CALL_TIMEOUT):
+    """
+    Return the timeout of a call which has to end `reserve` seconds before
+    the deadline, at most `cap` seconds. Raise DeadlineExceeded if no time
+    is left for it.
+    """
+    left = remaining()
+    if left is None:
+        return cap
+    left -= reserve
+    if left <= 0:
+        raise DeadlineExceeded("The deadline of the event has passed")
+    return left if cap is None else min(left, cap)
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Remember the webhook deliveries already seen, keyed by X-GitHub-Delivery.
+
+GitHub redelivers a webhook when we take too long to answer it. A
+redelivery of an event which is still being processed, or which is already
+done, must not lint and comment on the pull request a second time. A
+delivery claimed in the database which is still in progress after the
+event deadline was lost with its dyno, and a redelivery claims it again.
+"""
+import collections
+import contextlib
+import os
+import threading
+
+from pep8speaks import database, deadlines, metrics
+
+IN_PROGRESS = "in progress"
+COMPLETED = "completed"
+
+# Number of deliveries remembered in memory
+CAPACITY = int(os.environ.get("DELIVERY_CACHE_SIZE", 10000))
+
+
+class Delivery(object):
+    """State of a delivery, with the response sent for it once completed"""
+    def __init__(self, state, status=None, body=None, mimetype=None):
+        self.state = state
+        self.status = status
+        self.body = body
+        self.mimetype = mimetype
+
+
+class DeliveryStore(object):
+    """
+    A bounded, least recently used store of deliveries in memory, optionally
+    backed by the Deliveries table of the database so that all the dynos
+    share it.
+    """
+    def __init__(self, capacity=CAPACITY, use_database=False):
+        self.capacity = capacity
+        self.use_database = use_database
+        self._deliveries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._table_created = False
+        self._conn = None
+
+    def begin(self, delivery_id):
+        """
+        Mark a delivery as in progress. Return None if it was not seen
+        before, otherwise the Delivery seen.
+        """
+        with self._lock:
+            delivery = self._deliveries.get(delivery_id)
+            if delivery is not None:
+                self._deliveries.move_to_end(delivery_id)
+            else:
+                delivery = self._claim_in_database(delivery_id)
+                self._remember(delivery_id, delivery or Delivery(IN_PROGRESS))
+
+        if delivery is not None:
+            metrics.increment(metrics.DUPLICATE_DELIVERIES, state=delivery.state)
+        return delivery
+
+    def complete(self, delivery_id, status, body, mimetype):
+        """Store the response sent for a delivery"""
+        delivery = Delivery(COMPLETED, status, body, mimetype)
+        with self._lock:
+            self._remember(delivery_id, delivery)
+            if self.use_database:
+                with self._transaction() as cursor:
+                    cursor.execute(
+                        "UPDATE Deliveries SET status = %s, body = %s, mimetype = %s "
+                        "WHERE delivery_id = %s;", (status, body, mimetype, delivery_id))
+
+    def forget(self, delivery_id):
+        """Forget a delivery which failed, so that a redelivery is processed"""
+        with self._lock:
+            self._deliveries.pop(delivery_id, None)
+            if self.use_database:
+                with self._transaction() as cursor:
+                    cursor.execute("DELETE FROM Deliveries WHERE delivery_id = %s;",
+                                   (delivery_id,))
+
+    def _remember(self, delivery_id, delivery):
+        self._deliveries[delivery_id] = delivery
+        self._deliveries.move_to_end(delivery_id)
+        while len(self._deliveries) > self.capacity:
+            self._deliveries.popitem(last=False)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """
+        Yield a cursor, commit after the block or roll back on errors. The
+        store has a connection of its own, which the rollbacks of the other
+        modules never touch. The queries run one at a time under the lock.
+        """
+        import psycopg2
+
+        if self._conn is None or self._conn.closed:
+            self._conn = database.connect()
+        conn = self._conn
+        try:
+            with conn.cursor() as cursor:
+                yield cursor
+        except psycopg2.Error:
+            # Otherwise every later query on the connection fails too
+            conn.rollback()
+            raise
+        conn.commit()
+
+    def _claim_in_database(self, delivery_id):
+        """
+        Insert the delivery as in progress, or claim it again if it has been
+        in progress for longer than the event deadline. Return None if it was
+        claimed, otherwise the Delivery already in the database.
+        """
+        if not self.use_database:
+            return None
+
+        if not self._table_created:
+            with self._transaction() as cursor:
+                cursor.execute(
+                    "CREATE TABLE IF NOT EXISTS Deliveries ("
+                    "delivery_id TEXT PRIMARY KEY, status INTEGER, body TEXT, "
+                    "mimetype TEXT, created_at TIMESTAMP NOT NULL DEFAULT now());")
+                cursor.execute(
+                    "ALTER TABLE Deliveries ADD COLUMN IF NOT EXISTS "
+                    "claimed_at TIMESTAMP NOT NULL DEFAULT now();")
+            self._table_created = True
+
+        with self._transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO Deliveries (delivery_id) VALUES (%s) "
+                "ON CONFLICT (delivery_id) DO UPDATE SET claimed_at = now() "
+                "WHERE Deliveries.status IS NULL "
+                "AND Deliveries.claimed_at < now() - %s * interval '1 second';",
+                (delivery_id, deadlines.EVENT_DEADLINE))
+            claimed = cursor.rowcount == 1
+            # Keep the table bounded to the deliveries GitHub may still redeliver
+            cursor.execute("DELETE FROM Deliveries WHERE created_at < now() - interval '1 day';")
+        if claimed:
+            return None
+
+        with self._transaction() as cursor:
+            cursor.execute("SELECT status, body, mimetype FROM Deliveries "
+                           "WHERE delivery_id = %s;", (delivery_id,))
+            row = cursor.fetchone()
+        if row is None or row[0] is None:
+            return Delivery(IN_PROGRESS)
+        return Delivery(COMPLETED, *row)
+
+
+store = DeliveryStore(
+    use_database=(database.enabled() and
+                  bool(os.environ.get("DELIVERIES_IN_DATABASE", False))))
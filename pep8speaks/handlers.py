@@ -1,23 +1,44 @@
 # -*- coding: utf-8 -*-
-from pep8speaks import helpers, utils, models
+from pep8speaks import appauth, context, deadlines, helpers, metrics, models, utils
 
 
 def handle_pull_request(request):
-    ghrequest = models.GHRequest(request, request.headers["X-GitHub-Event"])
+    with deadlines.deadline():
+        ghrequest = models.GHRequest(request, request.headers["X-GitHub-Event"])
+
+        if ghrequest.OK:
+            check_pull_request(ghrequest)
+
+    return utils.Response(ghrequest)
 
-    if not ghrequest.OK:
-        return utils.Response(ghrequest)
 
+def check_pull_request(ghrequest, dry_run=False):
+    """
+    Run pycodestyle on the pull request and make or update the comment.
+    With dry_run, the comment is only prepared in ghrequest.pep8_comment.
+    """
     # If the PR contains at least one Python file
-    pythonic_pr = helpers.check_pythonic_pr(ghrequest.repository, ghrequest.pr_number)
+    with metrics.stage("pull_request", "check_pythonic_pr"):
+        pythonic_pr = helpers.check_pythonic_pr(ghrequest.repository, ghrequest.pr_number,
+                                                ghrequest.pull_request)
 
     if not pythonic_pr:
-        return utils.Response(ghrequest)
+        return
 
-    helpers.update_users(ghrequest.repository)
+    if not dry_run:
+        with metrics.stage("pull_request", "update_users"):
+            helpers.update_users(ghrequest.repository)
+
+    # The config, comments and commits in one query, None to get them one by one
+    with metrics.stage("pull_request", "load_context"):
+        pr_context = context.load(ghrequest)
 
     # Get the config from .pep8speaks.yml file of the repository
-    config = helpers.get_config(ghrequest.repository, ghrequest.base_branch)
+    with metrics.stage("pull_request", "get_config"):
+        if pr_context is not None:
+            config = helpers.parse_config(pr_context.config_text)
+        else:
+            config = helpers.get_config(ghrequest.repository, ghrequest.base_branch)
 
     # Personalising the messages obtained from the config file
     # Replace {name} with name of the author
@@ -32,67 +53,81 @@ def handle_pull_request(request):
 
     # Updates ghrequest with the results
     # This function runs pycodestyle
-    helpers.run_pycodestyle(ghrequest, config)
+    with metrics.stage("pull_request", "run_pycodestyle"):
+        helpers.run_pycodestyle(ghrequest, config)
+    if ghrequest.partial:
+        metrics.increment(metrics.PARTIAL_RESULTS)
 
     # Construct the comment
-    header, body, footer, ERROR = helpers.prepare_comment(ghrequest, config)
+    with metrics.stage("pull_request", "prepare_comment"):
+        header, body, footer, ERROR = helpers.prepare_comment(ghrequest, config)
 
     # If there is nothing in the comment body, no need to make the comment
     # But in case of PR update, make sure to update the comment with no issues.
     ONLY_UPDATE_COMMENT_BUT_NOT_CREATE = False
     if len(body) == 0:
-        return utils.Response(ghrequest)
+        return
 
     # Simply do not comment no-error messages when a PR is opened
     if not ERROR:
         if ghrequest.action == "opened":
-            return utils.Response(ghrequest)
+            return
         elif ghrequest.action in ("reopened", "synchronize"):
             ONLY_UPDATE_COMMENT_BUT_NOT_CREATE = True
 
     # Concatenate comment parts
     comment = header + body + footer
+    ghrequest.pep8_comment = comment
+    if dry_run:
+        return
 
     # Do not make duplicate comment made on the PR by the bot
     # Check if asked to keep quiet
-    if not helpers.comment_permission_check(ghrequest):
-        return utils.Response(ghrequest)
+    with metrics.stage("pull_request", "comment_permission_check"):
+        permitted = helpers.comment_permission_check(ghrequest, pr_context)
+    if not permitted:
+        return
 
     # Do not run on PR's created by pep8speaks which use autopep8
     # Too much noisy
     if ghrequest.author == "pep8speaks":
-        return utils.Response(ghrequest)
+        return
 
     # NOW, Interact with the PR and make/update the comment
-    helpers.create_or_update_comment(ghrequest, comment, ONLY_UPDATE_COMMENT_BUT_NOT_CREATE)
+    with metrics.stage("pull_request", "create_or_update_comment"):
+        helpers.create_or_update_comment(ghrequest, comment, ONLY_UPDATE_COMMENT_BUT_NOT_CREATE,
+                                         pr_context and pr_context.comments)
 
-    return utils.Response(ghrequest)
+
+def comment_command(request):
+    """
+    Return the command of an issue_comment webhook, or None. Most comments
+    are discussions which do not mention the bot, this looks at the comment
+    alone before making any call to GitHub.
+    """
+    payload = request.json
+    if not isinstance(payload, dict):
+        return None
+    return helpers.parse_command((payload.get("comment") or {}).get("body"))
 
 
 def handle_issue_comment(request):
+    command = comment_command(request)
+    if command is None:
+        return utils.Response({"message": "Not a command for @pep8speaks"})
+
     ghrequest = models.GHRequest(request, request.headers["X-GitHub-Event"])
 
     if not ghrequest.OK:
         return utils.Response(ghrequest)
 
     # Get the .pep8speaks.yml config file from the repository
-    config = helpers.get_config(ghrequest.repository, ghrequest.base_branch)
-
-    splitted_comment = ghrequest.comment.lower().split()
-
-    # If diff is required
-    params1 = ["@pep8speaks", "suggest", "diff"]
-    condition1 = all(p in splitted_comment for p in params1)
-    # If asked to pep8ify
-    params2 = ["@pep8speaks", "pep8ify"]
-    condition2 = all(p in splitted_comment for p in params2)
+    with metrics.stage("issue_comment", "get_config"):
+        config = helpers.get_config(ghrequest.repository, ghrequest.base_branch)
 
-    if condition1:
+    if command == "suggest diff":
         return _create_diff(ghrequest, config)
-    elif condition2:
-        return _pep8ify(ghrequest, config)
-
-    return utils.Response(ghrequest)
+    return _pep8ify(ghrequest, config)
 
 
 def handle_installation(request):
@@ -107,21 +142,30 @@ def _pep8ify(ghrequest, config):
     ghrequest.target_repo_branch = ghrequest.pull_request["head"]["ref"]
     ghrequest.results = {}
 
-    # Check if the fork of the target repo exists
-    # If yes, then delete it
-    helpers.delete_if_forked(ghrequest)
-    # Fork the target repository
-    helpers.fork_for_pr(ghrequest)
-    # Update the fork description. This helps in fast deleting it
-    helpers.update_fork_desc(ghrequest)
-    # Create a new branch for the PR
-    helpers.create_new_branch(ghrequest)
-    # Fix the errors in the files
-    helpers.autopep8ify(ghrequest, config)
-    # Commit each change onto the branch
-    helpers.commit(ghrequest)
-    # Create a PR from the branch to the target repository
-    helpers.create_pr(ghrequest)
+    # The fork and the PR are made by the @pep8speaks user
+    with appauth.as_user():
+        # Check if the fork of the target repo exists
+        # If yes, then delete it
+        with metrics.stage("pep8ify", "delete_if_forked"):
+            helpers.delete_if_forked(ghrequest)
+        # Fork the target repository
+        with metrics.stage("pep8ify", "fork_for_pr"):
+            helpers.fork_for_pr(ghrequest)
+        # Update the fork description. This helps in fast deleting it
+        with metrics.stage("pep8ify", "update_fork_desc"):
+            helpers.update_fork_desc(ghrequest)
+        # Create a new branch for the PR
+        with metrics.stage("pep8ify", "create_new_branch"):
+            helpers.create_new_branch(ghrequest)
+        # Fix the errors in the files
+        with metrics.stage("pep8ify", "autopep8ify"):
+            helpers.autopep8ify(ghrequest, config)
+        # Commit each change onto the branch
+        with metrics.stage("pep8ify", "commit"):
+            helpers.commit(ghrequest)
+        # Create a PR from the branch to the target repository
+        with metrics.stage("pep8ify", "create_pr"):
+            helpers.create_pr(ghrequest)
 
     comment = "Here you go with [the Pull Request]({}) ! The fixes are " \
               "suggested by [autopep8](https://github.com/hhatto/autopep8).\n\n"
@@ -135,7 +179,8 @@ def _pep8ify(ghrequest, config):
 
     query = "/repos/{}/issues/{}/comments"
     query = query.format(ghrequest.repository, str(ghrequest.pr_number))
-    response = utils.query_request(query, method='POST', json={"body": comment})
+    with metrics.stage("pep8ify", "comment"):
+        response = utils.query_request(query, method='POST', json={"body": comment})
     ghrequest.comment_response = response.json()
 
     return utils.Response(ghrequest)
@@ -146,10 +191,13 @@ def _create_diff(ghrequest, config):
     ghrequest.diff = {}
 
     # Process the files and prepare the diff for the gist
-    helpers.autopep8(ghrequest, config)
+    with metrics.stage("suggest_diff", "autopep8"):
+        helpers.autopep8(ghrequest, config)
 
     # Create the gist
-    helpers.create_gist(ghrequest, config)
+    # Gists belong to the @pep8speaks user
+    with metrics.stage("suggest_diff", "create_gist"), appauth.as_user():
+        helpers.create_gist(ghrequest)
 
     comment = "Here you go with [the gist]({}) !\n\n" + \
               "> You can ask me to create a PR against this branch " + \
@@ -165,7 +213,8 @@ def _create_diff(ghrequest, config):
 
     query = "/repos/{}/issues/{}/comments"
     query = query.format(ghrequest.repository, str(ghrequest.pr_number))
-    response = utils.query_request(query, method='POST', json={"body": comment})
+    with metrics.stage("suggest_diff", "comment"):
+        response = utils.query_request(query, method='POST', json={"body": comment})
     ghrequest.comment_response = response.json()
 
     if ghrequest.error:
@@ -179,7 +228,8 @@ def handle_integration_installation(request):
     Follow the user from the account of @pep8speaks on GitHub
     """
     user = request.json["sender"]["login"]
-    helpers.follow_user(user)
+    with appauth.as_user():
+        helpers.follow_user(user)
     response_object = {
         "message": "Followed @{}".format(user)
     }
@@ -1,29 +1,33 @@
 # -*- coding: utf-8 -*-
 
 import base64
+import concurrent.futures
 import datetime
+import hashlib
 import json
 import os
 import re
+import signal
 import subprocess
+import tempfile
+import threading
 import time
 
-import psycopg2
-import unidiff
-import yaml
-from pep8speaks import utils
+from pep8speaks import appauth, constants, database, deadlines, lintcache, metrics, ratelimit, utils
 
 
 def update_users(repository):
     """Update users of the integration in the database"""
-    if os.environ.get("OVER_HEROKU", False) is not False:
+    if database.enabled():
+        import psycopg2
+
         # Check if repository exists in database
         query = r"INSERT INTO Users (repository, created_at) VALUES ('{}', now());" \
                 "".format(repository)
 
-        # cursor and conn are bultins, defined in app.py
+        conn = database.connection()
         try:
-            cursor.execute(query)
+            database.cursor().execute(query)
             conn.commit()
         except psycopg2.IntegrityError:  # If already exists
             conn.rollback()
@@ -35,7 +39,32 @@ def follow_user(user):
         "Content-Length": "0",
     }
     query = "/user/following/{}".format(user)
-    return utils.query_request(query=query, method='PUT', headers=headers)
+    try:
+        return utils.query_request(query=query, method='PUT', headers=headers,
+                                   priority=ratelimit.BACKGROUND)
+    except ratelimit.RateLimitExceeded:  # Not worth the API budget left
+        return None
+
+
+def parse_command(comment):
+    """
+    Return the command given to the bot in a comment, "suggest diff" or
+    "pep8ify", or None if the comment is not a command.
+    """
+    if not comment or "@pep8speaks" not in comment.lower():
+        return None
+
+    splitted_comment = comment.lower().split()
+
+    # If diff is required
+    params1 = ["@pep8speaks", "suggest", "diff"]
+    if all(p in splitted_comment for p in params1):
+        return "suggest diff"
+    # If asked to pep8ify
+    params2 = ["@pep8speaks", "pep8ify"]
+    if all(p in splitted_comment for p in params2):
+        return "pep8ify"
+    return None
 
 
 def get_config(repo, base_branch):
@@ -44,20 +73,31 @@ def get_config(repo, base_branch):
     the config dictionary
     """
 
+    # Configuration file
+    query = constants.RAW_URL + "/{}/{}/.pep8speaks.yml"
+    query = query.format(repo, base_branch)
+
+    r = utils.query_request(query)
+
+    return parse_config(r.text if r.status_code == 200 else None)
+
+
+def parse_config(config_text=None):
+    """
+    Return the config dictionary of the content of a .pep8speaks.yml file,
+    or the default config if there is no such file
+    """
+
     # Default configuration parameters
     default_config_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'default_config.json')
     with open(default_config_path) as config_file:
         config = json.loads(config_file.read())
 
-    # Configuration file
-    query = "https://raw.githubusercontent.com/{}/{}/.pep8speaks.yml"
-    query = query.format(repo, base_branch)
-
-    r = utils.query_request(query)
+    if config_text is not None:
+        import yaml
 
-    if r.status_code == 200:
         try:
-            new_config = yaml.load(r.text)
+            new_config = yaml.safe_load(config_text)
             # overloading the default configuration with the one specified
             config = utils.update_dict(config, new_config)
         except yaml.YAMLError:  # Bad YAML file
@@ -83,15 +123,57 @@ def get_config(repo, base_branch):
     return config
 
 
-def get_files_involved_in_pr(repo, pr_number):
+def get_files_involved_in_pr(repo, pr_number, pull_request=None):
+    """
+    Return a dictionary of the files modified/added in the PR, as /path,
+    paired with the list of added line numbers
+    """
+    return dict(iter_files_involved_in_pr(repo, pr_number, pull_request))
+
+
+def iter_files_involved_in_pr(repo, pr_number, pull_request=None):
     """
-    Return a list of file names modified/added in the PR
+    Yield the files modified/added in the PR, as /path, with their added
+    line numbers.
+
+    The diff of the PR is fetched in a single call, but GitHub refuses it
+    for large PRs. Those are listed page by page from /pulls/{number}/files
+    instead, the first page alone and the others concurrently once it is
+    consumed, so that a caller which stops early does not fetch them.
+    Without pull_request, the diff is tried first.
     """
+    if pull_request is None or _diff_allowed(pull_request):
+        files = _get_files_from_diff(repo, pr_number)
+        if files is not None:
+            for item in files.items():
+                yield item
+            return
+
+    changed_files = None if pull_request is None else pull_request.get("changed_files")
+    for page in _iter_files_pages(repo, pr_number, changed_files):
+        for pr_file in page:
+            if pr_file.get("status") == "removed":
+                continue
+            yield "/" + pr_file["filename"], _added_lines(pr_file.get("patch", ""))
+
+
+def _diff_allowed(pull_request):
+    changed_files = pull_request.get("changed_files", 0)
+    changed_lines = pull_request.get("additions", 0) + pull_request.get("deletions", 0)
+    return changed_files <= constants.DIFF_MAX_FILES and changed_lines <= constants.DIFF_MAX_LINES
+
+
+def _get_files_from_diff(repo, pr_number):
+    """Return the files of the diff of the PR, or None if GitHub refused it"""
+    import unidiff
+
     headers = {"Accept": "application/vnd.github.VERSION.diff"}
 
     query = "/repos/{}/pulls/{}"
     query = query.format(repo, pr_number)
     r = utils.query_request(query, headers=headers)
+    if r.status_code != 200:
+        return None
 
     patch = unidiff.PatchSet(r.content.splitlines(), encoding=r.encoding)
 
@@ -107,28 +189,96 @@ def get_files_involved_in_pr(repo, pr_number):
     return files
 
 
-def get_py_files_in_pr(repo, pr_number, exclude=None):
+def _iter_files_pages(repo, pr_number, changed_files=None):
+    """Yield the pages of /pulls/{number}/files in order"""
+    query = "/repos/{}/pulls/{}/files".format(repo, pr_number)
+
+    def get_page(page, timeout=None):
+        params = {"per_page": constants.FILES_PER_PAGE, "page": page}
+        kwargs = {} if timeout is None else {"timeout": timeout}
+        r = utils.query_request(query, params=params, **kwargs)
+        data = r.json() if r.status_code == 200 else []
+        return r, data if isinstance(data, list) else []
+
+    r, data = get_page(1)
+    yield data
+
+    if changed_files is not None:
+        last = -(-changed_files // constants.FILES_PER_PAGE)
+    else:
+        last_url = getattr(r, "links", {}).get("last", {}).get("url", "")
+        match = re.search(r"[?&]page=(\d+)", last_url)
+        last = int(match.group(1)) if match else 1
+    pages = list(range(2, min(last, constants.FILES_MAX_PAGES) + 1))
+    if not pages:
+        return
+
+    # The deadline and the installation of the event are kept in this
+    # thread, pass them on to the threads of the pool
+    timeout = deadlines.timeout()
+    installation_id = appauth.current_installation()
+
+    def get_other_page(page):
+        with appauth.installation(installation_id):
+            return get_page(page, timeout)[1]
+
+    workers = min(constants.FILES_PAGE_WORKERS, len(pages))
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        for data in pool.map(get_other_page, pages):
+            yield data
+
+
+_HUNK_HEADER = re.compile(r"^@@ -\d+(?:,\d+)? \+(\d+)(?:,\d+)? @@")
+
+
+def _added_lines(patch):
+    """Return the numbers of the lines added by the patch of a single file"""
+    added = []
+    line_no = None
+    for line in patch.split("\n"):
+        match = _HUNK_HEADER.match(line)
+        if match:
+            line_no = int(match.group(1))
+        elif line_no is None or line.startswith("\\"):
+            continue
+        elif line.startswith("+"):
+            added.append(line_no)
+            line_no += 1
+        elif not line.startswith("-"):
+            line_no += 1
+    return added
+
+
+def _iter_py_files(files, exclude):
+    excluded = utils.compile_patterns(exclude)
+    for diff_file, added_lines in files:
+        if diff_file[-3:] == ".py" and not excluded(diff_file):
+            yield diff_file, added_lines
+
+
+def get_py_files_in_pr(repo, pr_number, exclude=None, pull_request=None):
     if exclude is None:
         exclude = []
-    files = get_files_involved_in_pr(repo, pr_number)
-    for diff_file in list(files.keys()):
-        if diff_file[-3:] != ".py" or utils.filename_match(diff_file, exclude):
-            del files[diff_file]
-
-    return files
+    files = iter_files_involved_in_pr(repo, pr_number, pull_request)
+    return dict(_iter_py_files(files, exclude))
 
 
-def check_pythonic_pr(repo, pr_number):
+def check_pythonic_pr(repo, pr_number, pull_request=None):
     """
     Return True if the PR contains at least one Python file
     """
-    return len(get_py_files_in_pr(repo, pr_number)) > 0
+    files = iter_files_involved_in_pr(repo, pr_number, pull_request)
+    return next(_iter_py_files(files, []), None) is not None
 
 
-def run_pycodestyle(ghrequest, config):
+def run_pycodestyle(ghrequest, config, lint=None):
     """
-    Runs the pycodestyle cli tool on the files and update ghrequest
+    Runs the pycodestyle cli tool on the files and update ghrequest. lint
+    replaces lint_file to check the files with another engine, see
+    pep8speaks.backends.
     """
+    if lint is None:
+        lint = lint_file
     repo = ghrequest.repository
     pr_number = ghrequest.pr_number
     commit = ghrequest.after_commit_hash
@@ -137,42 +287,231 @@ def run_pycodestyle(ghrequest, config):
     ## All the python files with additions
     # A dictionary with filename paired with list of new line numbers
     files_to_exclude = config["pycodestyle"]["exclude"]
-    py_files = get_py_files_in_pr(repo, pr_number, files_to_exclude)
+    py_files = get_py_files_in_pr(repo, pr_number, files_to_exclude, ghrequest.pull_request)
 
     ghrequest.links = {}  # UI Link of each updated file in the PR
+    budget = constants.MAX_RESULTS  # Lines of results left for this event
+    out_of_time = False
+    linted = {}  # Whether each file checked has issues, for the fixers
     for py_file in py_files:
         filename = py_file[1:]
-        query = "https://raw.githubusercontent.com/{}/{}/{}"
-        query = query.format(repo, commit, py_file)
-        r = utils.query_request(query)
-        with open("file_to_check.py", 'w+', encoding=r.encoding) as file_to_check:
-            file_to_check.write(r.text)
-
-        # Use the command line here
-        cmd = 'pycodestyle {config[pycodestyle_cmd_config]} file_to_check.py'.format(
-            config=config)
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        stdout, _ = proc.communicate()
-        ghrequest.extra_results[filename] = stdout.decode(r.encoding).splitlines()
-
-        # Put only relevant errors in the ghrequest.results dictionary
-        ghrequest.results[filename] = []
-        for error in list(ghrequest.extra_results[filename]):
-            if re.search("^file_to_check.py:\d+:\d+:\s[WE]\d+\s.*", error):
-                ghrequest.results[filename].append(error.replace("file_to_check.py", filename))
-                ghrequest.extra_results[filename].remove(error)
-
-        ## Remove errors in case of diff_only = True
-        ## which are caused in the whole file
-        for error in list(ghrequest.results[filename]):
-            if config["scanner"]["diff_only"]:
-                if not int(error.split(":")[1]) in py_files[py_file]:
-                    ghrequest.results[filename].remove(error)
 
         ## Store the link to the file
         url = "https://github.com/{}/blob/{}{}"
         ghrequest.links[filename + "_link"] = url.format(repo, commit, py_file)
-        os.remove("file_to_check.py")
+
+        if budget <= 0:
+            ghrequest.skipped_files[filename] = "the limit of {} reported issues " \
+                                                "was reached".format(constants.MAX_RESULTS)
+            continue
+
+        if out_of_time:
+            ghrequest.skipped_files[filename] = "the time to check the pull request ran out"
+            continue
+
+        query = constants.RAW_URL + "/{}/{}/{}"
+        query = query.format(repo, commit, py_file)
+
+        # Every event gets its own scratch directory, so that concurrent
+        # workers never overwrite each other's file_to_check.py
+        try:
+            with tempfile.TemporaryDirectory() as scratch_dir:
+                path = os.path.join(scratch_dir, "file_to_check.py")
+                # Keep enough time to post the comment with the results so far
+                r, complete = download_file(
+                    query, path, timeout=deadlines.timeout(deadlines.COMMENT_RESERVE))
+                if not complete:
+                    ghrequest.skipped_files[filename] = "it is larger than {}".format(
+                        _format_size(constants.MAX_FILE_SIZE))
+                    continue
+
+                # With diff_only, the errors on other lines never count
+                # against the budget
+                keep = added_errors(py_files[py_file]) if config["scanner"]["diff_only"] else None
+                with metrics.stage("pull_request", "lint"):
+                    output, complete = lint(
+                        path, config, r.encoding, budget,
+                        deadlines.timeout(deadlines.COMMENT_RESERVE, cap=None), keep=keep)
+                if constants.LINT_SHADOW_BACKEND:
+                    # Imports autopep8, which the other events do without
+                    from pep8speaks import backends
+                    backends.shadow_lint(filename, path, config, r.encoding, budget,
+                                         output, complete, keep=keep)
+        except deadlines.DeadlineExceeded:
+            ghrequest.partial = out_of_time = True
+            ghrequest.skipped_files[filename] = "the time to check the pull request ran out"
+            continue
+        except utils.unavailable_errors():
+            ghrequest.partial = True
+            ghrequest.skipped_files[filename] = "it could not be downloaded from GitHub"
+            continue
+
+        results, extra_results = filter_pycodestyle_output(
+            filename, output, py_files[py_file], config["scanner"]["diff_only"])
+        if not complete or len(results) + len(extra_results) > budget:
+            ghrequest.truncated = True
+            results = results[:budget]
+            extra_results = extra_results[:budget - len(results)]
+        else:
+            # Files cut short are left out, the fixers fix them anyway
+            linted[filename] = bool(results)
+        budget -= len(results) + len(extra_results)
+        ghrequest.results[filename] = results
+        ghrequest.extra_results[filename] = extra_results
+
+    lintcache.store.put(repo, commit, config["pycodestyle_cmd_config"], linted)
+
+
+def download_file(url, path, max_size=None, timeout=None):
+    """
+    Stream the file at url into path, stopping once it is larger than
+    max_size bytes. Return the response and whether the file is complete.
+    """
+    if max_size is None:
+        max_size = constants.MAX_FILE_SIZE
+
+    kwargs = {} if timeout is None else {"timeout": timeout}
+    r = utils.query_request(url, stream=True, **kwargs)
+    try:
+        length = r.headers.get("Content-Length")
+        if length is not None and int(length) > max_size:
+            return r, False
+
+        size = 0
+        with open(path, 'wb') as downloaded_file:
+            for chunk in r.iter_content(chunk_size=64 * 1024):
+                size += len(chunk)
+                if size > max_size:
+                    return r, False
+                downloaded_file.write(chunk)
+    finally:
+        r.close()
+    return r, True
+
+
+_ERROR_LINE = re.compile(r"^file_to_check\.py:(\d+):\d+:\s[WE]\d+\s")
+
+
+def added_errors(added_lines):
+    """Return a filter of pycodestyle output lines leaving out the errors not on added_lines"""
+    added_lines = set(added_lines)
+
+    def keep(line):
+        match = _ERROR_LINE.match(line)
+        return match is None or int(match.group(1)) in added_lines
+    return keep
+
+
+def lint_file(path, config, encoding=None, max_lines=None, timeout=None, keep=None):
+    """
+    Run pycodestyle on a file named file_to_check.py. Return at most
+    max_lines lines of the output, and whether the output is complete.
+    Only the lines keep returns True for count, if given. Raise
+    deadlines.DeadlineExceeded if it takes more than timeout seconds.
+    """
+    if max_lines is None:
+        max_lines = constants.MAX_RESULTS
+
+    # Use the command line here
+    cmd = 'pycodestyle {config[pycodestyle_cmd_config]} file_to_check.py'.format(
+        config=config)
+    return _read_output(cmd, os.path.dirname(path), encoding, max_lines, timeout, keep)
+
+
+def fix_file(path, arguments, encoding=None, diff=False):
+    """
+    Run autopep8 with arguments on a file named file_to_fix.py. Return the
+    fixed file, or the diff of the fixes.
+    """
+    cmd = 'autopep8 file_to_fix.py{diff} {arguments}'.format(
+        diff=' --diff' if diff else '', arguments=arguments)
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE,
+                            cwd=os.path.dirname(path))
+    stdout, _ = proc.communicate()
+    return stdout.decode(encoding or 'utf-8')
+
+
+def _format_size(size):
+    for unit in ("bytes", "KB"):
+        if size < 1024:
+            return "{} {}".format(size, unit)
+        size //= 1024
+    return "{} MB".format(size)
+
+
+def _read_output(cmd, cwd, encoding, max_lines, timeout=None, keep=None):
+    """
+    Run cmd and return at most max_lines lines of its output, and whether
+    the output is complete. Lines keep returns False for are left out. Kill
+    it after timeout seconds.
+    """
+    # In its own process group, so that killing it also kills what the
+    # shell started
+    proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, cwd=cwd,
+                            start_new_session=True)
+
+    def kill():
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    timed_out = threading.Event()
+    timer = None
+    if timeout is not None:
+        def expire():
+            timed_out.set()
+            kill()
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+
+    output = []
+    complete = True
+    try:
+        for line in proc.stdout:
+            line = line.decode(encoding or 'utf-8').rstrip('\r\n')
+            if keep is not None and not keep(line):
+                continue
+            if len(output) >= max_lines:
+                complete = False
+                kill()
+                break
+            output.append(line)
+    finally:
+        if timer is not None:
+            timer.cancel()
+        proc.stdout.close()
+        proc.wait()
+
+    if timed_out.is_set():
+        raise deadlines.DeadlineExceeded("{!r} did not finish in {:.1f} seconds".format(cmd, timeout))
+    return output, complete
+
+
+def filter_pycodestyle_output(filename, output, added_lines, diff_only):
+    """
+    Split the output lines of pycodestyle run on file_to_check.py into the
+    errors to report for filename and the extra results (statistics, source
+    etc. enabled by the pycodestyle arguments).
+    """
+    results = []
+    extra_results = []
+
+    # Put only relevant errors in the results
+    for error in output:
+        if re.search("^file_to_check.py:\d+:\d+:\s[WE]\d+\s.*", error):
+            results.append(error.replace("file_to_check.py", filename))
+        else:
+            extra_results.append(error)
+
+    ## Remove errors in case of diff_only = True
+    ## which are caused in the whole file
+    if diff_only:
+        added_lines = set(added_lines)
+        results = [error for error in results
+                   if int(error.split(":")[1]) in added_lines]
+
+    return results, extra_results
 
 
 def prepare_comment(ghrequest, config):
@@ -195,6 +534,9 @@ def prepare_comment(ghrequest, config):
     ## Body
     ERROR = False  # Set to True when any pep8 error exists
     comment_body = []
+    if ghrequest.partial:
+        comment_body.append("**Partial results:** some files could not be checked "
+                            "in time, they are listed at the end.\n\n")
     for gh_file, issues in ghrequest.results.items():
         if len(issues) == 0:
             if not config["only_mention_files_with_errors"]:
@@ -236,6 +578,15 @@ def prepare_comment(ghrequest, config):
     if config["only_mention_files_with_errors"] and not ERROR:
         comment_body.append(config["message"]["no_errors"])
 
+    ## Files which were too large or over the limit of results
+    for gh_file, reason in sorted(ghrequest.skipped_files.items()):
+        comment_body.append(
+            "\n\n - The file [`{0}`]({1}) was not checked, {2}.".format(
+                gh_file, ghrequest.links[gh_file + "_link"], reason))
+    if ghrequest.truncated:
+        comment_body.append("\n\n - Only the first {} issues are reported.".format(
+            constants.MAX_RESULTS))
+
     comment_body = ''.join(comment_body)
 
     ## Footer
@@ -250,16 +601,20 @@ def prepare_comment(ghrequest, config):
     return comment_header, comment_body, comment_footer, ERROR
 
 
-def comment_permission_check(ghrequest):
+def comment_permission_check(ghrequest, context=None):
     """
-    Check for quite and resume status or duplicate comments
+    Check for quite and resume status or duplicate comments.
+    The comments and commits are taken from context when it is given.
     """
     repository = ghrequest.repository
 
     # Check for duplicate comment
-    url = "/repos/{}/issues/{}/comments"
-    url = url.format(repository, str(ghrequest.pr_number))
-    comments = utils.query_request(url).json()
+    if context is not None:
+        comments = context.comments
+    else:
+        url = "/repos/{}/issues/{}/comments"
+        url = url.format(repository, str(ghrequest.pr_number))
+        comments = utils.query_request(url).json()
 
     # # Get the last comment by the bot
     # last_comment = ""
@@ -284,9 +639,13 @@ def comment_permission_check(ghrequest):
 
     # Check for [skip pep8]
     ## In commits
-    commits = utils.query_request(ghrequest.commits_url).json()
-    for commit in commits:
-        if any(m in commit["commit"]["message"].lower() for m in ["[skip pep8]", "[pep8 skip]"]):
+    if context is not None:
+        messages = context.commit_messages
+    else:
+        commits = utils.query_request(ghrequest.commits_url).json()
+        messages = [commit["commit"]["message"] for commit in commits]
+    for message in messages:
+        if any(m in message.lower() for m in ["[skip pep8]", "[pep8 skip]"]):
             return False
     ## PR title
     if any(m in ghrequest.pr_title.lower() for m in ["[skip pep8]", "[pep8 skip]"]):
@@ -298,35 +657,99 @@ def comment_permission_check(ghrequest):
     return True
 
 
-def create_or_update_comment(ghrequest, comment, ONLY_UPDATE_COMMENT_BUT_NOT_CREATE):
+_FINGERPRINT = re.compile(r"<!-- pep8speaks fingerprint: (\w+) -->")
+
+
+# The commit in the links to the files, which a new push always changes
+_BLOB_COMMIT = re.compile(r"(https://github\.com/[^/\s]+/[^/\s]+/blob/)[^/\s]+/")
+
+
+def comment_fingerprint(comment):
+    """
+    Return the fingerprint of a comment, kept hidden in the comment itself.
+    It leaves out the commit the files link to, so that a push which does
+    not change the issues reported keeps the same fingerprint.
+    """
+    comment = _BLOB_COMMIT.sub(r"\1", comment)
+    return hashlib.sha256(comment.encode("utf-8")).hexdigest()
+
+
+def _find_bot_comment(comments):
+    for old_comment in comments:
+        if appauth.is_bot(old_comment["user"]):
+            return old_comment
+    return None
+
+
+def create_or_update_comment(ghrequest, comment, ONLY_UPDATE_COMMENT_BUT_NOT_CREATE,
+                             comments=None):
+    """
+    Make the comment of the bot on the PR, or update it. comments are the
+    comments of the PR if they were already fetched.
+    """
     query = "/repos/{}/issues/{}/comments"
     query = query.format(ghrequest.repository, str(ghrequest.pr_number))
-    comments = utils.query_request(query).json()
+    last_comment = _find_bot_comment(comments or [])
+    if last_comment is None:
+        # Fetch them again, another event may have made the comment since
+        last_comment = _find_bot_comment(utils.query_request(query).json())
 
-    # Get the last comment id by the bot
-    last_comment_id = None
-    for old_comment in comments:
-        if old_comment["user"]["id"] == 24736507:  # ID of @pep8speaks
-            last_comment_id = old_comment["id"]
-            break
+    # The fingerprint leaves out the time of the update, so that an update
+    # which changes nothing else can be skipped
+    fingerprint = comment_fingerprint(comment)
+    comment += "\n\n<!-- pep8speaks fingerprint: {} -->".format(fingerprint)
 
-    if last_comment_id is None and not ONLY_UPDATE_COMMENT_BUT_NOT_CREATE:  # Create a new comment
+    if last_comment is None and not ONLY_UPDATE_COMMENT_BUT_NOT_CREATE:  # Create a new comment
         response = utils.query_request(query=query, method='POST', json={"body": comment})
         ghrequest.comment_response = response.json()
+    elif last_comment is None:  # No comment to update
+        return None
     else:  # Update the last comment
+        match = _FINGERPRINT.search(last_comment["body"] or "")
+        if match and match.group(1) == fingerprint:
+            metrics.increment(metrics.SKIPPED_COMMENT_UPDATES)
+            ghrequest.comment_response = last_comment
+            return None
+
         utc_time = datetime.datetime.utcnow()
         time_now = utc_time.strftime("%B %d, %Y at %H:%M Hours UTC")
-        comment += "\n\n##### Comment last updated on {}"
-        comment = comment.format(time_now)
+        comment += "\n\n##### Comment last updated on {}".format(time_now)
 
         query = "/repos/{}/issues/comments/{}"
-        query = query.format(ghrequest.repository, str(last_comment_id))
+        query = query.format(ghrequest.repository, str(last_comment["id"]))
         response = utils.query_request(query, method='PATCH', json={"body": comment})
 
     return response
 
 
+def autopep8_arguments(config):
+    """Return the autopep8 arguments fixing what pycodestyle checks with the config"""
+    arguments = []
+    # Ignore errors and warnings specified in the config file
+    if config["pycodestyle"]["ignore"]:
+        arguments.append("--ignore " + ",".join(config["pycodestyle"]["ignore"]))
+    if config["pycodestyle"]["select"]:
+        arguments.append("--select " + ",".join(config["pycodestyle"]["select"]))
+    if config["pycodestyle"]["max-line-length"]:
+        arguments.append("--max-line-length {}".format(config["pycodestyle"]["max-line-length"]))
+    return " ".join(arguments)
+
+
+def files_to_fix(ghrequest, config, py_files):
+    """
+    Return the files of py_files to run autopep8 on, leaving out the ones
+    the last check of the head commit found without issues
+    """
+    linted = lintcache.store.get(ghrequest.repository, ghrequest.sha,
+                                 config["pycodestyle_cmd_config"])
+    if linted is None:
+        return list(py_files)
+    return [py_file for py_file in py_files if linted.get(py_file[1:], True)]
+
+
 def autopep8(ghrequest, config):
+    import unidiff
+
     # Run pycodestyle
 
     r = utils.query_request(ghrequest.diff_url)
@@ -345,25 +768,18 @@ def autopep8(ghrequest, config):
                     if line.is_added:
                         py_files[py_file].append(line.target_line_no)
 
-    # Ignore errors and warnings specified in the config file
-    to_ignore = ",".join(config["pycodestyle"]["ignore"])
-    arg_to_ignore = ""
-    if len(to_ignore) > 0:
-        arg_to_ignore = "--ignore " + to_ignore
-
-    for py_file in py_files:
+    arguments = autopep8_arguments(config)
+    for py_file in files_to_fix(ghrequest, config, py_files):
         filename = py_file[1:]
-        url = "https://raw.githubusercontent.com/{}/{}/{}"
+        url = constants.RAW_URL + "/{}/{}/{}"
         url = url.format(ghrequest.repository, ghrequest.sha, py_file)
-        r = utils.query_request(url)
-        with open("file_to_fix.py", 'w+', encoding=r.encoding) as file_to_fix:
-            file_to_fix.write(r.text)
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            path = os.path.join(scratch_dir, "file_to_fix.py")
+            r, complete = download_file(url, path)
+            if not complete:
+                continue
 
-        cmd = 'autopep8 file_to_fix.py --diff {arg_to_ignore}'.format(
-            arg_to_ignore=arg_to_ignore)
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        stdout, _ = proc.communicate()
-        ghrequest.diff[filename] = stdout.decode(r.encoding)
+            ghrequest.diff[filename] = fix_file(path, arguments, r.encoding, diff=True)
 
         # Fix the errors
         ghrequest.diff[filename] = ghrequest.diff[filename].replace("file_to_check.py", filename)
@@ -373,7 +789,6 @@ def autopep8(ghrequest, config):
         url = "https://github.com/{}/blob/{}{}"
         ghrequest.links = {}
         ghrequest.links[filename + "_link"] = url.format(ghrequest.repository, ghrequest.sha, py_file)
-        os.remove("file_to_fix.py")
 
 
 def create_gist(ghrequest):
@@ -400,14 +815,19 @@ def create_gist(ghrequest):
 def delete_if_forked(ghrequest):
     FORKED = False
     query = "/user/repos"
-    r = utils.query_request(query)
-    for repo in r.json():
-        if repo["description"]:
-            if ghrequest.target_repo_fullname in repo["description"]:
-                FORKED = True
-                url = "/repos/{}"
-                url = url.format(repo["full_name"])
-                utils.query_request(url, method='DELETE')
+    # Cleaning up old forks is skipped when the API budget runs low
+    try:
+        r = utils.query_request(query, priority=ratelimit.BACKGROUND)
+        for repo in r.json():
+            if repo["description"]:
+                if ghrequest.target_repo_fullname in repo["description"]:
+                    FORKED = True
+                    url = "/repos/{}"
+                    url = url.format(repo["full_name"])
+                    utils.query_request(url, method='DELETE',
+                                        priority=ratelimit.BACKGROUND)
+    except ratelimit.RateLimitExceeded:
+        pass
     return FORKED
 
 
@@ -471,6 +891,8 @@ def create_new_branch(ghrequest):
 
 
 def autopep8ify(ghrequest, config):
+    import unidiff
+
     # Run pycodestyle
     r = utils.query_request(ghrequest.diff_url)
 
@@ -489,27 +911,18 @@ def autopep8ify(ghrequest, config):
                     if line.is_added:
                         py_files[py_file].append(line.target_line_no)
 
-    # Ignore errors and warnings specified in the config file
-    to_ignore = ",".join(config["pycodestyle"]["ignore"])
-    arg_to_ignore = ""
-    if len(to_ignore) > 0:
-        arg_to_ignore = "--ignore " + to_ignore
-
-    for py_file in py_files:
+    arguments = autopep8_arguments(config)
+    for py_file in files_to_fix(ghrequest, config, py_files):
         filename = py_file[1:]
-        query = "https://raw.githubusercontent.com/{}/{}/{}"
+        query = constants.RAW_URL + "/{}/{}/{}"
         query = query.format(ghrequest.repository, ghrequest.sha, py_file)
-        r = utils.query_request(query)
-        with open("file_to_fix.py", 'w+', encoding=r.encoding) as file_to_fix:
-            file_to_fix.write(r.text)
-
-        cmd = 'autopep8 file_to_fix.py {arg_to_ignore}'.format(
-            arg_to_ignore=arg_to_ignore)
-        proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE)
-        stdout, _ = proc.communicate()
-        ghrequest.results[filename] = stdout.decode(r.encoding)
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            path = os.path.join(scratch_dir, "file_to_fix.py")
+            r, complete = download_file(query, path)
+            if not complete:
+                continue
 
-        os.remove("file_to_fix.py")
+            ghrequest.results[filename] = fix_file(path, arguments, r.encoding)
 
 
 def commit(ghrequest):
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""
+A durable queue of webhook events, shared by every dyno.
+
+With the JOB_QUEUE environment variable set, the web dynos only store the
+pull_request and issue_comment events and answer 202. Worker processes
+claim the events one at a time and run the handlers on them:
+
+    $ JOB_QUEUE=postgres python -m pep8speaks.jobs
+    $ JOB_QUEUE=sqlite:jobs.db python -m pep8speaks.jobs --drain
+
+JOB_QUEUE=postgres uses the database of the app (DATABASE_URL), where the
+workers claim jobs with SELECT ... FOR UPDATE SKIP LOCKED and never wait on
+each other. JOB_QUEUE=sqlite:PATH keeps the queue in a SQLite file for local
+runs. A running job sends heartbeats; a job whose worker stopped sending
+them is queued again, and a failed job is retried with a growing delay.
+"""
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+from pep8speaks import appauth, database, handlers, metrics, models, utils
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# Events handled by the workers, with their priority (lowest first) and handler
+EVENTS = {
+    "issue_comment": (0, "handle_issue_comment"),
+    "pull_request": (1, "handle_pull_request"),
+}
+
+MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", 3))
+# Seconds between two heartbeats of a running job
+HEARTBEAT = float(os.environ.get("JOB_HEARTBEAT", 10))
+# Seconds without a heartbeat after which a running job is queued again
+STALE_AFTER = float(os.environ.get("JOB_STALE_AFTER", 60))
+# Delay before the first retry of a failed job, doubled on every attempt
+RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", 5))
+# Seconds done and failed jobs are kept for
+KEEP_FOR = 24 * 3600
+
+
+class Job(object):
+    def __init__(self, job_id, event, payload, attempts, run_at):
+        self.id = job_id
+        self.event = event
+        self.payload = payload
+        self.attempts = attempts
+        self.run_at = run_at
+
+
+class JobQueue(object):
+    """
+    Jobs in the Jobs table of a database. The backends only differ in how
+    they connect, create the table, insert and claim.
+    """
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._lock = threading.Lock()
+
+    def enqueue(self, event, payload, delivery_id=None):
+        """
+        Queue an event. Return the id of the job, or None if a job was
+        already queued for the same delivery.
+        """
+        priority = EVENTS[event][0]
+        now = self.clock()
+        with self._lock:
+            return self._insert(
+                "INSERT INTO Jobs (event, payload, delivery_id, priority, state, "
+                "run_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (delivery_id) DO NOTHING",
+                (event, json.dumps(payload), delivery_id, priority, QUEUED, now, now))
+
+    def claim(self, worker):
+        """Mark the next job due as running by worker and return it, or None"""
+        with self._lock:
+            row = self._claim(worker, self.clock())
+        if row is None:
+            return None
+        job = Job(row[0], row[1], utils.json_loads(row[2]), row[3], row[4])
+        metrics.observe(metrics.JOB_QUEUE_WAIT, max(self.clock() - job.run_at, 0),
+                        event=job.event)
+        return job
+
+    def heartbeat(self, job_id, worker):
+        """Return False if the job is no longer running for this worker"""
+        return self._update(
+            "UPDATE Jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND state = ?",
+            (self.clock(), job_id, worker, RUNNING)) == 1
+
+    def complete(self, job_id, worker):
+        self._update(
+            "UPDATE Jobs SET state = ?, heartbeat_at = ? WHERE id = ? AND worker = ?",
+            (DONE, self.clock(), job_id, worker))
+
+    def fail(self, job_id, worker, attempts, error):
+        """Queue the job again after a delay, or give up after MAX_ATTEMPTS"""
+        now = self.clock()
+        if attempts < MAX_ATTEMPTS:
+            state, run_at = QUEUED, now + RETRY_DELAY * 2 ** (attempts - 1)
+        else:
+            state, run_at = FAILED, now
+        self._update(
+            "UPDATE Jobs SET state = ?, run_at = ?, heartbeat_at = ?, error = ? "
+            "WHERE id = ? AND worker = ?",
+            (state, run_at, now, error, job_id, worker))
+        return state
+
+    def reclaim(self, stale_after=STALE_AFTER):
+        """
+        Queue again the running jobs whose worker stopped sending heartbeats
+        and forget the old finished jobs. Return the number of jobs queued.
+        """
+        now = self.clock()
+        self._update("UPDATE Jobs SET state = ?, error = ? WHERE state = ? "
+                     "AND heartbeat_at < ? AND attempts >= ?",
+                     (FAILED, "The worker stopped", RUNNING, now - stale_after, MAX_ATTEMPTS))
+        self._update("DELETE FROM Jobs WHERE state IN (?, ?) AND heartbeat_at < ?",
+                     (DONE, FAILED, now - KEEP_FOR))
+        return self._update("UPDATE Jobs SET state = ?, worker = NULL WHERE state = ? "
+                            "AND heartbeat_at < ?", (QUEUED, RUNNING, now - stale_after))
+
+    def counts(self):
+        """Return the number of jobs in every state"""
+        with self._lock:
+            rows = self._select("SELECT state, COUNT(*) FROM Jobs GROUP BY state", ())
+        return dict(rows)
+
+    def _update(self, query, params):
+        with self._lock:
+            return self._execute(query, params)
+
+
+class PostgresQueue(JobQueue):
+    """Jobs in the database of the app"""
+    def __init__(self, clock=time.time):
+        super().__init__(clock)
+        self._conn = None
+
+    def _connection(self):
+        # A connection of its own, which the rollbacks of the other modules
+        # never touch. The queries run one at a time under the lock.
+        if self._conn is None or self._conn.closed:
+            conn = database.connect()
+            self._run(
+                "CREATE TABLE IF NOT EXISTS Jobs ("
+                "id BIGSERIAL PRIMARY KEY, event TEXT NOT NULL, payload TEXT NOT NULL, "
+                "delivery_id TEXT UNIQUE, priority INTEGER NOT NULL, state TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, run_at DOUBLE PRECISION NOT NULL, "
+                "heartbeat_at DOUBLE PRECISION, worker TEXT, error TEXT, "
+                "created_at DOUBLE PRECISION NOT NULL);", (), conn)
+            self._run("CREATE INDEX IF NOT EXISTS jobs_due ON Jobs (state, priority, run_at);",
+                      (), conn)
+            self._conn = conn
+        return self._conn
+
+    def _run(self, query, params, conn=None, fetch=False):
+        import psycopg2
+
+        conn = conn or self._connection()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(query.replace("?", "%s"), params)
+                result = cursor.fetchall() if fetch else cursor.rowcount
+        except psycopg2.Error:
+            conn.rollback()
+            raise
+        conn.commit()
+        return result
+
+    def _execute(self, query, params):
+        return self._run(query, params)
+
+    def _select(self, query, params):
+        return self._run(query, params, fetch=True)
+
+    def _insert(self, query, params):
+        rows = self._select(query + " RETURNING id", params)
+        return rows[0][0] if rows else None
+
+    def _claim(self, worker, now):
+        rows = self._select(
+            "UPDATE Jobs SET state = ?, worker = ?, heartbeat_at = ?, attempts = attempts + 1 "
+            "WHERE id = (SELECT id FROM Jobs WHERE state = ? AND run_at <= ? "
+            "ORDER BY priority, run_at, id LIMIT 1 FOR UPDATE SKIP LOCKED) "
+            "RETURNING id, event, payload, attempts, run_at",
+            (RUNNING, worker, now, QUEUED, now))
+        return rows[0] if rows else None
+
+
+class SQLiteQueue(JobQueue):
+    """
+    Jobs in a SQLite file, for local runs. SQLite has no row locks, a claim
+    locks the whole file for the time of one short transaction instead.
+    """
+    def __init__(self, path, clock=time.time):
+        import sqlite3
+
+        super().__init__(clock)
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None,
+                                     check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS Jobs ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, event TEXT NOT NULL, payload TEXT NOT NULL, "
+            "delivery_id TEXT UNIQUE, priority INTEGER NOT NULL, state TEXT NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, run_at REAL NOT NULL, "
+            "heartbeat_at REAL, worker TEXT, error TEXT, created_at REAL NOT NULL);")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_due ON Jobs (state, priority, run_at);")
+
+    def _execute(self, query, params):
+        return self._conn.execute(query, params).rowcount
+
+    def _select(self, query, params):
+        return self._conn.execute(query, params).fetchall()
+
+    def _insert(self, query, params):
+        cursor = self._conn.execute(query, params)
+        return cursor.lastrowid if cursor.rowcount == 1 else None
+
+    def _claim(self, worker, now):
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._conn.execute(
+                "SELECT id, event, payload, attempts, run_at FROM Jobs "
+                "WHERE state = ? AND run_at <= ? ORDER BY priority, run_at, id LIMIT 1",
+                (QUEUED, now)).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE Jobs SET state = ?, worker = ?, heartbeat_at = ?, "
+                    "attempts = attempts + 1 WHERE id = ?", (RUNNING, worker, now, row[0]))
+                row = row[:3] + (row[3] + 1,) + row[4:]
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        return row
+
+
+def connect(url):
+    """Return the queue described by a JOB_QUEUE value"""
+    if url == "postgres":
+        return PostgresQueue()
+    if url.startswith("sqlite:"):
+        return SQLiteQueue(url[len("sqlite:"):])
+    raise ValueError("JOB_QUEUE should be postgres or sqlite:PATH, not {!r}".format(url))
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_queue():
+    """Return the queue set by JOB_QUEUE, or None if events are handled in the web dyno"""
+    global _queue
+    url = os.environ.get("JOB_QUEUE")
+    if not url:
+        return None
+    with _queue_lock:
+        if _queue is None:
+            _queue = connect(url)
+    return _queue
+
+
+def accept(queue, event, request, delivery_id=None):
+    """Queue an event received by the web dyno and answer the webhook"""
+    job_id = queue.enqueue(event, request.json, delivery_id)
+    if job_id is None:
+        return utils.Response({"message": "Delivery {} is already queued".format(delivery_id)},
+                              status=202)
+    return utils.Response({"message": "Queued as job {}".format(job_id), "job": job_id},
+                          status=202)
+
+
+def _send_heartbeats(queue, job, worker, stop, interval):
+    while not stop.wait(interval):
+        if not queue.heartbeat(job.id, worker):
+            return
+
+
+def run_job(queue, job, worker, heartbeat=HEARTBEAT):
+    """Run the handler of a claimed job and record its outcome"""
+    stop = threading.Event()
+    beats = threading.Thread(target=_send_heartbeats,
+                             args=(queue, job, worker, stop, heartbeat), daemon=True)
+    beats.start()
+    try:
+        handler = getattr(handlers, EVENTS[job.event][1])
+        with metrics.timer(metrics.EVENT_DURATION, event=job.event), \
+                appauth.installation(appauth.installation_of(job.payload)):
+            handler(models.WebhookRequest({"X-GitHub-Event": job.event}, json=job.payload))
+    except Exception as exc:
+        logging.exception("Job %s failed", job.id)
+        outcome = queue.fail(job.id, worker, job.attempts, "{}: {}".format(type(exc).__name__, exc))
+    else:
+        queue.complete(job.id, worker)
+        outcome = DONE
+    finally:
+        stop.set()
+        beats.join()
+    metrics.increment(metrics.JOBS, event=job.event, outcome=outcome)
+    return outcome
+
+
+def work(queue, worker=None, poll=1.0, drain=False, stop=None):
+    """
+    Claim and run jobs until stop is set, or until no job is due with drain.
+    Return the number of jobs run.
+    """
+    worker = worker or "{}:{}".format(socket.gethostname(), os.getpid())
+    stop = stop or threading.Event()
+    done = 0
+    last_reclaim = None
+    while not stop.is_set():
+        if last_reclaim is None or time.monotonic() - last_reclaim > STALE_AFTER / 2:
+            queue.reclaim()
+            last_reclaim = time.monotonic()
+        job = queue.claim(worker)
+        if job is None:
+            if drain:
+                break
+            stop.wait(poll)
+            continue
+        run_job(queue, job, worker)
+        done += 1
+    return done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description=__doc__.split("\n\n")[0],
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=__doc__.split("\n\n", 1)[1])
+    parser.add_argument("--queue", default=os.environ.get("JOB_QUEUE"),
+                        help="postgres or sqlite:PATH (default: $JOB_QUEUE)")
+    parser.add_argument("--poll", type=float, default=1.0,
+                        help="Seconds to wait when no job is due")
+    parser.add_argument("--drain", action="store_true",
+                        help="Exit once no job is due instead of waiting for more")
+    args = parser.parse_args(argv)
+    if not args.queue:
+        parser.error("Set JOB_QUEUE or give --queue")
+
+    logging.basicConfig(level=logging.INFO)
+    queue = connect(args.queue)
+    done = work(queue, poll=args.poll, drain=args.drain)
+    print(json.dumps({"jobs": done, "counts": queue.counts()}, sort_keys=True))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
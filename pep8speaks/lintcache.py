@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+Remember which files of a commit pycodestyle found issues in.
+
+"@pep8speaks suggest diff" and "pep8ify" usually come shortly after the
+check of the same head commit, and only the files with issues have
+something for autopep8 to fix. The check stores the outcome of each file it
+linted, keyed by repository, commit and pycodestyle arguments, for
+LINT_CACHE_TTL seconds. The fixers then skip the files found clean. Files
+missing from the entry (skipped, or checked by another dyno) are fixed as
+before.
+"""
+import collections
+import os
+import threading
+import time
+
+from pep8speaks import metrics
+
+# Commits remembered in memory, and for how many seconds
+CAPACITY = int(os.environ.get("LINT_CACHE_SIZE", 1000))
+TTL = int(os.environ.get("LINT_CACHE_TTL", 3600))
+
+
+class LintCache(object):
+    """A bounded, least recently used store of lint outcomes which expire"""
+    def __init__(self, capacity=CAPACITY, ttl=TTL, clock=time.monotonic):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.clock = clock
+        self._entries = collections.OrderedDict()  # key: (stored at, {filename: has issues})
+        self._lock = threading.Lock()
+
+    def put(self, repo, sha, arguments, files):
+        """Store a dictionary of filename and whether it has issues"""
+        key = (repo, sha, arguments)
+        with self._lock:
+            self._entries[key] = (self.clock(), dict(files))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def get(self, repo, sha, arguments):
+        """Return the files stored for a commit, or None if unknown or expired"""
+        key = (repo, sha, arguments)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.clock() - entry[0] > self.ttl:
+                del self._entries[key]
+                entry = None
+        metrics.increment(metrics.LINT_CACHE, result="miss" if entry is None else "hit")
+        return None if entry is None else entry[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+store = LintCache()
@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+"""
+Lightweight timing spans, histograms and counters exported in the
+Prometheus text format. Set the ENABLE_METRICS environment variable to
+collect them, otherwise every call is a no-op.
+"""
+import bisect
+import collections
+import os
+import re
+import threading
+import time
+import urllib.parse as urlparse
+
+from pep8speaks import constants
+
+ENABLED = bool(os.environ.get("ENABLE_METRICS", False))
+
+STAGE_DURATION = "pep8speaks_stage_duration_seconds"
+EVENT_DURATION = "pep8speaks_event_duration_seconds"
+GITHUB_REQUEST_DURATION = "pep8speaks_github_request_duration_seconds"
+GITHUB_REQUESTS = "pep8speaks_github_requests_total"
+RATE_LIMIT_WAIT = "pep8speaks_rate_limit_wait_seconds"
+RATE_LIMITED_CALLS = "pep8speaks_rate_limited_calls_total"
+DUPLICATE_DELIVERIES = "pep8speaks_duplicate_deliveries_total"
+LANE_QUEUE_WAIT = "pep8speaks_lane_queue_wait_seconds"
+LANE_SERVICE_TIME = "pep8speaks_lane_service_seconds"
+LANE_TARGET_MISSED = "pep8speaks_lane_target_missed_total"
+LANE_REJECTED = "pep8speaks_lane_rejected_total"
+TENANT_QUEUE_WAIT = "pep8speaks_tenant_queue_wait_seconds"
+JOB_QUEUE_WAIT = "pep8speaks_job_queue_wait_seconds"
+JOBS = "pep8speaks_jobs_total"
+CIRCUIT_OPENED = "pep8speaks_circuit_opened_total"
+CIRCUIT_REJECTED = "pep8speaks_circuit_rejected_calls_total"
+PARTIAL_RESULTS = "pep8speaks_partial_results_total"
+SKIPPED_COMMENT_UPDATES = "pep8speaks_skipped_comment_updates_total"
+LINT_CACHE = "pep8speaks_lint_cache_total"
+LINT_SHADOW = "pep8speaks_lint_shadow_total"
+LINT_SHADOW_DURATION = "pep8speaks_lint_shadow_duration_seconds"
+
+HELP = {
+    STAGE_DURATION: "Time spent in each stage of handling a webhook",
+    EVENT_DURATION: "Time spent handling a webhook",
+    GITHUB_REQUEST_DURATION: "Time spent in calls to GitHub by endpoint",
+    GITHUB_REQUESTS: "Calls made to GitHub by endpoint and status",
+    RATE_LIMIT_WAIT: "Time calls to GitHub were held back to stay within the rate limit",
+    RATE_LIMITED_CALLS: "Calls to GitHub delayed, skipped or out of time to stay within the rate limit",
+    DUPLICATE_DELIVERIES: "Webhook redeliveries answered without processing them again",
+    LANE_QUEUE_WAIT: "Time work waited for a slot in its lane",
+    LANE_SERVICE_TIME: "Time work ran once it had a slot in its lane",
+    LANE_TARGET_MISSED: "Work which took longer than the latency target of its lane",
+    LANE_REJECTED: "Work turned away because too much was waiting in its lane",
+    TENANT_QUEUE_WAIT: "Time work waited for a slot in its lane by tenant",
+    JOB_QUEUE_WAIT: "Time queued jobs waited for a worker",
+    JOBS: "Queued jobs run by the workers by event and outcome",
+    CIRCUIT_OPENED: "Times the circuit of a host opened after repeated failures",
+    CIRCUIT_REJECTED: "Calls failed fast because the circuit of their host was open",
+    PARTIAL_RESULTS: "Pull requests commented on before every file could be checked",
+    SKIPPED_COMMENT_UPDATES: "Updates of the comment skipped as its content did not change",
+    LINT_CACHE: "Lookups of the files found clean by the last check of a commit",
+    LINT_SHADOW: "Files linted again by the shadow engine, by whether its output matched",
+    LINT_SHADOW_DURATION: "Time the shadow engine took to lint a file",
+}
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_lock = threading.Lock()
+_histograms = collections.defaultdict(dict)
+_counters = collections.defaultdict(dict)
+
+
+class _Timer(object):
+    """Context manager observing the time spent in its block"""
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+class _NullTimer(object):
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def timer(name, **labels):
+    """
+    Time the block of a with statement into the histogram `name`
+    """
+    if not ENABLED:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def stage(handler, name):
+    """Time a stage of handling a webhook"""
+    return timer(STAGE_DURATION, handler=handler, stage=name)
+
+
+def observe(name, value, **labels):
+    """Add value to the histogram `name`"""
+    if not ENABLED:
+        return
+    with _lock:
+        histogram = _histograms[name].get(_key(labels))
+        if histogram is None:
+            histogram = _histograms[name][_key(labels)] = {
+                "buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+        index = bisect.bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            histogram["buckets"][index] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+def increment(name, value=1, **labels):
+    """Add value to the counter `name`"""
+    if not ENABLED:
+        return
+    with _lock:
+        key = _key(labels)
+        _counters[name][key] = _counters[name].get(key, 0) + value
+
+
+def endpoint_template(url):
+    """
+    Return the endpoint of a GitHub URL with the variable parts replaced,
+    e.g. /repos/{repo}/issues/{number}/comments
+    """
+    if url.startswith(constants.RAW_URL):
+        return "raw/{repo}/{ref}/{path}"
+
+    path = urlparse.urlparse(url).path
+    match = re.match(r"^/repos/[^/]+/[^/]+(/.*)?$", path)
+    if match:
+        rest = match.group(1) or ""
+        if rest.startswith("/contents/"):
+            rest = "/contents/{path}"
+        return "/repos/{repo}" + re.sub(r"/\d+(?=/|$)", "/{number}", rest)
+    if path.startswith("/user/following/"):
+        return "/user/following/{user}"
+    if re.match(r"^/[^/]+/[^/]+/pull/\d+\.diff$", path):
+        return "/{repo}/pull/{number}.diff"
+    return re.sub(r"/\d+(?=/|$)", "/{number}", path)
+
+
+def record_request(method, url, status, elapsed):
+    """Count and time a call made to GitHub"""
+    if not ENABLED:
+        return
+    endpoint = endpoint_template(url)
+    observe(GITHUB_REQUEST_DURATION, elapsed, method=method, endpoint=endpoint)
+    increment(GITHUB_REQUESTS, method=method, endpoint=endpoint, status=str(status))
+
+
+def reset():
+    """Forget everything recorded so far"""
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append('{}="{}"'.format(key, value))
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else repr(bound)
+
+
+def render():
+    """Return all the metrics in the Prometheus text exposition format"""
+    lines = []
+    with _lock:
+        for name in sorted(_histograms):
+            lines.append("# HELP {} {}".format(name, HELP.get(name, name)))
+            lines.append("# TYPE {} histogram".format(name))
+            for key, histogram in sorted(_histograms[name].items()):
+                cumulative = 0
+                bounds = BUCKETS + (float("inf"),)
+                counts = histogram["buckets"] + [histogram["count"] - sum(histogram["buckets"])]
+                for bound, count in zip(bounds, counts):
+                    cumulative += count
+                    labels = _format_labels(key + (("le", _format_bound(bound)),))
+                    lines.append("{}_bucket{} {}".format(name, labels, cumulative))
+                lines.append("{}_sum{} {}".format(name, _format_labels(key), histogram["sum"]))
+                lines.append("{}_count{} {}".format(name, _format_labels(key), histogram["count"]))
+        for name in sorted(_counters):
+            lines.append("# HELP {} {}".format(name, HELP.get(name, name)))
+            lines.append("# TYPE {} counter".format(name))
+            for key, value in sorted(_counters[name].items()):
+                lines.append("{}{} {}".format(name, _format_labels(key), value))
+    return "\n".join(lines) + "\n"
@@ -1,14 +1,92 @@
+from flask import abort
+
 from pep8speaks import utils
 
+_UNPARSED = object()
+
+
+class WebhookRequest(object):
+    """
+    The headers and raw body of a webhook, with the body parsed once when
+    first used. Stands in for the flask request the handlers are called with.
+    """
+    __slots__ = ('headers', 'data', '_json')
+
+    def __init__(self, headers, data=b"", json=_UNPARSED):
+        self.headers = headers
+        self.data = data
+        self._json = json
+
+    @classmethod
+    def from_flask(cls, request):
+        return cls(request.headers, request.get_data())
+
+    def get_json(self, silent=False):
+        """Return the parsed body, None if it is empty"""
+        if self._json is _UNPARSED:
+            try:
+                self._json = utils.json_loads(self.data) if self.data else None
+            except ValueError:
+                if silent:
+                    return None
+                abort(400)
+        return self._json
+
+    @property
+    def json(self):
+        return self.get_json()
+
+
+def _field(source, *keys, event=None):
+    """
+    A field of the pull request or of the payload, read when used. Like the
+    attributes it replaces, it is missing from requests which are not OK or
+    not of the event.
+    """
+    def get(self):
+        if not self.OK or (event is not None and self.event != event):
+            raise AttributeError(keys[-1])
+        value = getattr(self, source)
+        for key in keys:
+            value = value[key]
+        return value
+    return property(get)
+
 
 class GHRequest(object):
-    """A payload object sent by GitHub"""
+    """
+    A payload object sent by GitHub. The fields of the pull request and of
+    the payload are read from it when used rather than copied up front.
+    """
+    __slots__ = (
+        'request', 'event', 'OK', 'results', 'extra_results', 'skipped_files',
+        'truncated', 'partial', 'pep8_comment', 'error', 'pull_request',
+        # Set by the helpers while handling the event
+        'links', 'diff', 'comment_response', 'gist_response', 'gist_url',
+        'fork_fullname', 'new_branch', 'pr_url', 'target_repo_fullname',
+        'target_repo_branch',
+    )
+
+    sha = _field('pull_request', 'head', 'sha')
+    action = _field('request', 'action')
+    author = _field('pull_request', 'user', 'login')
+    pr_desc = _field('pull_request', 'body')
+    diff_url = _field('pull_request', 'diff_url')
+    pr_title = _field('pull_request', 'title')
+    pr_number = _field('pull_request', 'number')
+    repository = _field('request', 'repository', 'full_name')
+    commits_url = _field('pull_request', 'commits_url')
+    after_commit_hash = _field('pull_request', 'head', 'sha')
+    reviewer = _field('request', 'comment', 'user', 'login', event='issue_comment')
+    review_url = _field('request', 'comment', 'html_url', event='issue_comment')
+    comment = _field('request', 'comment', 'body', event='issue_comment')
+
     def __init__(self, request, event):
         # Keep request body and event type
         self.request = request.json
         self.event = event
 
-        self.OK = self._is_request_valid(request, event)
+        self.OK = self._is_request_valid(event)
 
         # Dictionary with filename matched with corresponding list of results
         self.results = {}
@@ -17,15 +95,25 @@ class GHRequest(object):
         # pycodestyle arguments
         self.extra_results = {}
 
+        # Dictionary with filename matched with the reason it was not checked
+        self.skipped_files = {}
+
+        # Set when results were dropped to stay within constants.MAX_RESULTS
+        self.truncated = False
+
+        # Set when files were left out because GitHub did not answer in time
+        self.partial = False
+
+        # Comment prepared for the pull request
+        self.pep8_comment = None
+
         # In case error occurs in the request
         self.error = None
 
         # Generic object for the pull request of payload
-        self.pull_request = self._get_pull_request(request, event)
+        self.pull_request = self._get_pull_request(event)
 
-        self._set_properties(request, event)
-
-    def _get_pull_request(self, request, event):
+    def _get_pull_request(self, event):
         """
         Get data about the pull request created
         """
@@ -33,57 +121,53 @@ class GHRequest(object):
             return None
 
         if event == "issue_comment":
-            pr_url = request.json['issue']['pull_request']['url']
+            pr_url = self.request['issue']['pull_request']['url']
             pull_request = utils.query_request(pr_url).json()
         elif event == "pull_request":
-            pull_request = request.json['pull_request']
+            pull_request = self.request['pull_request']
         else:
             return None
         return pull_request
 
-    def _is_request_valid(self, request, event):
+    def _is_request_valid(self, event):
         # A valid pull request payload can only be created or updated with commits
         if event == 'pull_request':
-            if request.json['action'] in ['synchronize', 'opened', 'reopened']:
+            if self.request['action'] in ['synchronize', 'opened', 'reopened']:
                 return True
         elif event == 'issue_comment':
-            if request.json['action'] in ('created', 'edited') and 'pull_request' in request.json['issue']:
+            if self.request['action'] in ('created', 'edited') and 'pull_request' in self.request['issue']:
                 return True
 
         return False
 
-    def _set_properties(self, request, event):
-        """
-        Set necessary properties of the object taken from the data in request.
-        """
+    @property
+    def base_branch(self):
         if not self.OK:
-            return None
+            raise AttributeError('base_branch')
+        if self.event == 'issue_comment':
+            # Commands use the config of the default branch
+            return self.request['repository']['default_branch']
+        return self.pull_request['base']['ref']
 
-        self._set_defaults(request)
-        self._set_conditionals(request, event)
-
-    def _set_defaults(self, request):
-        """
-        Set properties common to all event types.
-        """
-        self.sha = self.pull_request['head']['sha']
-        self.action = request.json['action']
-        self.author = self.pull_request['user']['login']
-        self.pr_desc = self.pull_request['body']
-        self.diff_url = self.pull_request['diff_url']
-        self.pr_title = self.pull_request['title']
-        self.pr_number = self.pull_request['number']
-        self.repository = request.json['repository']['full_name']
-        self.commits_url = self.pull_request['commits_url']
-        self.base_branch = self.pull_request['base']['ref']
-        self.after_commit_hash = self.pull_request['head']['sha']
-
-    def _set_conditionals(self, request, event):
+    def summary(self):
         """
-        Set properties which are specific to event types.
+        A compact description of the outcome, sent as the webhook response
         """
-        if event == 'issue_comment':
-            self.reviewer = request.json['comment']['user']['login']
-            self.review_url = request.json['comment']['html_url']
-            self.comment = request.json['comment']['body']
-            self.base_branch = request.json['repository']['default_branch']  # Overrides the default
+        summary = {
+            "event": self.event,
+            "OK": self.OK,
+            "error": self.error,
+            "repository": getattr(self, "repository", None),
+            "pr_number": getattr(self, "pr_number", None),
+            "action": getattr(self, "action", None),
+            "results": {filename: len(issues) for filename, issues in self.results.items()
+                        if isinstance(issues, list)},
+            "skipped_files": self.skipped_files,
+            "truncated": self.truncated,
+            "partial": self.partial,
+        }
+        for response_name in ("comment_response", "gist_response"):
+            response = getattr(self, response_name, None)
+            if isinstance(response, dict) and "html_url" in response:
+                summary[response_name.replace("_response", "_url")] = response["html_url"]
+        return summary
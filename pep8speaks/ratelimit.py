@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Keep the calls made to the GitHub API within the rate limit of the bot.
+
+The budget is tracked from the X-RateLimit-* headers of the responses.
+Essential calls (fetching files, posting comments) are paced out over the
+rest of the window once the budget runs low, instead of failing when it is
+gone. Background calls (following users, cleaning up forks) are skipped as
+soon as only the reserved part of the budget is left. A call which would
+wait past the deadline of its event raises DeadlineExceeded at once, so
+that the event still has the time to post its comment.
+"""
+import os
+import threading
+import time
+
+from pep8speaks import deadlines, metrics
+
+ESSENTIAL = "essential"
+BACKGROUND = "background"
+
+# Fraction of the budget kept for essential calls
+RESERVE = float(os.environ.get("RATE_LIMIT_RESERVE", 0.1))
+# Fraction of the budget below which essential calls are paced out
+SLOWDOWN = float(os.environ.get("RATE_LIMIT_SLOWDOWN", 0.2))
+# Longest time in seconds a single call is held back
+MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", 30))
+
+
+class RateLimitExceeded(Exception):
+    """Raised instead of making a background call the budget can not afford"""
+
+
+class RateLimiter(object):
+    def __init__(self, reserve=RESERVE, slowdown=SLOWDOWN, max_wait=MAX_WAIT,
+                 clock=time.time, sleep=time.sleep):
+        self.reserve = reserve
+        self.slowdown = slowdown
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+
+        self.limit = None
+        self.remaining = None
+        self.reset = None
+        # Set from Retry-After, when GitHub asks to stop for a while
+        self.retry_at = 0.0
+        # Next free slot when calls are being paced out
+        self.next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _plan(self, priority, now):
+        """
+        Return the seconds to wait before making a call, or None to skip it
+        """
+        if self.reset is not None and now >= self.reset:
+            # A new window has started, its budget is known on the next response
+            self.limit = self.remaining = self.reset = None
+
+        start = max(now, self.retry_at)
+        if self.remaining is not None:
+            if priority == BACKGROUND and self.remaining <= self.limit * self.reserve:
+                return None
+            if self.remaining <= 0:
+                start = max(start, self.reset)
+            elif self.remaining <= self.limit * self.slowdown:
+                interval = (self.reset - now) / self.remaining
+                start = max(start, self.next_slot)
+                self.next_slot = start + interval
+            # Count the call now so that concurrent callers see it
+            self.remaining -= 1
+
+        wait = start - now
+        if priority == BACKGROUND and wait > self.max_wait:
+            return None
+        return wait
+
+    def acquire(self, priority=ESSENTIAL):
+        """
+        Block until a call of the given priority may be made.
+        Raise RateLimitExceeded if a background call should not be made.
+        """
+        with self._lock:
+            wait = self._plan(priority, self.clock())
+        if wait is None:
+            metrics.increment(metrics.RATE_LIMITED_CALLS, priority=priority, outcome="skipped")
+            raise RateLimitExceeded("Not enough GitHub API budget left for a {} call".format(priority))
+        if wait > 0:
+            # Essential calls go ahead after max_wait and let GitHub decide
+            wait = min(wait, self.max_wait)
+            left = deadlines.remaining()
+            if left is not None:
+                # Before the time kept for the comment, wait at most until it starts
+                if left > deadlines.COMMENT_RESERVE:
+                    left -= deadlines.COMMENT_RESERVE
+                if wait >= left:
+                    metrics.increment(metrics.RATE_LIMITED_CALLS, priority=priority,
+                                      outcome="out_of_time")
+                    raise deadlines.DeadlineExceeded(
+                        "Waiting {:.1f} seconds for the rate limit would pass the deadline".format(wait))
+            metrics.increment(metrics.RATE_LIMITED_CALLS, priority=priority, outcome="delayed")
+            metrics.observe(metrics.RATE_LIMIT_WAIT, wait, priority=priority)
+            self.sleep(wait)
+
+    def update(self, response):
+        """
+        Track the budget from the headers of a response. Return the seconds
+        to wait before retrying if GitHub sent a Retry-After, else None.
+        """
+        headers = getattr(response, "headers", None)
+        if not headers:
+            return None
+
+        with self._lock:
+            try:
+                # GraphQL and search calls have budgets of their own
+                resource = headers.get("X-RateLimit-Resource", "core")
+                if resource == "core" and "X-RateLimit-Remaining" in headers:
+                    self.remaining = int(headers["X-RateLimit-Remaining"])
+                    self.limit = int(headers.get("X-RateLimit-Limit", self.limit or 5000))
+                    self.reset = float(headers.get("X-RateLimit-Reset", self.clock() + 3600))
+            except (TypeError, ValueError):
+                pass
+
+            retry_after = headers.get("Retry-After")
+            if retry_after is None or response.status_code not in (403, 429):
+                return None
+            try:
+                retry_after = float(retry_after)
+            except ValueError:
+                return None
+            self.retry_at = max(self.retry_at, self.clock() + retry_after)
+            return retry_after
+
+
+limiter = RateLimiter()
+
+# Limiters of the installations of the GitHub App, each has its own budget
+_installation_limiters = {}
+_installation_lock = threading.Lock()
+
+
+def limiter_for(installation_id=None):
+    """Return the limiter of an installation, or the one of the bot user for None"""
+    if installation_id is None:
+        return limiter
+    with _installation_lock:
+        if installation_id not in _installation_limiters:
+            _installation_limiters[installation_id] = RateLimiter()
+        return _installation_limiters[installation_id]
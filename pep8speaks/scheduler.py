@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+"""
+Separate lanes for the work done on webhooks.
+
+Interactive commands (@pep8speaks suggest diff, pep8ify) have a reviewer
+waiting for the reply, while the automatic checks of pull requests can come
+in bursts, e.g. when a repository is rebased. Each kind of work has its own
+lane with its own number of slots, so that a backlog of checks never delays
+a command. A lane runs the work in threads of its own once a slot is free,
+so the threads serving requests only queue it and never wait for a slot:
+the webhook is answered with 202 and a sync gunicorn worker is free for the
+next one. Work still queued when the process stops is lost, JOB_QUEUE keeps
+it in the database instead.
+
+Within a lane, the free slots are shared fairly between the tenants (the
+installations of the app) instead of going to the work which came first:
+a tenant with a burst of events waits behind its own backlog, not in front
+of the others. Tenants can be given a larger share with TENANT_WEIGHTS, and
+the work of a single repository or tenant can be capped to some slots.
+The lanes, their shares and caps are those of one process: with N web
+processes a repository may have N times REPO_MAX_WORKERS checks running,
+and the JOB_QUEUE workers do not go through the lanes at all.
+"""
+import collections
+import concurrent.futures
+import functools
+import logging
+import os
+import threading
+import time
+
+from pep8speaks import metrics
+
+
+class LaneFull(Exception):
+    """Raised when too much work is already waiting for a lane"""
+
+
+def parse_weights(text):
+    """Parse "tenant:weight,tenant:weight" into a dictionary"""
+    weights = {}
+    for item in (text or "").split(","):
+        if item.strip():
+            tenant, _, weight = item.rpartition(":")
+            weights[tenant.strip()] = float(weight)
+    return weights
+
+
+# Share of the slots of each tenant, 1 for those not listed
+TENANT_WEIGHTS = parse_weights(os.environ.get("TENANT_WEIGHTS"))
+# Slots a single repository or tenant may use at the same time, 0 for no cap
+REPO_MAX_WORKERS = int(os.environ.get("REPO_MAX_WORKERS", 2))
+TENANT_MAX_WORKERS = int(os.environ.get("TENANT_MAX_WORKERS", 0))
+
+
+class _Waiter(object):
+    __slots__ = ('tenant', 'repo', 'call', 'future', 'queued_at')
+
+    def __init__(self, tenant, repo, call, queued_at):
+        self.tenant = tenant
+        self.repo = repo
+        self.call = call
+        self.future = concurrent.futures.Future()
+        self.queued_at = queued_at
+
+
+class Lane(object):
+    """
+    At most `workers` calls run at the same time, and at most `max_queue`
+    more wait for a slot. `target` is the latency in seconds the lane aims
+    for, calls above it are counted as missed.
+
+    Free slots go to the waiting tenant with the smallest virtual time,
+    which grows by 1 / weight for each call it is given (start-time fair
+    queuing). A tenant which was idle starts again from the virtual time of
+    the lane, so it neither saves up a share nor waits for the backlog of
+    the others. Calls of a repository or tenant over its cap wait even when
+    slots are free.
+    """
+    def __init__(self, name, workers, max_queue, target, weights=None,
+                 repo_cap=0, tenant_cap=0, clock=time.perf_counter):
+        self.name = name
+        self.workers = workers
+        self.max_queue = max_queue
+        self.target = target
+        self.weights = weights if weights is not None else {}
+        self.repo_cap = repo_cap
+        self.tenant_cap = tenant_cap
+        self.clock = clock
+        self.waiting = 0
+        self.running = 0
+
+        self._cond = threading.Condition()
+        self._queues = collections.OrderedDict()  # Tenant: waiters in arrival order
+        self._virtual_time = {}  # Tenant: virtual time of its next call
+        self._lane_time = 0.0  # Virtual time of the last call given a slot
+        self._running_repos = collections.Counter()
+        self._running_tenants = collections.Counter()
+        self._executor = None  # Started on first use, with a thread per slot
+
+    def submit(self, func, *args, tenant=None, repo=None, **kwargs):
+        """
+        Queue func for the tenant and repo, and return a Future of its
+        result. It is called in a thread of the lane once a slot is free.
+        """
+        with self._cond:
+            if self.waiting >= self.max_queue:
+                metrics.increment(metrics.LANE_REJECTED, lane=self.name)
+                raise LaneFull("{} calls are already waiting in the {} lane".format(
+                    self.waiting, self.name))
+            waiter = _Waiter(tenant, repo, functools.partial(func, *args, **kwargs),
+                             self.clock())
+            if tenant not in self._queues:
+                self._queues[tenant] = collections.deque()
+                self._virtual_time[tenant] = max(self._virtual_time.get(tenant, 0.0),
+                                                 self._lane_time)
+            self._queues[tenant].append(waiter)
+            self.waiting += 1
+            self._dispatch()
+        return waiter.future
+
+    def run(self, func, *args, tenant=None, repo=None, **kwargs):
+        """Call func once a slot is free for the tenant and repo, and return its result"""
+        return self.submit(func, *args, tenant=tenant, repo=repo, **kwargs).result()
+
+    def join(self, timeout=None):
+        """Wait until no call is waiting or running, return False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self.waiting and not self.running,
+                                       timeout)
+
+    def _call(self, waiter):
+        started_at = self.clock()
+        try:
+            outcome = waiter.call()
+        except BaseException as exc:
+            logging.exception("Work in the %s lane failed", self.name)
+            outcome, failed = exc, True
+        else:
+            failed = False
+        finished_at = self.clock()
+        queue_wait = started_at - waiter.queued_at
+        metrics.observe(metrics.LANE_QUEUE_WAIT, queue_wait, lane=self.name)
+        metrics.observe(metrics.TENANT_QUEUE_WAIT, queue_wait,
+                        lane=self.name, tenant=str(waiter.tenant))
+        metrics.observe(metrics.LANE_SERVICE_TIME, finished_at - started_at, lane=self.name)
+        if finished_at - waiter.queued_at > self.target:
+            metrics.increment(metrics.LANE_TARGET_MISSED, lane=self.name)
+
+        # The callbacks of the future run before the slot is free, so that
+        # join() also waits for them
+        try:
+            if failed:
+                waiter.future.set_exception(outcome)
+            else:
+                waiter.future.set_result(outcome)
+        finally:
+            with self._cond:
+                self.running -= 1
+                self._running_repos[waiter.repo] -= 1
+                self._running_tenants[waiter.tenant] -= 1
+                if self._running_repos[waiter.repo] <= 0:
+                    del self._running_repos[waiter.repo]
+                if self._running_tenants[waiter.tenant] <= 0:
+                    del self._running_tenants[waiter.tenant]
+                self._dispatch()
+
+    def _eligible(self, waiter):
+        if self.repo_cap and waiter.repo is not None and \
+                self._running_repos[waiter.repo] >= self.repo_cap:
+            return False
+        if self.tenant_cap and waiter.tenant is not None and \
+                self._running_tenants[waiter.tenant] >= self.tenant_cap:
+            return False
+        return True
+
+    def _dispatch(self):
+        """Give the free slots to the waiters next in line, with the condition held"""
+        while self.running < self.workers:
+            best = None
+            for tenant, queue in self._queues.items():
+                if best is not None and self._virtual_time[tenant] >= self._virtual_time[best[0]]:
+                    continue
+                waiter = next((w for w in queue if self._eligible(w)), None)
+                if waiter is not None:
+                    best = tenant, waiter
+            if best is None:
+                break
+
+            tenant, waiter = best
+            queue = self._queues[tenant]
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[tenant]
+            self._lane_time = self._virtual_time[tenant]
+            self._virtual_time[tenant] += 1.0 / self.weights.get(str(tenant), 1.0)
+
+            self.waiting -= 1
+            self.running += 1
+            self._running_repos[waiter.repo] += 1
+            self._running_tenants[tenant] += 1
+            if self._executor is None:
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="lane-" + self.name)
+            self._executor.submit(self._call, waiter)
+
+        if not self.waiting and not self.running:
+            self._cond.notify_all()
+        # Forget the tenants which would start from the lane time anyway
+        if len(self._virtual_time) > 2 * len(self._queues) + 100:
+            self._virtual_time = {
+                tenant: virtual_time for tenant, virtual_time in self._virtual_time.items()
+                if tenant in self._queues or virtual_time > self._lane_time}
+
+
+interactive = Lane(
+    "interactive",
+    workers=int(os.environ.get("INTERACTIVE_WORKERS", 4)),
+    max_queue=int(os.environ.get("INTERACTIVE_QUEUE", 50)),
+    target=float(os.environ.get("INTERACTIVE_TARGET", 5)),
+    weights=TENANT_WEIGHTS,
+)
+
+background = Lane(
+    "background",
+    workers=int(os.environ.get("BACKGROUND_WORKERS", 4)),
+    max_queue=int(os.environ.get("BACKGROUND_QUEUE", 200)),
+    target=float(os.environ.get("BACKGROUND_TARGET", 60)),
+    weights=TENANT_WEIGHTS,
+    repo_cap=REPO_MAX_WORKERS,
+    tenant_cap=TENANT_MAX_WORKERS,
+)
+
+# Lane of the events which do more than answer the webhook
+EVENT_LANES = {
+    "issue_comment": interactive,
+    "pull_request": background,
+}
+
+
+def tenant_of(payload):
+    """
+    Return the tenant and repository of a webhook payload. The tenant is the
+    installation of the app, or the owner of the repository without one.
+    """
+    if not isinstance(payload, dict):
+        return None, None
+    repo = (payload.get("repository") or {}).get("full_name")
+    installation_id = (payload.get("installation") or {}).get("id")
+    if installation_id is not None:
+        return str(installation_id), repo
+    return (repo.split("/")[0] if repo else None), repo
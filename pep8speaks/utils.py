@@ -1,40 +1,129 @@
-import collections
+import collections.abc
 import fnmatch
+import functools
 import hmac
 import json
 import os
+import re
+import time
+import urllib.parse as urlparse
 
 from flask import abort
 from flask import Response as FResponse
-import requests
-from pep8speaks.constants import AUTH, BASE_URL
+from pep8speaks import appauth, circuitbreaker, deadlines, metrics, ratelimit
+from pep8speaks.constants import BASE_URL
 
+try:  # Optional, parses the webhook payloads several times faster
+    import orjson
+except ImportError:
+    orjson = None
 
-def query_request(query=None, method="GET", **kwargs):
+# Headers of the signatures of the payload sent by GitHub, the strongest first
+SIGNATURE_HEADERS = ("X-Hub-Signature-256", "X-Hub-Signature")
+
+
+def query_request(query=None, method="GET", priority=ratelimit.ESSENTIAL, **kwargs):
     """
     Queries like /repos/:id needs to be appended to the base URL,
     Queries like https://raw.githubusercontent.com need not.
 
+    Calls to the GitHub API go through the rate limiter. Pass
+    priority=ratelimit.BACKGROUND for calls which can be skipped when the
+    budget runs low, they raise ratelimit.RateLimitExceeded instead.
+
+    Unless a timeout is given, the call times out before the deadline of the
+    event. Calls to a failing host raise circuitbreaker.CircuitOpen.
+
+    Unless an auth is given, the call is made with the token of the
+    installation of the event when running as a GitHub App, see
+    pep8speaks.appauth, and with constants.AUTH otherwise.
+
     full list of kwargs see http://docs.python-requests.org/en/master/api/#requests.request
     """
 
     if query[0] == "/":
         query = BASE_URL + query
 
-    request_kwargs = {
-        "auth": AUTH,
-    }
+    installation_id = None
+    if "auth" in kwargs:
+        request_kwargs = {}
+    else:
+        auth, installation_id = appauth.credentials()
+        request_kwargs = {"auth": auth}
     request_kwargs.update(**kwargs)
-    return requests.request(method, query, **request_kwargs)
+
+    if not query.startswith(BASE_URL):  # Not counted against the rate limit
+        return _send_request(method, query, request_kwargs)
+
+    limiter = ratelimit.limiter_for(installation_id)
+    limiter.acquire(priority)
+    response = _send_request(method, query, request_kwargs)
+    retry_after = limiter.update(response)
+    if retry_after is not None and priority == ratelimit.ESSENTIAL:
+        # Secondary rate limit, wait as asked and try once more
+        limiter.acquire(priority)
+        response = _send_request(method, query, request_kwargs)
+        limiter.update(response)
+    return response
+
+
+def _send_request(method, query, request_kwargs):
+    import requests
+
+    host = urlparse.urlparse(query).netloc
+    request_kwargs = dict(request_kwargs)
+    if "timeout" not in request_kwargs:
+        # Before the circuit is asked, this raises when no time is left
+        request_kwargs["timeout"] = deadlines.timeout()
+    circuitbreaker.breaker.before(host)
+
+    start = time.perf_counter()
+    status = "error"
+    try:
+        response = requests.request(method, query, **request_kwargs)
+        status = response.status_code
+    except requests.exceptions.RequestException:
+        circuitbreaker.breaker.failure(host)
+        raise
+    finally:
+        metrics.record_request(method, query, status, time.perf_counter() - start)
+        if status == "error":
+            # Unless recorded as a failure, let another trial through
+            circuitbreaker.breaker.cancel(host)
+
+    if status >= 500:
+        circuitbreaker.breaker.failure(host)
+    else:
+        circuitbreaker.breaker.success(host)
+    return response
+
+
+def unavailable_errors():
+    """
+    Return the exceptions raised by query_request when GitHub could not
+    answer in time: timeouts, connection errors, open circuits and passed
+    deadlines
+    """
+    import requests
+
+    return (requests.exceptions.RequestException, circuitbreaker.CircuitOpen,
+            deadlines.DeadlineExceeded)
 
 
 def Response(data=None, status=200, mimetype='application/json'):
     if data is None:
         data = {}
-    response_object = json.dumps(data, default=lambda obj: obj.__dict__)
+    response_object = json.dumps(data, default=_json_default)
     return FResponse(response_object, status=status, mimetype=mimetype)
 
 
+def _json_default(obj):
+    """Serialize objects by their summary if they have one"""
+    if hasattr(obj, "summary"):
+        return obj.summary()
+    return obj.__dict__
+
+
 def update_dict(base, head):
     """
     Recursively merge or update dict-like objects.
@@ -44,8 +133,8 @@ def update_dict(base, head):
     """
     for key, value in head.items():
         if key in base:
-            if isinstance(base, collections.Mapping):
-                if isinstance(value, collections.Mapping):
+            if isinstance(base, collections.abc.Mapping):
+                if isinstance(value, collections.abc.Mapping):
                     base[key] = update_dict(base.get(key, {}), value)
                 else:
                     base[key] = head[key]
@@ -54,47 +143,84 @@ def update_dict(base, head):
     return base
 
 
+def json_loads(data):
+    """Parse a JSON document from bytes or str, with orjson if it is installed"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
 def match_webhook_secret(request):
-    """Match the webhook secret sent from GitHub"""
+    """
+    Match the webhook secret sent from GitHub. The HMAC is computed over the
+    raw body, with SHA-256 when GitHub sends X-Hub-Signature-256.
+    """
     if os.environ.get("OVER_HEROKU", False):
-        if ('X-Hub-Signature' in request.headers and
-           request.headers.get('X-Hub-Signature') is not None):
-            header_signature = request.headers.get('X-Hub-Signature', None)
-        else:
+        header_signature = None
+        for header in SIGNATURE_HEADERS:
+            header_signature = request.headers.get(header)
+            if header_signature is not None:
+                break
+        if header_signature is None:
             abort(403)
-        sha_name, signature = header_signature.split('=')
-        if sha_name != 'sha1':
+        sha_name, _, signature = header_signature.partition('=')
+        if sha_name not in ('sha256', 'sha1'):
             abort(501)
 
         mac = hmac.new(os.environ["GITHUB_PAYLOAD_SECRET"].encode(),
                        msg=request.data,
-                       digestmod="sha1")
+                       digestmod=sha_name)
 
-        if not hmac.compare_digest(str(mac.hexdigest()), str(signature)):
+        if not hmac.compare_digest(mac.hexdigest(), signature):
             abort(403)
     return True
 
 
-def filename_match(filename, patterns):
+class PatternMatcher(object):
     """
-    Check if patterns contains a pattern that matches filename.
+    Match filenames against exclude patterns, compiled once.
+    All the fnmatch patterns are combined into a single regex and the
+    simple names of files or directories are kept in a set.
     """
+    def __init__(self, patterns):
+        regexes = []
+        self.names = set()
+        for pattern in patterns:
+            # `dir/*` works but `dir/` does not
+            if pattern[-1:] == '/':
+                pattern += '*'
+            regexes.append(fnmatch.translate(os.path.normcase(pattern)))
+            if '/' not in pattern:
+                self.names.add(pattern)
+        self.regex = re.compile('|'.join(regexes)) if regexes else None
+
+    def __call__(self, filename):
+        # filename has a leading `/` which confuses fnmatch
+        filename = filename.lstrip('/')
+
+        # Pattern is a fnmatch compatible regex
+        if self.regex is not None and self.regex.match(os.path.normcase(filename)):
+            return True
 
-    # `dir/*` works but `dir/` does not
-    for index in range(len(patterns)):
-        if patterns[index][-1] == '/':
-            patterns[index] += '*'
+        # Pattern is a simple name of file or directory (not caught by fnmatch)
+        return not self.names.isdisjoint(filename.split('/'))
 
-    # filename has a leading `/` which confuses fnmatch
-    filename = filename.lstrip('/')
 
-    # Pattern is a fnmatch compatible regex
-    if any(fnmatch.fnmatch(filename, pattern) for pattern in patterns):
-        return True
+@functools.lru_cache(maxsize=128)
+def _compile_patterns(patterns):
+    return PatternMatcher(patterns)
 
-    # Pattern is a simple name of file or directory (not caught by fnmatch)
-    for pattern in patterns:
-        if '/' not in pattern and pattern in filename.split('/'):
-            return True
 
-    return False
+def compile_patterns(patterns):
+    """
+    Return the PatternMatcher of a list of patterns, cached for the
+    configurations seen recently.
+    """
+    return _compile_patterns(tuple(patterns))
+
+
+def filename_match(filename, patterns):
+    """
+    Check if patterns contains a pattern that matches filename.
+    """
+    return compile_patterns(patterns)(filename)
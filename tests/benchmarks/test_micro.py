@@ -0,0 +1,26 @@
+import pytest
+from benchmarks.micro import BENCHMARKS, check, scaling_exponent
+
+
+class TestMicro:
+    @pytest.mark.parametrize('timings, expected', [
+        ({"1": 0.0001, "10": 0.0002}, None),
+        ({"10": 0.01, "100": 0.1}, 1.0),
+        ({"10": 0.01, "100": 1.0}, 2.0),
+    ])
+    def test_scaling_exponent(self, timings, expected):
+        exponent = scaling_exponent(timings)
+        if expected is None:
+            assert exponent is None
+        else:
+            assert exponent == pytest.approx(expected)
+
+    def test_check(self):
+        results = {"stage": {"10": 0.01, "100": 0.1}}
+        assert check(results) == []
+        assert check(results, {"stage": {"10": 0.01, "100": 0.05}}) != []
+        assert check({"stage": {"10": 0.01, "100": 1.0}}) != []
+
+    @pytest.mark.parametrize('name', list(BENCHMARKS))
+    def test_benchmarks_run(self, name):
+        BENCHMARKS[name](10)()
@@ -0,0 +1,41 @@
+from benchmarks.fake_github import synthetic_files
+from benchmarks.parity import DEFAULT_CONFIG, load_corpus, main, parity
+from pep8speaks import backends
+
+
+def _corpus(tmpdir):
+    for path, content in synthetic_files(2, lines=3).items():
+        tmpdir.join(path).write(content, ensure=True)
+    tmpdir.join("strict.yml").write("pycodestyle:\n  max-line-length: 20\n")
+    tmpdir.join("README.md").write("Not a Python file\n")
+    return str(tmpdir)
+
+
+class TestParity:
+    def test_load_corpus(self, tmpdir):
+        files, configs = load_corpus(_corpus(tmpdir))
+        assert list(files) == ["pkg/module_0.py", "pkg/module_1.py"]
+        assert list(configs) == [DEFAULT_CONFIG, "strict.yml"]
+        assert configs[DEFAULT_CONFIG] is None
+
+    def test_parity(self, tmpdir):
+        files, configs = load_corpus(_corpus(tmpdir))
+        report = parity(files, configs)
+        assert report["mismatches"] == []
+        assert set(report["speedups"]["inprocess"]) == {"lint", "fix"}
+        assert report["files"]["pkg/module_0.py"]["lint"]["inprocess"] > 0
+
+    def test_mismatch(self, tmpdir, monkeypatch):
+        def lint_nothing(path, config, encoding=None, max_lines=None, timeout=None, keep=None):
+            return [], True
+        monkeypatch.setitem(backends.LINTERS, "broken", lint_nothing)
+        monkeypatch.setitem(backends.FIXERS, "broken", backends.fix_inprocess)
+
+        files, configs = load_corpus(_corpus(tmpdir))
+        report = parity(files, configs, backends=["broken"])
+        fields = {(mismatch["field"], mismatch["file"]) for mismatch in report["mismatches"]}
+        assert ("results", None) in fields
+        assert ("comment", None) in fields
+        assert ("lint", "pkg/module_0.py") in fields
+        assert not any(field == "fix" for field, _ in fields)
+        assert main([str(tmpdir), "--backend", "broken", "--repeat", "1"]) == 1
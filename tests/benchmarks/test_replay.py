@@ -0,0 +1,54 @@
+import pytest
+import requests
+from benchmarks.fake_github import FakeGitHub, make_diff
+from benchmarks.replay import compare, percentile, replay
+
+
+class TestFakeGitHub:
+    def test_serves_raw_files_and_diff(self):
+        files = {"pkg/a.py": "x=1\n"}
+        with FakeGitHub(files=files) as github:
+            r = requests.get(github.url + "/raw/o/r/sha//pkg/a.py")
+            assert r.text == "x=1\n"
+            r = requests.get(github.url + "/repos/o/r/pulls/1",
+                             headers={"Accept": "application/vnd.github.VERSION.diff"})
+            assert r.text == make_diff(files)
+            r = requests.get(github.url + "/raw/o/r/master/.pep8speaks.yml")
+            assert r.status_code == 404
+
+    def test_rate_limit_headers(self):
+        with FakeGitHub(rate_limit=2) as github:
+            url = github.url + "/repos/o/r/issues/1/comments"
+            r = requests.get(url)
+            assert r.headers["X-RateLimit-Remaining"] == "1"
+            assert requests.get(url).status_code == 200
+            assert requests.get(url).status_code == 403
+            assert github.total_calls == 3
+
+    def test_error_injection(self):
+        with FakeGitHub(error_rate=1.0) as github:
+            assert requests.get(github.url + "/gists").status_code == 502
+
+
+class TestReplay:
+    @pytest.mark.parametrize('values, fraction, expected', [
+        ([], 0.5, 0.0),
+        ([3, 1, 2], 0.5, 2),
+        (list(range(1, 101)), 0.95, 95),
+        (list(range(1, 101)), 0.99, 99),
+    ])
+    def test_percentile(self, values, fraction, expected):
+        assert percentile(values, fraction) == expected
+
+    def test_replay(self):
+        report = replay(events=4, concurrency=2, files=1)
+        # The discussion comment is answered at once, the rest queued in lanes
+        assert report["status_codes"] == {"202": 3, "200": 1}
+        assert report["github_calls_per_event"] > 0
+        assert set(report["latency_ms"]) == {"p50", "p95", "p99", "max"}
+
+    def test_compare(self):
+        baseline = {"events_per_sec": 10.0, "github_calls_per_event": 5.0}
+        assert compare(baseline, baseline, 0.2) == []
+        report = {"events_per_sec": 7.0, "github_calls_per_event": 6.0}
+        assert len(compare(report, baseline, 0.2)) == 2
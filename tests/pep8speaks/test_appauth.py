@@ -0,0 +1,68 @@
+import threading
+import time
+import pytest
+from pep8speaks import appauth, constants, ratelimit, utils
+from pep8speaks.appauth import AuthenticationError, TokenManager
+
+
+def fake_encode(payload, private_key):
+    return "jwt-{}-{}".format(payload["iss"], private_key)
+
+
+class TestTokenManager:
+    def test_cache_and_refresh(self, github):
+        now = [time.time()]
+        tokens = TokenManager(42, "key", refresh_before=300, clock=lambda: now[0],
+                              encode=fake_encode)
+        token = tokens.token(1)
+        assert token.startswith("ghs_1_")
+        assert tokens.token(1) == token
+        assert tokens.token(2).startswith("ghs_2_")
+        assert github.calls[("POST", "/app/installations/{id}/access_tokens")] == 2
+
+        # Refreshed shortly before it expires
+        now[0] += 3600 - 299
+        assert tokens.token(1) not in (token, None)
+
+    def test_concurrent_refresh(self, github):
+        tokens = TokenManager(42, "key", encode=fake_encode)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(tokens.token(1)))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(set(results)) == 1
+        assert github.calls[("POST", "/app/installations/{id}/access_tokens")] == 1
+
+    def test_mint_error(self, github):
+        tokens = TokenManager(42, "key", encode=lambda payload, key: "")
+        with pytest.raises(AuthenticationError):
+            tokens.token(1)
+
+
+class TestCredentials:
+    def test_installation_token(self, github, mocker):
+        mocker.patch('pep8speaks.appauth.manager',
+                     return_value=TokenManager(42, "key", encode=fake_encode))
+
+        utils.query_request("/repos/o/r/pulls/1")
+        with appauth.installation(7):
+            utils.query_request("/repos/o/r/pulls/1")
+            assert ratelimit.limiter_for(7) is not ratelimit.limiter
+            # Acting as the @pep8speaks user
+            with appauth.as_user():
+                utils.query_request("/gists", method='POST')
+        assert github.authorizations == {"Basic": 2, "Bearer": 1, "token": 1}
+
+    def test_fallback(self, github, mocker):
+        tokens = TokenManager(42, "key", encode=lambda payload, key: "")
+        mocker.patch('pep8speaks.appauth.manager', return_value=tokens)
+        with appauth.installation(7):
+            assert appauth.credentials() == (constants.AUTH, None)
+
+    def test_is_bot(self):
+        assert appauth.is_bot({"id": 24736507, "login": "pep8speaks"})
+        assert appauth.is_bot({"id": 1, "login": "pep8speaks[bot]"})
+        assert not appauth.is_bot({"id": 1, "login": "octocat"})
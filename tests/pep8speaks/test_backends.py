@@ -0,0 +1,81 @@
+import os
+import pytest
+from benchmarks.fake_github import synthetic_files
+from pep8speaks import backends, helpers, metrics
+
+SOURCE = synthetic_files(1, lines=10)["pkg/module_0.py"] + (
+    "x = 'é' + \\\n  1;y=2  \n\tz=3\nimport sys\n" + "a" * 100 + "\n")
+
+CONFIGS = [
+    None,
+    "pycodestyle:\n  ignore: [E225]",
+    "pycodestyle:\n  select: [E2, W]\n  max-line-length: 100",
+    "pycodestyle:\n  show-source: true\n  show-pep8: true\n  statistics: true",
+    "pycodestyle:\n  first: true\n  hang-closing: true",
+]
+
+
+@pytest.fixture
+def source_file(tmpdir):
+    def write(name):
+        path = os.path.join(str(tmpdir), name)
+        with open(path, "w", encoding="utf-8") as py_file:
+            py_file.write(SOURCE)
+        return path
+    return write
+
+
+class TestBackends:
+    @pytest.mark.parametrize('config_text', CONFIGS)
+    def test_lint_parity(self, source_file, config_text):
+        config = helpers.parse_config(config_text)
+        path = source_file("file_to_check.py")
+        expected = backends.lint_subprocess(path, config, "utf-8")
+        assert expected[0]
+        assert backends.lint_inprocess(path, config, "utf-8") == expected
+        assert backends.lint_inprocess(path, config, "utf-8", max_lines=3) == \
+            backends.lint_subprocess(path, config, "utf-8", max_lines=3)
+        keep = helpers.added_errors([11, 12])
+        assert backends.lint_inprocess(path, config, "utf-8", max_lines=3, keep=keep) == \
+            backends.lint_subprocess(path, config, "utf-8", max_lines=3, keep=keep)
+
+    @pytest.mark.parametrize('config_text', CONFIGS)
+    def test_fix_parity(self, source_file, config_text):
+        config = helpers.parse_config(config_text)
+        path = source_file("file_to_fix.py")
+        expected = backends.fix_subprocess(path, config, "utf-8")
+        assert expected != SOURCE
+        assert backends.fix_inprocess(path, config, "utf-8") == expected
+
+    def test_checks_of_pycodestyle_only(self):
+        # autopep8 registers checks of its own once imported
+        checks = backends._CHECKS["logical_line"]
+        assert all(check.__module__ == "pycodestyle" for check in checks)
+        assert any(check.__name__ == "continued_indentation" for check in checks)
+
+    def test_unsupported_pycodestyle(self, source_file, monkeypatch):
+        monkeypatch.setattr(backends, '_CHECKS', None)
+        config = helpers.parse_config()
+        with pytest.raises(RuntimeError):
+            backends.lint_inprocess(source_file("file_to_check.py"), config, "utf-8")
+
+    def test_shadow_lint(self, source_file, monkeypatch):
+        monkeypatch.setattr(metrics, 'ENABLED', True)
+        metrics.reset()
+        config = helpers.parse_config()
+        path = source_file("file_to_check.py")
+        output, complete = backends.lint_subprocess(path, config, "utf-8")
+
+        assert backends.shadow_lint("a.py", path, config, "utf-8", 100, output, complete,
+                                    backend="") is None
+        assert backends.shadow_lint("a.py", path, config, "utf-8", 100, output, complete,
+                                    backend="inprocess", sample=0) is None
+        assert backends.shadow_lint("a.py", path, config, "utf-8", 100, output, complete,
+                                    backend="inprocess", sample=1) is True
+        assert backends.shadow_lint("a.py", path, config, "utf-8", 100, output[1:], complete,
+                                    backend="inprocess", sample=1) is False
+
+        rendered = metrics.render()
+        assert 'pep8speaks_lint_shadow_total{backend="inprocess",result="match"} 1' in rendered
+        assert 'pep8speaks_lint_shadow_total{backend="inprocess",result="mismatch"} 1' in rendered
+        metrics.reset()
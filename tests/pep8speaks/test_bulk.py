@@ -0,0 +1,52 @@
+import json
+import pytest
+from pep8speaks import bulk
+
+GITHUB = pytest.mark.parametrize('github', [{"files": {"pkg/a.py": "import os,sys\n"}}],
+                                 indirect=True)
+
+
+class TestBulk:
+    @pytest.mark.parametrize('target, expected', [
+        ('o/r#12', ('o/r', 12)),
+        (' o/r#3\n', ('o/r', 3)),
+    ])
+    def test_parse_target(self, target, expected):
+        assert bulk.parse_target(target) == expected
+
+    @pytest.mark.parametrize('target', ['o/r', 'o#1', 'o/r#x', 'a/b/c#1'])
+    def test_parse_target_invalid(self, target):
+        with pytest.raises(ValueError):
+            bulk.parse_target(target)
+
+    @GITHUB
+    def test_dry_run(self, github):
+        target = "octocat/hello-world#1"
+        [result] = bulk.run([target], dry_run=True, processes=1)
+        assert result["target"] == target
+        assert result["results"]["pkg/a.py"] == [
+            "pkg/a.py:1:10: E231 missing whitespace after ','",
+            "pkg/a.py:1:10: E401 multiple imports on one line",
+        ]
+        assert "E401" in result["comment"]
+        assert not github.comments
+
+    @GITHUB
+    def test_broken_target(self, github):
+        [result] = bulk.run(["octocat/hello-world"], processes=1)
+        assert result["error"].startswith("ValueError")
+
+    def test_local(self, tmpdir, capsys):
+        tmpdir.join(".pep8speaks.yml").write("pycodestyle:\n    exclude:\n        - vendor/\n")
+        tmpdir.mkdir("pkg").join("a.py").write("import os,sys\n")
+        tmpdir.mkdir("vendor").join("b.py").write("import os,sys\n")
+        tmpdir.join("c.py").write("import os\n")
+
+        assert bulk.main(["--local", str(tmpdir), "--processes", "2"]) == 0
+        lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+        results = {line["file"]: line["results"] for line in lines}
+        assert results == {
+            "c.py": [],
+            "pkg/a.py": ["pkg/a.py:1:10: E231 missing whitespace after ','",
+                         "pkg/a.py:1:10: E401 multiple imports on one line"],
+        }
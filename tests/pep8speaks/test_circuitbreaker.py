@@ -0,0 +1,73 @@
+import pytest
+from pep8speaks.circuitbreaker import CircuitBreaker, CircuitOpen
+
+
+class TestCircuitBreaker:
+    def test_open_and_reset(self):
+        now = [0.0]
+        breaker = CircuitBreaker(failures=2, reset_after=30, clock=lambda: now[0])
+        breaker.before("api.github.com")
+        breaker.failure("api.github.com")
+        breaker.before("api.github.com")
+        breaker.failure("api.github.com")
+        with pytest.raises(CircuitOpen):
+            breaker.before("api.github.com")
+        # Other hosts are not affected
+        breaker.before("raw.githubusercontent.com")
+
+        # A single trial call after reset_after, which fails
+        now[0] = 30
+        breaker.before("api.github.com")
+        with pytest.raises(CircuitOpen):
+            breaker.before("api.github.com")
+        breaker.failure("api.github.com")
+        now[0] = 45
+        with pytest.raises(CircuitOpen):
+            breaker.before("api.github.com")
+
+        # A trial which succeeds closes the circuit
+        now[0] = 60
+        breaker.before("api.github.com")
+        breaker.success("api.github.com")
+        assert not breaker.is_open("api.github.com")
+        breaker.before("api.github.com")
+
+    def test_query_request(self, mocker):
+        import requests
+        from pep8speaks import utils
+        breaker = CircuitBreaker(failures=1, reset_after=30)
+        mocker.patch('pep8speaks.circuitbreaker.breaker', breaker)
+        mock_func = mocker.patch('requests.request', side_effect=requests.exceptions.ReadTimeout())
+
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            utils.query_request('https://someurl.com/file.py')
+        with pytest.raises(CircuitOpen):
+            utils.query_request('https://someurl.com/file.py')
+        assert mock_func.call_count == 1
+        assert mock_func.call_args[1]['timeout'] > 0
+
+    def test_trial_cancelled(self, mocker):
+        import requests
+        from pep8speaks import deadlines, utils
+        now = [0.0]
+        breaker = CircuitBreaker(failures=1, reset_after=30, clock=lambda: now[0])
+        mocker.patch('pep8speaks.circuitbreaker.breaker', breaker)
+        mock_func = mocker.patch('requests.request',
+                                 side_effect=requests.exceptions.ConnectTimeout())
+        with pytest.raises(requests.exceptions.ConnectTimeout):
+            utils.query_request('https://someurl.com/file.py')
+
+        # A call with no time left does not take the trial
+        now[0] = 30
+        with deadlines.deadline(0):
+            with pytest.raises(deadlines.DeadlineExceeded):
+                utils.query_request('https://someurl.com/file.py')
+        # Nor does a call which fails with something else than the host
+        mock_func.side_effect = ValueError()
+        with pytest.raises(ValueError):
+            utils.query_request('https://someurl.com/file.py')
+
+        mock_func.side_effect = None
+        mock_func.return_value = mocker.MagicMock(status_code=200, headers={})
+        assert utils.query_request('https://someurl.com/file.py').status_code == 200
+        assert not breaker.is_open("someurl.com")
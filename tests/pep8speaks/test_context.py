@@ -0,0 +1,79 @@
+import mock
+import pytest
+from pep8speaks import bulk, context, helpers
+
+CONFIG = "pycodestyle:\n    max-line-length: 100\n"
+# The same pull request, loaded over GraphQL and over REST
+GITHUB = pytest.mark.parametrize('github', [
+    {"files": {"pkg/a.py": "import os,sys\n"}, "config": CONFIG, "graphql": graphql}
+    for graphql in (True, False)
+], ids=["graphql", "rest"], indirect=True)
+
+
+class TestContext:
+    def test_parse(self):
+        data = {"repository": {
+            "pullRequest": {
+                "comments": {"nodes": [
+                    {"databaseId": 1, "body": "Hello", "author": {
+                        "__typename": "Bot", "login": "pep8speaks", "databaseId": 2}},
+                    {"databaseId": 3, "body": "@pep8speaks quiet", "author": None},
+                ]},
+                "commits": {"nodes": [{"commit": {"message": "[skip pep8]"}}]},
+            },
+            "config": None,
+        }}
+        pr_context = context.parse(data)
+        assert pr_context.comments == [
+            {"id": 1, "user": {"id": 2, "login": "pep8speaks[bot]"}, "body": "Hello"},
+            {"id": 3, "user": {"id": None, "login": "ghost"}, "body": "@pep8speaks quiet"},
+        ]
+        assert pr_context.commit_messages == ["[skip pep8]"]
+        assert pr_context.config_text is None
+        assert context.parse({"repository": None}) is None
+
+    @GITHUB
+    def test_load(self, github):
+        ghrequest = mock.MagicMock(repository="octocat/hello-world", pr_number=1,
+                                   base_branch="master")
+        pr_context = context.load(ghrequest)
+        if not github.graphql:
+            assert pr_context is None
+            return
+        assert pr_context.config_text == CONFIG
+        assert pr_context.comments == []
+        assert pr_context.commit_messages == ["Update the module"]
+
+    @pytest.mark.parametrize('github', [{"files": {}}], indirect=True)
+    def test_load_recent_comments(self, github):
+        """A recent quiet request is seen on a pull request with many comments"""
+        github.comments["/repos/octocat/hello-world/issues/1/comments"] = [
+            {"id": i, "user": {"id": 1, "login": "octocat"}, "body": "Comment {}".format(i)}
+            for i in range(150)] + [
+            {"id": 150, "user": {"id": 1, "login": "octocat"}, "body": "@pep8speaks quiet"}]
+        ghrequest = mock.MagicMock(repository="octocat/hello-world", pr_number=1,
+                                   base_branch="master")
+        pr_context = context.load(ghrequest)
+        assert len(pr_context.comments) == 100
+        assert pr_context.comments[-1]["body"] == "@pep8speaks quiet"
+        assert helpers.comment_permission_check(ghrequest, pr_context) is False
+
+    @GITHUB
+    def test_check_pull_request(self, github):
+        for _ in range(2):
+            result = bulk.check_pull_request("octocat/hello-world#1", dry_run=False)
+            assert result.get("error") is None
+        [comment] = github.comments["/repos/octocat/hello-world/issues/1/comments"]
+        assert "E401" in comment["body"]
+
+        rest_reads = [("GET", "/repos/{repo}/issues/{number}/comments"),
+                      ("GET", "/repos/{repo}/pulls/{number}/commits"),
+                      ("GET", "/raw/{repo}/{ref}/{path}")]
+        reads = sum(github.calls[route] for route in rest_reads)
+        if github.graphql:
+            # The comment is looked for again before being made the first time,
+            # and the file is downloaded from raw each time
+            assert reads == 1 + 2
+            assert github.calls[("POST", "/graphql")] == 2
+        else:
+            assert reads == 2 * 5
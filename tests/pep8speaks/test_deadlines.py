@@ -0,0 +1,19 @@
+import pytest
+from pep8speaks import deadlines
+
+
+class TestDeadlines:
+    def test_timeout(self):
+        now = [0.0]
+        assert deadlines.remaining() is None
+        assert deadlines.timeout() == deadlines.CALL_TIMEOUT
+
+        with deadlines.deadline(20, clock=lambda: now[0]):
+            assert deadlines.timeout(cap=10) == 10
+            now[0] = 15
+            assert deadlines.remaining() == 5
+            assert deadlines.timeout(cap=10) == 5
+            assert deadlines.timeout(reserve=2, cap=None) == 3
+            with pytest.raises(deadlines.DeadlineExceeded):
+                deadlines.timeout(reserve=5)
+        assert deadlines.remaining() is None
@@ -0,0 +1,67 @@
+import psycopg2
+import pytest
+from pep8speaks import deadlines
+from pep8speaks.deliveries import COMPLETED, IN_PROGRESS, DeliveryStore
+
+
+class TestDeliveryStore:
+    def test_begin_and_complete(self):
+        store = DeliveryStore(capacity=10)
+        assert store.begin("d1") is None
+        assert store.begin("d1").state == IN_PROGRESS
+
+        store.complete("d1", 200, '{"k1": "v1"}', 'application/json')
+        delivery = store.begin("d1")
+        assert delivery.state == COMPLETED
+        assert (delivery.status, delivery.body) == (200, '{"k1": "v1"}')
+
+    def test_forget(self):
+        store = DeliveryStore(capacity=10)
+        store.begin("d1")
+        store.forget("d1")
+        assert store.begin("d1") is None
+
+    def test_capacity(self):
+        store = DeliveryStore(capacity=2)
+        store.begin("d1")
+        store.begin("d2")
+        store.begin("d1")  # Recently used again
+        store.begin("d3")
+        assert store.begin("d1") is not None
+        assert store.begin("d2") is None
+
+
+class TestDeliveryStoreDatabase:
+    @pytest.fixture
+    def db(self, mocker):
+        conn = mocker.patch('pep8speaks.database.connect').return_value
+        return conn, conn.cursor.return_value.__enter__.return_value
+
+    def test_claim(self, db, mocker):
+        shared = mocker.patch('pep8speaks.database.connection')
+        conn, cursor = db
+        cursor.rowcount = 1
+        assert DeliveryStore(use_database=True).begin("d1") is None
+        assert shared.call_count == 0
+        # Inserted, or in progress for longer than the event deadline
+        query, params = cursor.execute.call_args_list[2][0]
+        assert "claimed_at < now()" in query
+        assert params == ("d1", deadlines.EVENT_DEADLINE)
+        assert conn.rollback.call_count == 0
+
+    def test_in_progress(self, db):
+        conn, cursor = db
+        cursor.rowcount = 0
+        cursor.fetchone.return_value = (None, None, None)
+        assert DeliveryStore(use_database=True).begin("d1").state == IN_PROGRESS
+
+    def test_rollback(self, db):
+        conn, cursor = db
+        cursor.execute.side_effect = psycopg2.OperationalError
+        store = DeliveryStore(use_database=True)
+        with pytest.raises(psycopg2.OperationalError):
+            store.begin("d1")
+        with pytest.raises(psycopg2.OperationalError):
+            store.complete("d1", 200, "{}", "application/json")
+        assert conn.rollback.call_count == 2
+        assert conn.commit.call_count == 0
@@ -1 +1,43 @@
-# TODO
+import mock
+import pytest
+from pep8speaks import handlers
+from pep8speaks.helpers import parse_command
+
+
+class TestHandlers:
+    @pytest.mark.parametrize('comment, expected', [
+        (None, None),
+        ('', None),
+        ('Looks good to me!', None),
+        ('@pep8speaks please have a look', None),
+        ('suggest diff', None),
+        ('@pep8speaks suggest diff', 'suggest diff'),
+        ('@PEP8Speaks suggest the diff', 'suggest diff'),
+        ('@pep8speaks pep8ify', 'pep8ify'),
+        ('Hey @pep8speaks, pep8ify', None),  # The mention has to be a word
+    ])
+    def test_parse_command(self, comment, expected):
+        assert parse_command(comment) == expected
+
+    def test_handle_issue_comment_discussion(self, mocker):
+        query_request = mocker.patch('pep8speaks.utils.query_request')
+        mocker.patch('pep8speaks.utils.Response', side_effect=lambda data: data)
+        request = mock.MagicMock(json={
+            'action': 'created',
+            'issue': {'pull_request': {'url': 'https://api.github.com/repos/o/r/pulls/1'}},
+            'comment': {'body': 'Looks good to me!'},
+        }, headers={'X-GitHub-Event': 'issue_comment'})
+
+        handlers.handle_issue_comment(request)
+        assert query_request.call_count == 0
+
+    def test_handle_issue_comment_command(self, mocker):
+        mocker.patch('pep8speaks.models.GHRequest')
+        mocker.patch('pep8speaks.helpers.get_config', return_value={})
+        create_diff = mocker.patch('pep8speaks.handlers._create_diff')
+        request = mock.MagicMock(json={
+            'comment': {'body': '@pep8speaks suggest diff'},
+        }, headers={'X-GitHub-Event': 'issue_comment'})
+
+        handlers.handle_issue_comment(request)
+        assert create_diff.call_count == 1
@@ -1 +1,238 @@
-# TODO
+import mock
+import pytest
+from benchmarks.fake_github import synthetic_files
+from pep8speaks import deadlines, helpers, lintcache
+from pep8speaks.helpers import (download_file, filter_pycodestyle_output, prepare_comment,
+                                run_pycodestyle, _added_lines, _read_output)
+
+# The diff of the PR is too large for GitHub
+LARGE_PR = {"files": synthetic_files(320, lines=3), "max_diff_files": 300}
+LARGE_PR["files"]["docs/index.rst"] = "Title\n=====\n"
+MIXED_PR = {"files": synthetic_files(3, lines=3)}
+MIXED_PR["files"]["pkg/clean.py"] = "import os\n\nprint(os.sep)\n"
+
+
+class TestHelpers:
+    @pytest.mark.parametrize('output, added_lines, diff_only, expected', [
+        ([], [], False, ([], [])),
+        (["file_to_check.py:1:1: E265 block comment should start with '# '"],
+         [], False,
+         (["a/b.py:1:1: E265 block comment should start with '# '"], [])),
+        (["file_to_check.py:1:1: E265 block comment should start with '# '",
+          "file_to_check.py:3:80: E501 line too long (90 > 79 characters)"],
+         [3], True,
+         (["a/b.py:3:80: E501 line too long (90 > 79 characters)"], [])),
+        (["file_to_check.py:2:1: W391 blank line at end of file",
+          "1       W391 blank line at end of file"],
+         [], False,
+         (["a/b.py:2:1: W391 blank line at end of file"],
+          ["1       W391 blank line at end of file"])),
+    ])
+    def test_filter_pycodestyle_output(self, output, added_lines, diff_only, expected):
+        assert filter_pycodestyle_output("a/b.py", output, added_lines, diff_only) == expected
+
+    @pytest.mark.parametrize('chunks, length, max_size, expected', [
+        ([b'abc', b'def'], None, 10, True),
+        ([b'abc', b'def'], None, 4, False),
+        ([b'abc', b'def'], '6', 4, False),
+        ([], '0', 4, True),
+    ])
+    def test_download_file(self, mocker, tmpdir, chunks, length, max_size, expected):
+        headers = {} if length is None else {'Content-Length': length}
+        response = mock.MagicMock(headers=headers)
+        response.iter_content.return_value = iter(chunks)
+        mocker.patch('pep8speaks.utils.query_request', return_value=response)
+
+        path = str(tmpdir.join('file_to_check.py'))
+        r, complete = download_file('https://someurl.com', path, max_size=max_size)
+        assert complete is expected
+        assert response.close.call_count == 1
+        if expected:
+            assert open(path, 'rb').read() == b''.join(chunks)
+
+    def test_prepare_comment_skipped_files(self, mocker):
+        mocker.patch('pep8speaks.constants.MAX_RESULTS', 10)
+        ghrequest = mock.MagicMock(
+            action='synchronize', author='octocat', results={}, extra_results={},
+            skipped_files={'big.py': 'it is larger than 1024 KB'}, truncated=True, partial=True,
+            links={'big.py_link': 'https://github.com/o/r/blob/sha/big.py'})
+        config = {
+            "message": {"no_errors": "", "updated": {"header": "", "footer": ""}},
+            "only_mention_files_with_errors": True,
+            "descending_issues_order": False,
+        }
+        _, body, _, error = prepare_comment(ghrequest, config)
+        assert error is False
+        assert ("The file [`big.py`](https://github.com/o/r/blob/sha/big.py) "
+                "was not checked, it is larger than 1024 KB.") in body
+        assert "Only the first 10 issues are reported." in body
+        assert body.startswith("**Partial results:**")
+
+    def test_run_pycodestyle_partial(self, mocker):
+        import requests
+        mocker.patch('pep8speaks.helpers.get_py_files_in_pr', return_value={
+            '/a.py': [1], '/b.py': [1], '/c.py': [1]})
+        download = mocker.patch('pep8speaks.helpers.download_file', side_effect=[
+            requests.exceptions.ConnectTimeout(), deadlines.DeadlineExceeded()])
+        ghrequest = mock.MagicMock(results={}, extra_results={}, skipped_files={},
+                                   partial=False, repository='o/r', pr_number=1)
+        config = {"pycodestyle": {"exclude": []}, "scanner": {"diff_only": False},
+                  "pycodestyle_cmd_config": " "}
+
+        run_pycodestyle(ghrequest, config)
+        assert ghrequest.partial is True
+        assert ghrequest.skipped_files == {
+            'a.py': 'it could not be downloaded from GitHub',
+            'b.py': 'the time to check the pull request ran out',
+            'c.py': 'the time to check the pull request ran out',
+        }
+        # No more calls once the time ran out
+        assert download.call_count == 2
+
+    @pytest.mark.parametrize('github', [{"files": {"a.py": "x=1\n" * 30 + "y=2\n"}}],
+                             indirect=True)
+    def test_run_pycodestyle_diff_only_budget(self, github, mocker):
+        """The errors on lines the PR did not add never use up the budget"""
+        mocker.patch('pep8speaks.constants.MAX_RESULTS', 10)
+        mocker.patch('pep8speaks.helpers.get_py_files_in_pr', return_value={'/a.py': [31]})
+        ghrequest = mock.MagicMock(results={}, extra_results={}, skipped_files={},
+                                   partial=False, truncated=False, repository='octocat/hello-world',
+                                   pr_number=1, after_commit_hash='abc')
+        config = helpers.parse_config()
+        config["scanner"]["diff_only"] = True
+
+        run_pycodestyle(ghrequest, config)
+        assert ghrequest.results == {
+            'a.py': ['a.py:31:2: E225 missing whitespace around operator']}
+        assert ghrequest.truncated is False
+
+    @pytest.mark.parametrize('github', [{"files": {"a.py": "x=1\n" * 30, "b.py": "x = 1\n"}}],
+                             indirect=True)
+    def test_run_pycodestyle_truncated_not_cached(self, github, mocker):
+        """A file cut by the budget is not remembered as clean for the fixers"""
+        mocker.patch('pep8speaks.constants.MAX_RESULTS', 10)
+        mocker.patch('pep8speaks.helpers.get_py_files_in_pr',
+                     return_value={'/b.py': [1], '/a.py': [31]})
+        ghrequest = mock.MagicMock(results={}, extra_results={}, skipped_files={},
+                                   partial=False, truncated=False, repository='octocat/hello-world',
+                                   pr_number=1, after_commit_hash='abc')
+        config = helpers.parse_config()
+
+        run_pycodestyle(ghrequest, config)
+        assert ghrequest.truncated is True
+        assert lintcache.store.get('octocat/hello-world', 'abc',
+                                   config["pycodestyle_cmd_config"]) == {'b.py': False}
+
+    def test_read_output_timeout(self):
+        with pytest.raises(deadlines.DeadlineExceeded):
+            _read_output('sleep 5', None, None, 10, timeout=0.1)
+        assert _read_output('echo ok', None, None, 10, timeout=5) == (['ok'], True)
+
+    @pytest.mark.parametrize('patch, expected', [
+        ('', []),
+        ('@@ -0,0 +1,2 @@\n+a\n+b', [1, 2]),
+        ('@@ -10,4 +10,5 @@ def f():\n x\n-y\n+y2\n+y3\n z\n\\ No newline at end of file',
+         [11, 12]),
+        ('@@ -1 +1 @@\n-a\n+b\n@@ -20,2 +20,3 @@\n c\n+d\n e', [1, 21]),
+    ])
+    def test_added_lines(self, patch, expected):
+        assert _added_lines(patch) == expected
+
+    @pytest.mark.parametrize('github', [LARGE_PR], indirect=True)
+    def test_get_files_involved_in_large_pr(self, github):
+        pull_request = github.pull_request("octocat/hello-world", 1)
+        files = helpers.get_files_involved_in_pr("octocat/hello-world", 1, pull_request)
+        assert len(files) == 321
+        assert files["/pkg/module_319.py"] == [1, 2, 3, 4, 5, 6]
+        assert github.calls[("GET", "/repos/{repo}/pulls/{number}/files")] == 4
+        assert github.calls[("GET", "/repos/{repo}/pulls/{number}")] == 0
+
+        # Without the size of the PR, the diff is tried first
+        assert helpers.get_files_involved_in_pr("octocat/hello-world", 1) == files
+        assert github.calls[("GET", "/repos/{repo}/pulls/{number}")] == 1
+
+    @pytest.mark.parametrize('github', [LARGE_PR], indirect=True)
+    def test_check_pythonic_large_pr(self, github):
+        pull_request = github.pull_request("octocat/hello-world", 1)
+        assert helpers.check_pythonic_pr("octocat/hello-world", 1, pull_request)
+        # Stopped at the first page
+        assert github.calls[("GET", "/repos/{repo}/pulls/{number}/files")] == 1
+
+    def test_create_or_update_comment(self, github):
+        ghrequest = mock.MagicMock(repository="octocat/hello-world", pr_number=1)
+        patch = ("PATCH", "/repos/{repo}/issues/comments/{id}")
+        post = ("POST", "/repos/{repo}/issues/{number}/comments")
+
+        # Nothing to update yet
+        helpers.create_or_update_comment(ghrequest, "No issues {}", True)
+        assert github.total_calls == 1
+
+        helpers.create_or_update_comment(ghrequest, "Issues {}", False)
+        helpers.create_or_update_comment(ghrequest, "Issues {}", False)
+        assert (github.calls[post], github.calls[patch]) == (1, 0)
+
+        helpers.create_or_update_comment(ghrequest, "No issues {}", True)
+        helpers.create_or_update_comment(ghrequest, "No issues {}", True)
+        assert (github.calls[post], github.calls[patch]) == (1, 1)
+        [comment] = github.comments["/repos/octocat/hello-world/issues/1/comments"]
+        assert comment["body"].startswith("No issues {}\n\n<!-- pep8speaks fingerprint: ")
+        assert "Comment last updated on" in comment["body"]
+
+    def test_create_or_update_comment_new_commit(self, github):
+        """A push which reports the same issues does not update the comment"""
+        patch = ("PATCH", "/repos/{repo}/issues/comments/{id}")
+        comments = []
+        for sha in ("a" * 40, "b" * 40):
+            ghrequest = mock.MagicMock(repository="octocat/hello-world", pr_number=1,
+                                       after_commit_hash=sha, action="synchronize", author="octocat",
+                                       results={"a.py": ["Line 1:1: E265 block comment"]},
+                                       extra_results={"a.py": []}, skipped_files={}, truncated=False,
+                                       partial=False,
+                                       links={"a.py_link": "https://github.com/octocat/"
+                                                           "hello-world/blob/{}/a.py".format(sha)})
+            config = helpers.parse_config()
+            header, body, footer, _ = helpers.prepare_comment(ghrequest, config)
+            comments.append(header + body + footer)
+            helpers.create_or_update_comment(ghrequest, comments[-1], False)
+
+        assert comments[0] != comments[1]
+        assert github.calls[patch] == 0
+
+    @pytest.mark.parametrize('pycodestyle, expected', [
+        ({"ignore": [], "select": [], "max-line-length": 79}, "--max-line-length 79"),
+        ({"ignore": ["E501", "W291"], "select": ["E"], "max-line-length": 100},
+         "--ignore E501,W291 --select E --max-line-length 100"),
+    ])
+    def test_autopep8_arguments(self, pycodestyle, expected):
+        assert helpers.autopep8_arguments({"pycodestyle": pycodestyle}) == expected
+
+    @pytest.mark.parametrize('github', [MIXED_PR], indirect=True)
+    def test_autopep8_fixes_files_with_issues(self, github):
+        pull_request = github.pull_request("octocat/hello-world", 1)
+        ghrequest = mock.MagicMock(
+            repository="octocat/hello-world", pr_number=1, pull_request=pull_request,
+            sha=pull_request["head"]["sha"], after_commit_hash=pull_request["head"]["sha"],
+            diff_url=pull_request["diff_url"], results={}, extra_results={}, skipped_files={})
+        config = helpers.parse_config()
+        raw = ("GET", "/raw/{repo}/{ref}/{path}")
+
+        # Without a check of the commit, every file is fixed
+        ghrequest.diff = {}
+        helpers.autopep8(ghrequest, config)
+        assert sorted(ghrequest.diff) == ["pkg/clean.py"] + [
+            "pkg/module_{}.py".format(index) for index in range(3)]
+        assert ghrequest.diff["pkg/clean.py"] == ""
+
+        run_pycodestyle(ghrequest, config)
+        assert ghrequest.results["pkg/clean.py"] == []
+        github.calls.clear()
+        ghrequest.diff = {}
+        helpers.autopep8(ghrequest, config)
+        assert sorted(ghrequest.diff) == ["pkg/module_{}.py".format(index) for index in range(3)]
+        assert github.calls[raw] == 3
+
+        # Other arguments may find issues in other files
+        config = helpers.parse_config("pycodestyle:\n  max-line-length: 10")
+        ghrequest.diff = {}
+        helpers.autopep8(ghrequest, config)
+        assert len(ghrequest.diff) == 4
@@ -0,0 +1,125 @@
+import threading
+import psycopg2
+import pytest
+from pep8speaks import jobs
+from pep8speaks.jobs import DONE, FAILED, QUEUED, RUNNING, SQLiteQueue
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def queue(tmp_path, clock):
+    return SQLiteQueue(str(tmp_path / "jobs.db"), clock=clock)
+
+
+class TestJobQueue:
+    def test_enqueue_and_claim(self, queue):
+        first = queue.enqueue("pull_request", {"k1": "v1"}, "d1")
+        second = queue.enqueue("issue_comment", {"k2": "v2"}, "d2")
+        assert queue.enqueue("pull_request", {"k1": "v1"}, "d1") is None
+
+        # Comments go first
+        job = queue.claim("w1")
+        assert (job.id, job.event, job.payload, job.attempts) == (second, "issue_comment", {"k2": "v2"}, 1)
+        job = queue.claim("w1")
+        assert job.id == first
+        assert queue.claim("w1") is None
+        assert queue.counts() == {RUNNING: 2}
+
+    def test_concurrent_claims(self, tmp_path, clock):
+        for index in range(50):
+            SQLiteQueue(str(tmp_path / "jobs.db"), clock=clock).enqueue("pull_request", {"n": index})
+        claimed = []
+
+        def claim(worker):
+            queue = SQLiteQueue(str(tmp_path / "jobs.db"), clock=clock)
+            while True:
+                job = queue.claim(worker)
+                if job is None:
+                    return
+                claimed.append(job.payload["n"])
+
+        threads = [threading.Thread(target=claim, args=("w{}".format(i),)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(claimed) == list(range(50))
+
+    def test_retry_then_fail(self, queue, clock, monkeypatch):
+        monkeypatch.setattr(jobs, 'MAX_ATTEMPTS', 2)
+        queue.enqueue("pull_request", {})
+        job = queue.claim("w1")
+        assert queue.fail(job.id, "w1", job.attempts, "boom") == QUEUED
+        # Not due before the retry delay
+        assert queue.claim("w1") is None
+        clock.now += jobs.RETRY_DELAY
+        job = queue.claim("w1")
+        assert job.attempts == 2
+        assert queue.fail(job.id, "w1", job.attempts, "boom") == FAILED
+        assert queue.counts() == {FAILED: 1}
+
+    def test_heartbeat_and_reclaim(self, queue, clock):
+        queue.enqueue("pull_request", {})
+        job = queue.claim("w1")
+        clock.now += jobs.STALE_AFTER / 2
+        assert queue.heartbeat(job.id, "w1")
+        clock.now += jobs.STALE_AFTER / 2
+        assert queue.reclaim() == 0
+
+        # w1 stopped sending heartbeats, w2 takes the job over
+        clock.now += jobs.STALE_AFTER + 1
+        assert queue.reclaim() == 1
+        assert queue.claim("w2").id == job.id
+        assert not queue.heartbeat(job.id, "w1")
+
+
+class TestPostgresQueue:
+    def test_own_connection(self, mocker, clock):
+        shared = mocker.patch('pep8speaks.database.connection')
+        conn = mocker.patch('pep8speaks.database.connect').return_value
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.rowcount = 1
+        queue = jobs.PostgresQueue(clock=clock)
+
+        assert queue.heartbeat(1, "w1")
+        assert shared.call_count == 0
+        # The table and index, then the heartbeat
+        assert cursor.execute.call_count == 3
+        assert conn.commit.call_count == 3
+
+    def test_rollback(self, mocker, clock):
+        conn = mocker.patch('pep8speaks.database.connect').return_value
+        queue = jobs.PostgresQueue(clock=clock)
+        queue.heartbeat(1, "w1")
+        cursor = conn.cursor.return_value.__enter__.return_value
+        cursor.execute.side_effect = psycopg2.OperationalError
+
+        with pytest.raises(psycopg2.OperationalError):
+            queue.heartbeat(1, "w1")
+        assert conn.rollback.call_count == 1
+
+
+class TestWorker:
+    def test_work(self, queue, mocker):
+        handler = mocker.patch('pep8speaks.handlers.handle_pull_request')
+        mocker.patch('pep8speaks.handlers.handle_issue_comment', side_effect=ValueError("boom"))
+        queue.enqueue("pull_request", {"k1": "v1"})
+        queue.enqueue("issue_comment", {"k2": "v2"})
+
+        assert jobs.work(queue, worker="w1", drain=True) == 2
+        request = handler.call_args[0][0]
+        assert request.json == {"k1": "v1"}
+        assert request.headers["X-GitHub-Event"] == "pull_request"
+        assert queue.counts() == {DONE: 1, QUEUED: 1}
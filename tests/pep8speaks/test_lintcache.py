@@ -0,0 +1,28 @@
+from pep8speaks.lintcache import LintCache
+
+
+class TestLintCache:
+    def test_put_and_get(self):
+        cache = LintCache()
+        assert cache.get("o/r", "abc", " --ignore=E501") is None
+        cache.put("o/r", "abc", " --ignore=E501", {"a.py": True, "b.py": False})
+        assert cache.get("o/r", "abc", " --ignore=E501") == {"a.py": True, "b.py": False}
+        # Another commit, or other arguments, may not have the same issues
+        assert cache.get("o/r", "def", " --ignore=E501") is None
+        assert cache.get("o/r", "abc", " ") is None
+
+    def test_ttl(self):
+        now = [0]
+        cache = LintCache(ttl=60, clock=lambda: now[0])
+        cache.put("o/r", "abc", " ", {"a.py": True})
+        now[0] = 60
+        assert cache.get("o/r", "abc", " ") == {"a.py": True}
+        now[0] = 61
+        assert cache.get("o/r", "abc", " ") is None
+
+    def test_capacity(self):
+        cache = LintCache(capacity=2)
+        for sha in ("a", "b", "c"):
+            cache.put("o/r", sha, " ", {})
+        assert cache.get("o/r", "a", " ") is None
+        assert cache.get("o/r", "c", " ") == {}
@@ -0,0 +1,49 @@
+import pytest
+from pep8speaks import metrics
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(metrics, 'ENABLED', True)
+    metrics.reset()
+    yield
+    metrics.reset()
+
+
+class TestMetrics:
+    @pytest.mark.parametrize('url, expected', [
+        ('https://api.github.com/repos/o/r/pulls/12', '/repos/{repo}/pulls/{number}'),
+        ('https://api.github.com/repos/o/r/pulls/12/commits', '/repos/{repo}/pulls/{number}/commits'),
+        ('https://api.github.com/repos/o/r/issues/comments/99', '/repos/{repo}/issues/comments/{number}'),
+        ('https://api.github.com/repos/o/r/contents/a/b.py', '/repos/{repo}/contents/{path}'),
+        ('https://api.github.com/repos/o/r', '/repos/{repo}'),
+        ('https://api.github.com/user/following/octocat', '/user/following/{user}'),
+        ('https://api.github.com/gists', '/gists'),
+        ('https://github.com/o/r/pull/3.diff', '/{repo}/pull/{number}.diff'),
+        ('https://raw.githubusercontent.com/o/r/sha//a.py', 'raw/{repo}/{ref}/{path}'),
+    ])
+    def test_endpoint_template(self, url, expected):
+        assert metrics.endpoint_template(url) == expected
+
+    def test_disabled(self, monkeypatch):
+        monkeypatch.setattr(metrics, 'ENABLED', False)
+        metrics.reset()
+        with metrics.stage("pull_request", "get_config"):
+            pass
+        metrics.increment(metrics.GITHUB_REQUESTS)
+        assert metrics.render() == "\n"
+
+    def test_render(self, enabled):
+        metrics.observe(metrics.STAGE_DURATION, 0.2, handler="pull_request", stage="lint")
+        metrics.observe(metrics.STAGE_DURATION, 60, handler="pull_request", stage="lint")
+        metrics.record_request("GET", "https://api.github.com/repos/o/r/pulls/1", 200, 0.01)
+        text = metrics.render()
+
+        labels = 'handler="pull_request",stage="lint"'
+        assert "# TYPE pep8speaks_stage_duration_seconds histogram" in text
+        assert 'pep8speaks_stage_duration_seconds_bucket{%s,le="0.1"} 0' % labels in text
+        assert 'pep8speaks_stage_duration_seconds_bucket{%s,le="0.25"} 1' % labels in text
+        assert 'pep8speaks_stage_duration_seconds_bucket{%s,le="+Inf"} 2' % labels in text
+        assert 'pep8speaks_stage_duration_seconds_count{%s} 2' % labels in text
+        assert ('pep8speaks_github_requests_total{endpoint="/repos/{repo}/pulls/{number}",'
+                'method="GET",status="200"} 1') in text
@@ -1 +1,80 @@
-# TODO
+import json
+import mock
+import pytest
+import werkzeug
+from pep8speaks.models import GHRequest, WebhookRequest
+
+
+class TestGHRequest:
+    def test_summary(self):
+        request = mock.MagicMock(json={
+            'action': 'synchronize',
+            'pull_request': {
+                'head': {'sha': 'sha'}, 'user': {'login': 'octocat'},
+                'body': '', 'diff_url': '', 'title': '', 'number': 1,
+                'commits_url': '', 'base': {'ref': 'master'},
+            },
+            'repository': {'full_name': 'o/r'},
+        })
+        ghrequest = GHRequest(request, 'pull_request')
+        ghrequest.results = {'a.py': ['a.py:1:1: E225'], 'b.py': []}
+        ghrequest.comment_response = {'html_url': 'https://github.com/o/r/pull/1#c'}
+
+        summary = ghrequest.summary()
+        assert summary['repository'] == 'o/r'
+        assert summary['results'] == {'a.py': 1, 'b.py': 0}
+        assert summary['comment_url'] == 'https://github.com/o/r/pull/1#c'
+        assert 'request' not in summary
+
+    def test_summary_of_invalid_request(self):
+        request = mock.MagicMock(json={'action': 'closed'})
+        summary = GHRequest(request, 'pull_request').summary()
+        assert summary['OK'] is False
+        assert summary['repository'] is None
+
+    def test_fields_read_from_payload(self):
+        request = mock.MagicMock(json={
+            'action': 'created',
+            'issue': {'pull_request': {'url': 'https://api.github.com/repos/o/r/pulls/1'}},
+            'comment': {'user': {'login': 'reviewer'}, 'html_url': 'url', 'body': 'hi'},
+            'repository': {'full_name': 'o/r', 'default_branch': 'develop'},
+        })
+        pull_request = {'head': {'sha': 'sha'}, 'base': {'ref': 'master'}, 'number': 1}
+        with mock.patch('pep8speaks.utils.query_request') as query_request:
+            query_request.return_value.json.return_value = pull_request
+            ghrequest = GHRequest(request, 'issue_comment')
+
+        assert (ghrequest.sha, ghrequest.pr_number, ghrequest.reviewer) == ('sha', 1, 'reviewer')
+        # Commands use the config of the default branch
+        assert ghrequest.base_branch == 'develop'
+        assert not hasattr(ghrequest, '__dict__')
+
+    def test_fields_of_other_events(self):
+        request = mock.MagicMock(json={
+            'action': 'opened',
+            'pull_request': {'head': {'sha': 'sha'}, 'base': {'ref': 'master'}},
+            'repository': {'full_name': 'o/r'},
+        })
+        ghrequest = GHRequest(request, 'pull_request')
+        assert ghrequest.base_branch == 'master'
+        assert getattr(ghrequest, 'reviewer', None) is None
+
+
+class TestWebhookRequest:
+    def test_parsed_once(self):
+        request = WebhookRequest({'X-GitHub-Event': 'ping'}, b'{"zen": "Keep it simple"}')
+        with mock.patch('pep8speaks.utils.json_loads', wraps=json.loads) as loads:
+            assert request.json == {'zen': 'Keep it simple'}
+            assert request.get_json() is request.json
+        assert loads.call_count == 1
+
+    def test_empty_and_invalid(self):
+        assert WebhookRequest({}, b'').json is None
+        request = WebhookRequest({}, b'{"zen":')
+        assert request.get_json(silent=True) is None
+        with pytest.raises(werkzeug.exceptions.BadRequest):
+            request.json
+
+    def test_parsed_payload(self):
+        payload = {'action': 'opened'}
+        assert WebhookRequest({}, json=payload).json is payload
@@ -0,0 +1,94 @@
+import mock
+import pytest
+from pep8speaks import deadlines, ratelimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def make_response(remaining, limit=100, reset=2000, status_code=200, retry_after=None):
+    headers = {
+        "X-RateLimit-Limit": str(limit),
+        "X-RateLimit-Remaining": str(remaining),
+        "X-RateLimit-Reset": str(reset),
+    }
+    if retry_after is not None:
+        headers["Retry-After"] = str(retry_after)
+    return mock.MagicMock(headers=headers, status_code=status_code)
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def limiter(clock):
+    return ratelimit.RateLimiter(reserve=0.1, slowdown=0.2, max_wait=30,
+                                 clock=clock.time, sleep=clock.sleep)
+
+
+class TestRateLimiter:
+    def test_unknown_budget_does_not_wait(self, limiter, clock):
+        limiter.acquire(ratelimit.ESSENTIAL)
+        limiter.acquire(ratelimit.BACKGROUND)
+        assert clock.slept == []
+
+    def test_plenty_of_budget_does_not_wait(self, limiter, clock):
+        limiter.update(make_response(remaining=90))
+        limiter.acquire(ratelimit.BACKGROUND)
+        assert clock.slept == []
+
+    def test_low_budget_paces_essential_calls(self, limiter, clock):
+        # 10 calls left for the 1000 seconds until the reset
+        limiter.update(make_response(remaining=10))
+        limiter.acquire(ratelimit.ESSENTIAL)
+        limiter.acquire(ratelimit.ESSENTIAL)
+        assert clock.slept == [pytest.approx(30)]
+
+    def test_reserve_skips_background_calls(self, limiter, clock):
+        limiter.update(make_response(remaining=10))
+        with pytest.raises(ratelimit.RateLimitExceeded):
+            limiter.acquire(ratelimit.BACKGROUND)
+
+    def test_exhausted_budget_waits_at_most_max_wait(self, limiter, clock):
+        limiter.update(make_response(remaining=0, reset=1010))
+        limiter.acquire(ratelimit.ESSENTIAL)
+        assert clock.slept == [10]
+
+    def test_wait_past_deadline(self, limiter, clock):
+        limiter.update(make_response(remaining=0, reset=1010))
+        # 10 seconds to wait, the deadline leaves 8 before the time kept for the comment
+        with deadlines.deadline(8 + deadlines.COMMENT_RESERVE, clock=clock.time):
+            with pytest.raises(deadlines.DeadlineExceeded):
+                limiter.acquire(ratelimit.ESSENTIAL)
+        assert clock.slept == []
+
+        # In the time kept for the comment, the wait only has to end before the deadline
+        limiter.update(make_response(remaining=0, reset=1002))
+        with deadlines.deadline(deadlines.COMMENT_RESERVE, clock=clock.time):
+            limiter.acquire(ratelimit.ESSENTIAL)
+        assert clock.slept == [2]
+
+    def test_new_window_forgets_the_budget(self, limiter, clock):
+        limiter.update(make_response(remaining=0, reset=1010))
+        clock.now = 1011
+        limiter.acquire(ratelimit.BACKGROUND)
+        assert clock.slept == []
+
+    def test_retry_after(self, limiter, clock):
+        response = make_response(remaining=50, status_code=403, retry_after=5)
+        assert limiter.update(response) == 5
+        limiter.acquire(ratelimit.ESSENTIAL)
+        assert clock.slept == [5]
+        assert limiter.update(make_response(remaining=50, retry_after=5)) is None
@@ -0,0 +1,193 @@
+import threading
+import time
+import pytest
+from pep8speaks import metrics
+from pep8speaks.scheduler import Lane, LaneFull, parse_weights, tenant_of
+
+
+class TestLane:
+    def test_run(self):
+        lane = Lane("test", workers=1, max_queue=1, target=1)
+        assert lane.run(lambda x, y=0: x + y, 1, y=2) == 3
+
+    def test_submit(self):
+        lane = Lane("test", workers=1, max_queue=2, target=1)
+        release = threading.Event()
+        first = lane.submit(release.wait, 5)
+        second = lane.submit(threading.get_ident)
+        assert lane.running == 1 and lane.waiting == 1
+        assert not lane.join(0.01)
+
+        release.set()
+        assert lane.join(5)
+        assert first.result() is True
+        assert second.result() != threading.get_ident()
+
+    def test_submit_failure(self):
+        lane = Lane("test", workers=1, max_queue=1, target=1)
+        with pytest.raises(ZeroDivisionError):
+            lane.run(lambda: 1 / 0)
+        assert lane.join(5)
+
+    def test_bounded_workers(self):
+        lane = Lane("test", workers=2, max_queue=10, target=1)
+        running, most = [0], [0]
+        lock = threading.Lock()
+
+        def work():
+            with lock:
+                running[0] += 1
+                most[0] = max(most[0], running[0])
+            threading.Event().wait(0.02)
+            with lock:
+                running[0] -= 1
+
+        threads = [threading.Thread(target=lane.run, args=(work,)) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert most[0] == 2
+
+    def test_full(self):
+        lane = Lane("test", workers=1, max_queue=1, target=1)
+        started, release = threading.Event(), threading.Event()
+
+        def work():
+            started.set()
+            release.wait(5)
+
+        first = threading.Thread(target=lane.run, args=(work,))
+        first.start()
+        started.wait(5)
+        second = threading.Thread(target=lane.run, args=(lambda: None,))
+        second.start()
+        assert _wait_until(lambda: lane.waiting == 1)
+
+        with pytest.raises(LaneFull):
+            lane.run(lambda: None)
+        release.set()
+        first.join()
+        second.join()
+        assert lane.waiting == 0
+
+    def test_metrics(self, monkeypatch):
+        monkeypatch.setattr(metrics, 'ENABLED', True)
+        metrics.reset()
+        times = iter([0.0, 1.0, 3.0])
+        lane = Lane("test", workers=1, max_queue=1, target=2, clock=lambda: next(times))
+        lane.run(lambda: None)
+
+        output = metrics.render()
+        assert 'pep8speaks_lane_queue_wait_seconds_sum{lane="test"} 1.0' in output
+        assert 'pep8speaks_lane_service_seconds_sum{lane="test"} 2.0' in output
+        assert 'pep8speaks_lane_target_missed_total{lane="test"} 1' in output
+        metrics.reset()
+
+
+def _wait_until(predicate, timeout=5):
+    """Poll predicate until it is true, return False after timeout seconds"""
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        threading.Event().wait(0.001)
+    return True
+
+
+def _queue_in_order(lane, calls):
+    """Start a thread per (tenant, repo), each one waiting before the next starts"""
+    order, threads = [], []
+    for tenant, repo in calls:
+        waiting = lane.waiting
+        thread = threading.Thread(target=lane.run, args=(order.append, (tenant, repo)),
+                                  kwargs={"tenant": tenant, "repo": repo})
+        thread.start()
+        assert _wait_until(lambda: lane.waiting > waiting)
+        threads.append(thread)
+    return order, threads
+
+
+class TestFairness:
+    def _block(self, lane, tenant="blocker", repo=None):
+        started, release = threading.Event(), threading.Event()
+
+        def work():
+            started.set()
+            release.wait(5)
+
+        thread = threading.Thread(target=lane.run, args=(work,),
+                                  kwargs={"tenant": tenant, "repo": repo})
+        thread.start()
+        started.wait(5)
+        return release, thread
+
+    def test_burst_does_not_starve_others(self):
+        lane = Lane("test", workers=1, max_queue=10, target=1)
+        release, blocker = self._block(lane, tenant="a")
+        order, threads = _queue_in_order(lane, [("a", "a/1")] * 4 + [("b", "b/1")])
+        release.set()
+        for thread in [blocker] + threads:
+            thread.join()
+        assert order[0] == ("b", "b/1")
+
+    def test_weights(self):
+        lane = Lane("test", workers=1, max_queue=10, target=1, weights={"a": 2})
+        release, blocker = self._block(lane)
+        order, threads = _queue_in_order(lane, [("a", "a/1"), ("b", "b/1")] * 4)
+        release.set()
+        for thread in [blocker] + threads:
+            thread.join()
+        assert [tenant for tenant, _ in order[:6]].count("a") == 4
+
+    def test_repo_cap(self):
+        lane = Lane("test", workers=2, max_queue=10, target=1, repo_cap=1)
+        release, blocker = self._block(lane, tenant="a", repo="a/1")
+        order, threads = _queue_in_order(lane, [("a", "a/1")])
+
+        # A slot is free, but not for a/1
+        assert lane.run(lambda: "done", tenant="a", repo="a/2") == "done"
+        assert order == []
+        release.set()
+        for thread in [blocker] + threads:
+            thread.join()
+        assert order == [("a", "a/1")]
+        assert lane.join(5)
+
+    def test_tenant_cap(self):
+        lane = Lane("test", workers=2, max_queue=10, target=1, tenant_cap=1)
+        release, blocker = self._block(lane, tenant="a", repo="a/1")
+        order, threads = _queue_in_order(lane, [("a", "a/2")])
+
+        assert lane.run(lambda: "done", tenant="b", repo="b/1") == "done"
+        assert order == []
+        release.set()
+        for thread in [blocker] + threads:
+            thread.join()
+        assert order == [("a", "a/2")]
+
+    def test_tenant_metrics(self, monkeypatch):
+        monkeypatch.setattr(metrics, 'ENABLED', True)
+        metrics.reset()
+        times = iter([0.0, 1.5, 2.0])
+        lane = Lane("test", workers=1, max_queue=1, target=2, clock=lambda: next(times))
+        lane.run(lambda: None, tenant="42", repo="a/1")
+
+        output = metrics.render()
+        assert 'pep8speaks_tenant_queue_wait_seconds_sum{lane="test",tenant="42"} 1.5' in output
+        metrics.reset()
+
+
+@pytest.mark.parametrize("payload, expected", [
+    ({"installation": {"id": 42}, "repository": {"full_name": "a/b"}}, ("42", "a/b")),
+    ({"repository": {"full_name": "a/b"}}, ("a", "a/b")),
+    ({}, (None, None)),
+    (None, (None, None)),
+])
+def test_tenant_of(payload, expected):
+    assert tenant_of(payload) == expected
+
+
+def test_parse_weights():
+    assert parse_weights("42:3, org:0.5") == {"42": 3.0, "org": 0.5}
+    assert parse_weights(None) == {}
@@ -2,7 +2,10 @@ import hmac
 import pytest
 import werkzeug
 import mock
-from pep8speaks.utils import update_dict, match_webhook_secret, query_request
+from pep8speaks import ratelimit
+from pep8speaks.models import WebhookRequest
+from pep8speaks.utils import (update_dict, json_loads, match_webhook_secret, query_request,
+                              filename_match)
 from pep8speaks.constants import BASE_URL
 
 
@@ -12,7 +15,7 @@ class TestUtils:
         ('http://someurl.com', 'GET', None, '', 'h1=v1', 'k1=v1'),
     ])
     def test_request(self, mocker, query, method, json, data, headers, params):
-        mock_func = mock.MagicMock(return_value=True)
+        mock_func = mock.MagicMock(return_value=mock.MagicMock(status_code=200, headers={}))
         mocker.patch('requests.request', mock_func)
         query_request(query, method, json=json, data=data,
                       headers=headers, params=params)
@@ -27,6 +30,23 @@ class TestUtils:
         else:
             assert mock_func.call_args[0][1] == query
 
+    def test_request_retry_after(self, mocker):
+        limiter = ratelimit.RateLimiter(sleep=mock.MagicMock())
+        mocker.patch('pep8speaks.ratelimit.limiter', limiter)
+        limited = mock.MagicMock(status_code=403, headers={'Retry-After': '3'})
+        ok = mock.MagicMock(status_code=200, headers={})
+        mock_func = mock.MagicMock(side_effect=[limited, ok])
+        mocker.patch('requests.request', mock_func)
+
+        assert query_request('/someurl') is ok
+        assert mock_func.call_count == 2
+        limiter.sleep.assert_called_once()
+
+        # Calls outside of the API do not go through the limiter
+        mock_func = mock.MagicMock(side_effect=[limited])
+        mocker.patch('requests.request', mock_func)
+        assert query_request('http://someurl.com') is limited
+
     @pytest.mark.parametrize('base, head, expected', [
         ({}, {}, {}),
         ({}, {"k1": "v1"}, {}),
@@ -84,3 +104,50 @@ class TestUtils:
 
         monkeypatch.setenv('GITHUB_PAYLOAD_SECRET', key)
         assert match_webhook_secret(request_ctx) is True
+
+    def test_match_webhook_secret_sha256(self, monkeypatch):
+        monkeypatch.setenv('OVER_HEROKU', '1')
+        monkeypatch.setenv('GITHUB_PAYLOAD_SECRET', 'testkey')
+        data = b'{"action": "opened"}'
+        sha256 = hmac.new(b'testkey', data, digestmod="sha256").hexdigest()
+
+        # SHA-256 is checked when both signatures are sent
+        request = WebhookRequest({'X-Hub-Signature-256': 'sha256=' + sha256,
+                                  'X-Hub-Signature': 'sha1=wrong'}, data)
+        assert match_webhook_secret(request) is True
+
+        request = WebhookRequest({'X-Hub-Signature-256': 'sha256=' + sha256}, data + b' ')
+        with pytest.raises(werkzeug.exceptions.Forbidden):
+            match_webhook_secret(request)
+
+        request = WebhookRequest({'X-Hub-Signature-256': 'md5=' + sha256}, data)
+        with pytest.raises(werkzeug.exceptions.NotImplemented):
+            match_webhook_secret(request)
+
+    @pytest.mark.parametrize('data', [b'{"k1": ["v1", 2]}', '{"k1": ["v1", 2]}'])
+    def test_json_loads(self, data):
+        assert json_loads(data) == {"k1": ["v1", 2]}
+        with pytest.raises(ValueError):
+            json_loads(data[:-1])
+
+    @pytest.mark.parametrize('filename, patterns, expected', [
+        ('/a/b.py', [], False),
+        ('/a/b.py', ['a/'], True),
+        ('/a/b.py', ['a/*'], True),
+        ('/a/b.py', ['*.py'], True),
+        ('/a/b.py', ['b.py'], True),
+        ('/a/b.py', ['a'], True),
+        ('/a/b.py', ['b'], False),
+        ('/a/b.py', ['c/', 'd', 'e/*.py'], False),
+        ('/a/b/c.py', ['b/'], False),
+        ('/a/b/c.py', ['b'], True),
+        ('/a/b/c.py', ['a/*/c.py'], True),
+        ('/a/b/c.py', ['a/?/c.py'], True),
+        ('/a/b/c.py', ['[ab]/b/c.py'], True),
+        ('/a/b/c.py', ['*/c.py', 'x'], True),
+    ])
+    def test_filename_match(self, filename, patterns, expected):
+        original = list(patterns)
+        assert filename_match(filename, patterns) is expected
+        # The patterns of the caller are left untouched
+        assert patterns == original